@@ -0,0 +1,260 @@
+"""
+Vectorized gradient-descent sweeps for the chapter 3 optimization figures.
+
+`sweep` runs plain gradient descent, momentum or Adam for a whole grid of
+learning rates x initial points at once: the only Python loop is over steps,
+every update is one NumPy operation across all configurations. Trajectories
+come back as arrays of shape (configs, steps + 1) for 1-D losses and
+(configs, steps + 1, 2) for 2-D losses.
+
+Losses are plain vectorized functions of the coordinates, f(x) or f(x, y),
+with an optional analytic gradient; without one, central finite differences
+are used. `build_sweep_figure` turns a sweep into one Plotly animation with a
+marker per configuration, colored by learning rate.
+
+Usage:
+  python gd_sweep.py --loss bowl --optimizer momentum --steps 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import plotly.graph_objects as go
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from plotly_export import write_compact_html  # noqa: E402
+
+# Declared for book/build_assets.py (paths relative to this file)
+ASSET_OUTPUTS = ["gd_sweep.html"]
+
+
+@dataclass
+class Loss:
+    """A 1-D loss f(x) or 2-D loss f(x, y), vectorized over NumPy arrays."""
+
+    name: str
+    fn: Callable
+    dim: int
+    grad: Optional[Callable] = None  # returns the partial derivatives as a tuple
+    x_range: tuple = (-5.0, 5.0)
+    y_range: tuple = (-5.0, 5.0)
+
+    def __call__(self, *coords):
+        return self.fn(*coords)
+
+    def gradient(self, *coords, h: float = 1e-5):
+        if self.grad is not None:
+            return tuple(np.broadcast_to(g, np.shape(coords[0])) for g in self.grad(*coords))
+        # Central finite differences, one pair of evaluations per dimension
+        partials = []
+        for i in range(self.dim):
+            plus = [c + h if j == i else c for j, c in enumerate(coords)]
+            minus = [c - h if j == i else c for j, c in enumerate(coords)]
+            partials.append((self.fn(*plus) - self.fn(*minus)) / (2 * h))
+        return tuple(partials)
+
+
+LOSSES = {
+    "quadratic": Loss("y = x^2", lambda x: x**2, 1, grad=lambda x: (2 * x,), x_range=(-5, 5)),
+    "double_well": Loss("y = x^4 - 3x^2 + x", lambda x: x**4 - 3 * x**2 + x, 1,
+                        grad=lambda x: (4 * x**3 - 6 * x + 1,), x_range=(-2.5, 2.5)),
+    "bowl": Loss("z = x^2 + 10y^2", lambda x, y: x**2 + 10 * y**2, 2,
+                 grad=lambda x, y: (2 * x, 20 * y), x_range=(-5, 5), y_range=(-2, 2)),
+    "rosenbrock": Loss("Rosenbrock", lambda x, y: (1 - x)**2 + 100 * (y - x**2)**2, 2,
+                       x_range=(-2, 2), y_range=(-1, 3)),
+}
+
+
+@dataclass
+class SweepResult:
+    optimizer: str
+    learning_rates: np.ndarray   # (configs,)
+    initial_points: np.ndarray   # (configs,) or (configs, 2)
+    path: np.ndarray             # (configs, steps + 1) or (configs, steps + 1, 2)
+    losses: np.ndarray           # (configs, steps + 1)
+
+
+def sweep(
+    loss: Loss,
+    learning_rates,
+    initial_points,
+    num_steps: int = 30,
+    optimizer: str = "gd",
+    momentum: float = 0.9,
+    betas: tuple = (0.9, 0.999),
+    eps: float = 1e-8,
+) -> SweepResult:
+    """Run one optimizer for every (learning rate, initial point) pair of the grid.
+
+    initial_points is a list of x values for a 1-D loss or of (x, y) pairs for
+    a 2-D loss. Configurations are ordered learning-rate-major.
+    """
+    lrs = np.asarray(learning_rates, dtype=float).ravel()
+    points = np.asarray(initial_points, dtype=float).reshape(-1, loss.dim)
+    lr = np.repeat(lrs, len(points))[:, None]              # (C, 1)
+    x = np.tile(points, (len(lrs), 1))                     # (C, D)
+
+    path = np.empty((len(x), num_steps + 1, loss.dim))
+    path[:, 0] = x
+    velocity = np.zeros_like(x)
+    second = np.zeros_like(x)
+    with np.errstate(over="ignore", invalid="ignore"):
+        for t in range(1, num_steps + 1):
+            g = np.stack(loss.gradient(*x.T), axis=-1)
+            if optimizer == "gd":
+                x = x - lr * g
+            elif optimizer == "momentum":
+                velocity = momentum * velocity - lr * g
+                x = x + velocity
+            elif optimizer == "adam":
+                beta1, beta2 = betas
+                velocity = beta1 * velocity + (1 - beta1) * g
+                second = beta2 * second + (1 - beta2) * g**2
+                m_hat = velocity / (1 - beta1**t)
+                v_hat = second / (1 - beta2**t)
+                x = x - lr * m_hat / (np.sqrt(v_hat) + eps)
+            else:
+                raise ValueError(f"Unknown optimizer: {optimizer!r}")
+            path[:, t] = x
+        losses = loss(*np.moveaxis(path, -1, 0))
+
+    if loss.dim == 1:
+        return SweepResult(optimizer, lr[:, 0], path[:, 0, 0], path[..., 0], losses)
+    return SweepResult(optimizer, lr[:, 0], path[:, 0], path, losses)
+
+
+def build_sweep_figure(loss: Loss, result: SweepResult, max_configs: int = 2000, frame_duration: int = 150) -> go.Figure:
+    """One animation for the whole sweep: the loss stays static, one marker per configuration moves."""
+    configs = np.arange(len(result.learning_rates))
+    if len(configs) > max_configs:
+        configs = np.linspace(0, len(configs) - 1, max_configs).astype(int)
+    path = result.path[configs]
+    losses = result.losses[configs]
+    lrs = result.learning_rates[configs]
+    x0 = result.initial_points[configs]
+    num_steps = path.shape[1] - 1
+
+    # Diverged runs leave the plot instead of stretching the axes (or overflowing float32)
+    def visible(values):
+        return np.where(np.abs(values) < 1e6, values, np.nan)
+
+    marker = dict(
+        size=8,
+        color=np.log10(lrs),
+        colorscale="Viridis",
+        showscale=True,
+        colorbar=dict(title="log10(学习率)"),
+    )
+    if loss.dim == 1:
+        x_domain = np.linspace(*loss.x_range, 400)
+        y_top = float(np.max(loss(np.array(loss.x_range))))
+        background = go.Scatter(x=x_domain, y=loss(x_domain), mode="lines", name=loss.name,
+                                line=dict(color="#1f77b4", width=2))
+        customdata = np.stack([lrs, x0], axis=-1)
+        hover = "学习率=%{customdata[0]:.3g}<br>初始点=%{customdata[1]:.3g}<br>x=%{x:.3f}<extra></extra>"
+
+        def points(step):
+            return dict(x=visible(path[:, step]), y=visible(losses[:, step]))
+    else:
+        gx = np.linspace(*loss.x_range, 120)
+        gy = np.linspace(*loss.y_range, 120)
+        z = loss(*np.meshgrid(gx, gy))
+        background = go.Contour(x=gx, y=gy, z=np.log1p(z), colorscale="Greys", showscale=False,
+                                contours=dict(coloring="lines"), name=loss.name)
+        customdata = np.column_stack([lrs, x0])
+        hover = ("学习率=%{customdata[0]:.3g}<br>初始点=(%{customdata[1]:.2f}, %{customdata[2]:.2f})"
+                 "<br>(%{x:.3f}, %{y:.3f})<extra></extra>")
+
+        def points(step):
+            return dict(x=visible(path[:, step, 0]), y=visible(path[:, step, 1]))
+
+    markers = go.Scatter(mode="markers", marker=marker, customdata=customdata, hovertemplate=hover,
+                         name="配置", showlegend=False, **points(0))
+
+    title = f"{result.optimizer} 参数扫描：{loss.name}，{len(configs)} 组配置"
+    frames = [
+        go.Frame(
+            data=[go.Scatter(**points(step))],
+            traces=[1],
+            name=f"step_{step}",
+            layout=go.Layout(title=dict(text=f"{title}（步数={step}/{num_steps}）", x=0.5)),
+        )
+        for step in range(1, num_steps + 1)
+    ]
+
+    fig = go.Figure(data=[background, markers], frames=frames)
+    fig.update_layout(
+        title=dict(text=title, x=0.5),
+        xaxis_title="x",
+        yaxis_title="损失" if loss.dim == 1 else "y",
+        width=850,
+        height=550,
+        template="plotly_white",
+        updatemenus=[
+            dict(
+                type="buttons",
+                showactive=False,
+                x=0.05,
+                y=1.12,
+                xanchor="left",
+                buttons=[
+                    dict(
+                        label="播放",
+                        method="animate",
+                        args=[None, {"frame": {"duration": frame_duration, "redraw": False}, "fromcurrent": True, "mode": "immediate"}],
+                    ),
+                    dict(
+                        label="暂停",
+                        method="animate",
+                        args=[[None], {"frame": {"duration": 0, "redraw": False}, "mode": "immediate"}],
+                    ),
+                ],
+            )
+        ],
+    )
+    fig.update_xaxes(range=list(loss.x_range))
+    if loss.dim == 1:
+        fig.update_yaxes(range=[float(np.min(loss(x_domain))) - 0.5, y_top])
+    else:
+        fig.update_yaxes(range=list(loss.y_range))
+    return fig
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep learning rates and initial points and animate all runs")
+    parser.add_argument("--loss", choices=sorted(LOSSES), default="quadratic")
+    parser.add_argument("--optimizer", choices=["gd", "momentum", "adam"], default="gd")
+    parser.add_argument("--lrs", type=float, nargs="+", default=None,
+                        help="Learning rates (default: 12 values log-spaced over 0.01..0.95)")
+    parser.add_argument("--starts", type=float, nargs="+", default=None,
+                        help="Initial points: x values for 1-D losses, x y pairs for 2-D losses")
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--output", default="gd_sweep.html")
+    args = parser.parse_args()
+
+    loss = LOSSES[args.loss]
+    lrs = args.lrs or np.geomspace(0.01, 0.95, 12)
+    if args.starts:
+        starts = np.reshape(args.starts, (-1, loss.dim))
+    elif loss.dim == 1:
+        starts = np.linspace(loss.x_range[0] * 0.8, loss.x_range[1] * 0.8, 5)
+    else:
+        starts = np.array([[loss.x_range[0] * 0.8, loss.y_range[1] * 0.8],
+                           [loss.x_range[1] * 0.8, loss.y_range[0] * 0.8]])
+    result = sweep(loss, lrs, starts, num_steps=args.steps, optimizer=args.optimizer)
+    fig = build_sweep_figure(loss, result)
+    size = write_compact_html(fig, args.output, include_plotlyjs="cdn", full_html=True)
+    print(f"Saved: {Path(args.output).resolve()} ({len(result.learning_rates)} configs, {size / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    # Ensure working directory does not affect output path
+    os.chdir(Path(__file__).parent)
+    main()
@@ -1,6 +1,10 @@
 import numpy as np
 import os
 
+# 供 book/build_assets.py 使用的声明（路径相对于本文件）
+ASSET_INPUTS = ["../ch09/glove.6B.50d.txt"]
+ASSET_OUTPUTS = ["../ch09/glove_subset.txt"]
+
 def create_glove_subset():
     """
     从完整的GloVe词向量文件中，提取一个小的子集，用于教学演示。
@@ -1,10 +1,20 @@
+import sys
+from pathlib import Path
+
 import plotly.graph_objects as go
 import numpy as np
-from scipy.signal import convolve2d
 from skimage import data
 from skimage.color import rgb2gray
 import plotly.io as pio
 
+from cnn_ops import conv2d_bank, pool2d
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from plotly_export import write_compact_html  # noqa: E402
+
+# Declared for book/build_assets.py (paths relative to this file)
+ASSET_OUTPUTS = ["convolution_animation.html", "maxpooling_animation.html"]
+
 pio.renderers.default = "notebook"
 
 def create_convolution_animation():
@@ -30,9 +40,11 @@ def create_convolution_animation():
     # Create initial traces for image and feature map
     fig.add_trace(go.Heatmap(z=image, colorscale='gray', showscale=False, name='Input Image'))
     
+    # Apply the whole kernel bank in one pass (same result as convolve2d per kernel)
+    feature_maps = conv2d_bank(image, kernels, mode='same', boundary='symm')
+
     # Add traces for each kernel's feature map, initially invisible
-    for name, kernel in kernels.items():
-        feature_map = convolve2d(image, kernel, mode='same', boundary='symm')
+    for name, feature_map in zip(kernels, feature_maps):
         fig.add_trace(go.Heatmap(z=feature_map, colorscale='gray', showscale=False, visible=False, name=name))
         
     # Create buttons to switch between kernels
@@ -82,27 +94,36 @@ def create_convolution_animation():
     fig.data[1].visible = True
     fig.update_layout(title_text="Feature Map (Kernel: Identity)")
 
-    fig.write_html("book/assets/ch11/convolution_animation.html", include_plotlyjs='cdn')
+    # Image and feature maps go out as uint8 / float32 typed arrays instead of JSON text
+    write_compact_html(fig, "book/assets/ch11/convolution_animation.html", include_plotlyjs='cdn')
     print("Convolution animation saved to book/assets/ch11/convolution_animation.html")
 
 
-def create_maxpooling_animation():
+def create_maxpooling_animation(z=None, kernel_size=2, stride=2, padding=0, max_frames=64):
     """
     Creates an interactive animation to demonstrate the max pooling operation.
+    The pooled map, the window sequence and the argmax highlights are all computed
+    from the input, so any map size, kernel, stride and padding works. Large maps
+    are animated over an evenly spaced subset of at most `max_frames` windows.
     Saves the animation as an HTML file.
     """
-    # Create a sample 4x4 feature map
-    z = np.array([
-        [5, 8, 1, 3],
-        [6, 2, 7, 4],
-        [9, 5, 3, 2],
-        [4, 6, 8, 1]
-    ])
-    
-    pooled_z = np.array([
-        [8, 7],
-        [9, 8]
-    ])
+    # Default to a small 4x4 feature map that is easy to follow by eye
+    if z is None:
+        z = np.array([
+            [5, 8, 1, 3],
+            [6, 2, 7, 4],
+            [9, 5, 3, 2],
+            [4, 6, 8, 1]
+        ])
+    z = np.asarray(z)
+    pooled_z, (argmax_rows, argmax_cols) = pool2d(z, kernel_size, stride, padding, mode='max')
+    kh, kw = (kernel_size, kernel_size) if np.isscalar(kernel_size) else kernel_size
+    sh, sw = (stride, stride) if np.isscalar(stride) else stride
+    ph, pw = (padding, padding) if np.isscalar(padding) else padding
+
+    # Cell values are only readable on small maps
+    show_text = max(z.shape) <= 16
+    text_options = dict(texttemplate="%{text}") if show_text else {}
 
     fig = go.Figure()
 
@@ -111,9 +132,9 @@ def create_maxpooling_animation():
         z=z,
         colorscale='Viridis',
         showscale=False,
-        text=z,
-        texttemplate="%{text}",
-        name='Input Feature Map'
+        text=z if show_text else None,
+        name='Input Feature Map',
+        **text_options
     ))
 
     # Pooled feature map
@@ -121,31 +142,38 @@ def create_maxpooling_animation():
         z=pooled_z,
         colorscale='Viridis',
         showscale=False,
-        text=pooled_z,
-        texttemplate="%{text}",
+        text=pooled_z if show_text else None,
         xaxis='x2',
         yaxis='y2',
-        name='Pooled Map'
+        name='Pooled Map',
+        **text_options
     ))
-    
-    # Create frames for animation
+
+    # One frame per output cell in raster order (subsampled for large maps)
+    n_windows = pooled_z.size
+    selected = np.unique(np.linspace(0, n_windows - 1, min(n_windows, max_frames)).astype(int))
+    out_rows, out_cols = np.unravel_index(selected, pooled_z.shape)
     frames = []
-    steps = [
-        (0, 0, 0, 0, 8), (0, 2, 0, 1, 7),
-        (2, 0, 1, 0, 9), (2, 2, 1, 1, 8)
-    ]
-    for i, (r_start, c_start, pr, pc, val) in enumerate(steps):
+    for i, (pr, pc) in enumerate(zip(out_rows, out_cols)):
+        r_start, c_start = pr * sh - ph, pc * sw - pw
         frame = go.Frame(
             name=f"frame{i}",
             layout=go.Layout(
                 shapes=[
-                    # Highlight rectangle on input map
+                    # Highlight the pooling window on the input map
                     go.layout.Shape(
                         type="rect",
                         x0=c_start - 0.5, y0=r_start - 0.5,
-                        x1=c_start + 1.5, y1=r_start + 1.5,
+                        x1=c_start + kw - 0.5, y1=r_start + kh - 0.5,
                         line=dict(color="red", width=4)
                     ),
+                    # Mark the maximum inside the window
+                    go.layout.Shape(
+                        type="rect",
+                        x0=argmax_cols[pr, pc] - 0.5, y0=argmax_rows[pr, pc] - 0.5,
+                        x1=argmax_cols[pr, pc] + 0.5, y1=argmax_rows[pr, pc] + 0.5,
+                        line=dict(color="lime", width=3)
+                    ),
                     # Highlight cell on pooled map
                     go.layout.Shape(
                         type="rect",
@@ -164,8 +192,9 @@ def create_maxpooling_animation():
     # Create slider
     sliders = [dict(
         steps=[
-            dict(method='animate', args=[[f'frame{i}'], dict(mode='immediate', frame=dict(duration=500, redraw=True), transition=dict(duration=0))]),
-        ] * len(steps),
+            dict(method='animate', args=[[f'frame{i}'], dict(mode='immediate', frame=dict(duration=500, redraw=True), transition=dict(duration=0))])
+            for i in range(len(frames))
+        ],
         transition=dict(duration=0),
         x=0.1,
         xanchor="left",
@@ -188,7 +217,7 @@ def create_maxpooling_animation():
     )]
     
     fig.update_layout(
-        title="Max Pooling (2x2 Pool with Stride 2)",
+        title=f"Max Pooling ({kh}x{kw} Pool with Stride {sh if sh == sw else (sh, sw)})",
         xaxis=dict(title="Input Feature Map", domain=[0, 0.6]),
         yaxis=dict(autorange='reversed'),
         xaxis2=dict(title="Pooled Map", domain=[0.7, 1.0]),
@@ -200,7 +229,7 @@ def create_maxpooling_animation():
     # Set initial state with the first highlight
     fig.update_layout(shapes=fig.frames[0].layout.shapes)
 
-    fig.write_html("book/assets/ch11/maxpooling_animation.html", include_plotlyjs='cdn')
+    write_compact_html(fig, "book/assets/ch11/maxpooling_animation.html", include_plotlyjs='cdn')
     print("Max pooling animation saved to book/assets/ch11/maxpooling_animation.html")
 
 if __name__ == '__main__':
@@ -0,0 +1,251 @@
+"""
+Kernel-bank 2-D convolution for the chapter 11 figures.
+
+`scipy.signal.convolve2d` convolves one image with one kernel per call, so a
+gallery of K kernels over N images costs N * K Python-level calls. `conv2d_bank`
+applies a whole bank of equally sized kernels to a batch of images in one pass:
+
+- "im2col": a strided sliding-window view of the padded images is multiplied by
+  the flattened kernel bank in a single matmul. Best for small kernels.
+- "fft": every image and kernel is transformed once and the bank is applied as
+  a broadcasted product in the frequency domain. Best for large kernels.
+
+Results match `convolve2d(image, kernel, mode=..., boundary=...)` for each
+image/kernel pair, with the same boundary handling and "same" alignment. The
+one exception is "valid" mode with a kernel larger than the images: convolve2d
+then swaps its two inputs, which has no meaning for a whole bank, so
+`conv2d_bank` raises a ValueError instead.
+
+`pool2d` computes max / average pooling for any window, stride and padding from
+the same kind of strided view, and returns the argmax positions that the
+max-pooling animation highlights.
+
+Run `python book/assets/ch11/cnn_ops.py` for a benchmark against convolve2d.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import fft as sp_fft
+
+_BOUNDARY_TO_PAD_MODE = {"fill": "constant", "symm": "symmetric", "wrap": "wrap"}
+
+# Kernels with more taps than this use the FFT path when method="auto";
+# on the benchmark below the crossover is between 9x9 and 15x15
+FFT_MIN_TAPS = 100
+
+# Upper bound on the size of temporary arrays (im2col patches, spectra) per chunk
+CHUNK_BYTES = 256 * 2**20
+
+
+def stack_kernels(kernels):
+    """
+    Stack kernels into a (K, kh, kw) bank. Odd-sized kernels of different sizes
+    are zero-padded around the center to a common size, which leaves their
+    "same"-mode outputs unchanged.
+    """
+    if isinstance(kernels, dict):
+        kernels = list(kernels.values())
+    kernels = [np.asarray(k, dtype=float) for k in kernels]
+    kh = max(k.shape[0] for k in kernels)
+    kw = max(k.shape[1] for k in kernels)
+    bank = np.zeros((len(kernels), kh, kw))
+    for i, k in enumerate(kernels):
+        if k.shape == (kh, kw):
+            bank[i] = k
+            continue
+        dh, dw = kh - k.shape[0], kw - k.shape[1]
+        if dh % 2 or dw % 2:
+            raise ValueError(f"Cannot center a {k.shape} kernel in a {(kh, kw)} bank")
+        bank[i, dh // 2:dh // 2 + k.shape[0], dw // 2:dw // 2 + k.shape[1]] = k
+    return bank
+
+
+def _pad(images, kernel_shape, mode, boundary, fillvalue):
+    """Pad (N, H, W) images so that a "valid" correlation yields the requested output."""
+    kh, kw = kernel_shape
+    if mode == "valid":
+        if kh > images.shape[1] or kw > images.shape[2]:
+            raise ValueError(f"mode='valid' needs kernels no larger than the images, "
+                             f"got {(kh, kw)} kernels for {images.shape[1:]} images")
+        return images
+    if mode == "full":
+        pad_h, pad_w = (kh - 1, kh - 1), (kw - 1, kw - 1)
+    elif mode == "same":
+        # convolve2d centers "same" output at offset (k - 1) // 2 inside the full output
+        pad_h = (kh - 1 - (kh - 1) // 2, (kh - 1) // 2)
+        pad_w = (kw - 1 - (kw - 1) // 2, (kw - 1) // 2)
+    else:
+        raise ValueError(f"Unknown mode: {mode!r}")
+    if boundary not in _BOUNDARY_TO_PAD_MODE:
+        raise ValueError(f"Unknown boundary: {boundary!r}")
+    pad_mode = _BOUNDARY_TO_PAD_MODE[boundary]
+    kwargs = {"constant_values": fillvalue} if pad_mode == "constant" else {}
+    return np.pad(images, ((0, 0), pad_h, pad_w), mode=pad_mode, **kwargs)
+
+
+def _im2col(padded, bank):
+    n, hp, wp = padded.shape
+    k, kh, kw = bank.shape
+    ho, wo = hp - kh + 1, wp - kw + 1
+    # Convolution flips the kernel; correlate with the flipped bank instead
+    weights = bank[:, ::-1, ::-1].reshape(k, kh * kw).T
+    out = np.empty((n, k, ho, wo), dtype=np.result_type(padded, bank))
+    per_image = ho * wo * kh * kw * padded.itemsize
+    step = max(1, CHUNK_BYTES // max(per_image, 1))
+    for start in range(0, n, step):
+        windows = sliding_window_view(padded[start:start + step], (kh, kw), axis=(1, 2))
+        patches = windows.reshape(-1, ho * wo, kh * kw)
+        out[start:start + step] = (patches @ weights).transpose(0, 2, 1).reshape(-1, k, ho, wo)
+    return out
+
+
+def _fft(padded, bank):
+    n, hp, wp = padded.shape
+    k, kh, kw = bank.shape
+    ho, wo = hp - kh + 1, wp - kw + 1
+    # A circular convolution of size (hp, wp) is exact on the valid region
+    shape = (sp_fft.next_fast_len(hp, real=True), sp_fft.next_fast_len(wp, real=True))
+    kernel_spectra = sp_fft.rfft2(bank, s=shape, workers=-1)
+    out = np.empty((n, k, ho, wo))
+    per_pair = shape[0] * (shape[1] // 2 + 1) * 16
+    k_step = max(1, min(k, CHUNK_BYTES // per_pair))
+    for i in range(n):
+        image_spectrum = sp_fft.rfft2(padded[i], s=shape, workers=-1)
+        for start in range(0, k, k_step):
+            product = image_spectrum * kernel_spectra[start:start + k_step]
+            full = sp_fft.irfft2(product, s=shape, workers=-1)
+            out[i, start:start + k_step] = full[:, kh - 1:hp, kw - 1:wp]
+    return out
+
+
+def conv2d_bank(images, kernels, mode="same", boundary="symm", fillvalue=0, method="auto"):
+    """
+    Convolve every image with every kernel of a bank.
+
+    Args:
+        images: A (H, W) image or an (N, H, W) batch.
+        kernels: A (K, kh, kw) array, a list of equally shaped kernels, or a dict
+            of them (see `stack_kernels` for mixed odd sizes).
+        mode, boundary, fillvalue: As in `scipy.signal.convolve2d`.
+        method: "im2col", "fft" or "auto" (FFT for kernels with more than
+            `FFT_MIN_TAPS` taps).
+
+    Returns:
+        A (K, H', W') array for a single image, or (N, K, H', W') for a batch.
+    """
+    images = np.asarray(images, dtype=float)
+    single = images.ndim == 2
+    if single:
+        images = images[None]
+    if images.ndim != 3:
+        raise ValueError(f"Expected a (H, W) image or an (N, H, W) batch, got shape {images.shape}")
+    bank = stack_kernels(kernels) if isinstance(kernels, (dict, list, tuple)) else np.asarray(kernels, dtype=float)
+    if bank.ndim == 2:
+        bank = bank[None]
+
+    if method == "auto":
+        method = "fft" if bank.shape[1] * bank.shape[2] > FFT_MIN_TAPS else "im2col"
+    padded = _pad(images, bank.shape[1:], mode, boundary, fillvalue)
+    if method == "im2col":
+        out = _im2col(padded, bank)
+    elif method == "fft":
+        out = _fft(padded, bank)
+    else:
+        raise ValueError(f"Unknown method: {method!r}")
+    return out[0] if single else out
+
+
+def pool2d(x, kernel_size=2, stride=None, padding=0, mode="max"):
+    """
+    Max or average pooling over the last two axes, without Python loops.
+
+    Args:
+        x: A (..., H, W) array.
+        kernel_size, stride, padding: An int or an (h, w) pair each; stride
+            defaults to kernel_size. Padding adds -inf for max pooling and zeros
+            for average pooling (counted in the average, like PyTorch's default).
+        mode: "max" or "avg".
+
+    Returns:
+        (pooled, (rows, cols)): the (..., H_out, W_out) pooled map and, for max
+        pooling, the input coordinates of each window's maximum (first one on
+        ties); for average pooling the window's top-left corner instead.
+        Coordinates refer to the unpadded input and may be negative or past the
+        edge only for average-pooling windows that start in the padding.
+    """
+    def pair(value):
+        return (value, value) if np.isscalar(value) else tuple(value)
+
+    kh, kw = pair(kernel_size)
+    sh, sw = pair(kernel_size if stride is None else stride)
+    ph, pw = pair(padding)
+    x = np.asarray(x)
+    if mode not in ("max", "avg"):
+        raise ValueError(f"Unknown mode: {mode!r}")
+    if x.ndim < 2 or x.shape[-2] + 2 * ph < kh or x.shape[-1] + 2 * pw < kw:
+        raise ValueError(f"Pooling window {(kh, kw)} does not fit an input of shape {x.shape} with padding {(ph, pw)}")
+
+    if ph or pw:
+        pad_value = -np.inf if mode == "max" else 0
+        x = np.pad(x.astype(float), [(0, 0)] * (x.ndim - 2) + [(ph, ph), (pw, pw)], constant_values=pad_value)
+    # (..., H_out, W_out, kh, kw): a view, no copy
+    windows = sliding_window_view(x, (kh, kw), axis=(-2, -1))[..., ::sh, ::sw, :, :]
+    h_out, w_out = windows.shape[-4], windows.shape[-3]
+    top = np.arange(h_out)[:, None] * sh - ph
+    left = np.arange(w_out)[None, :] * sw - pw
+
+    if mode == "avg":
+        pooled = windows.mean(axis=(-2, -1))
+        shape = pooled.shape
+        return pooled, (np.broadcast_to(top, shape), np.broadcast_to(left, shape))
+
+    flat = windows.reshape(*windows.shape[:-2], kh * kw)
+    index = flat.argmax(axis=-1)
+    pooled = np.take_along_axis(flat, index[..., None], axis=-1)[..., 0]
+    return pooled, (top + index // kw, left + index % kw)
+
+
+def benchmark(n_images=4, n_kernels=64, kernel_sizes=(3, 5, 9, 15), full_resolution=False, repeat=3):
+    """Time conv2d_bank against a convolve2d loop on the camera image and print a table."""
+    from scipy.signal import convolve2d
+    from skimage import data
+
+    image = data.camera().astype(float)
+    if not full_resolution:
+        image = image[::2, ::2]
+    rng = np.random.default_rng(0)
+    images = np.stack([np.roll(image, 7 * i, axis=1) for i in range(n_images)])
+
+    def best_of(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        return min(times), result
+
+    print(f"{n_images} image(s) of {image.shape}, {n_kernels} kernels, mode='same', boundary='symm'")
+    print(f"{'kernel':>8}{'convolve2d (s)':>16}{'im2col (s)':>12}{'fft (s)':>10}{'speed-up':>10}{'max err':>10}")
+    for size in kernel_sizes:
+        bank = rng.standard_normal((n_kernels, size, size))
+        loop_time, expected = best_of(lambda: np.stack([
+            np.stack([convolve2d(img, k, mode="same", boundary="symm") for k in bank]) for img in images
+        ]))
+        im2col_time, im2col_out = best_of(lambda: conv2d_bank(images, bank, method="im2col"))
+        fft_time, fft_out = best_of(lambda: conv2d_bank(images, bank, method="fft"))
+        error = max(np.abs(im2col_out - expected).max(), np.abs(fft_out - expected).max())
+        print(f"{f'{size}x{size}':>8}{loop_time:>16.3f}{im2col_time:>12.3f}{fft_time:>10.3f}"
+              f"{loop_time / min(im2col_time, fft_time):>9.1f}x{error:>10.1e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark conv2d_bank against scipy.signal.convolve2d")
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--kernels", type=int, default=64)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 5, 9, 15])
+    parser.add_argument("--full-resolution", action="store_true", help="Use the 512x512 image instead of 256x256")
+    args = parser.parse_args()
+    benchmark(args.images, args.kernels, args.sizes, args.full_resolution)
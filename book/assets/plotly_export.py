@@ -0,0 +1,184 @@
+"""
+Compact HTML export for the book's Plotly assets.
+
+`fig.write_html` serializes every frame in full and writes numeric arrays as
+JSON text, so an animation that redraws a 400-point curve in each of 30 frames
+embeds that curve 31 times, and a float heatmap costs ~18 characters per cell.
+`write_compact_html` shrinks the figure before writing it:
+
+1. Static traces: a trace that is identical in the base figure and in every
+   frame is dropped from the frames (and from each frame's `traces` list), so
+   it is embedded once. Traces that change are still sent in full per frame.
+2. Typed arrays: numeric `x`, `y` and `z` arrays are written as base64 typed
+   arrays (`{"dtype": "f4", "bdata": ..., "shape": ...}`, read natively by
+   plotly.js >= 2.28, i.e. plotly >= 5.19). Integer data, including floats
+   that hold only whole numbers, uses the smallest integer type that holds it;
+   other floats are downcast to float32 by default.
+3. Optional uint8 heatmaps: `quantize_heatmaps=True` maps each heatmap's `z`
+   linearly onto 0..255 and pins `zmin`/`zmax`, so colors are unchanged but
+   hover values show the quantized level. Meant for image-like figures.
+
+Usage:
+    from plotly_export import write_compact_html
+    write_compact_html(fig, "figure.html")
+"""
+
+from __future__ import annotations
+
+import base64
+import copy
+import json
+from pathlib import Path
+
+import numpy as np
+import plotly
+import plotly.io as pio
+
+ARRAY_KEYS = ("x", "y", "z")
+
+# Arrays shorter than this stay plain JSON; base64 only pays off on longer ones
+MIN_TYPED_LENGTH = 16
+
+_INT_TYPES = [("u1", np.uint8), ("i1", np.int8), ("u2", np.uint16), ("i2", np.int16),
+              ("u4", np.uint32), ("i4", np.int32)]
+
+
+def _supports_typed_arrays() -> bool:
+    major, minor = (int(part) for part in plotly.__version__.split(".")[:2])
+    return (major, minor) >= (5, 19)
+
+
+def decode_typed_array(spec: dict) -> np.ndarray:
+    """Inverse of `encode_typed_array`; newer plotly versions already emit these specs."""
+    array = np.frombuffer(base64.b64decode(spec["bdata"]), dtype=np.dtype(spec["dtype"]))
+    if "shape" in spec:
+        array = array.reshape([int(n) for n in str(spec["shape"]).split(",")])
+    return array
+
+
+def _as_array(value):
+    return decode_typed_array(value) if isinstance(value, dict) and "bdata" in value else value
+
+
+def encode_typed_array(values, float32: bool = True):
+    """Return a plotly.js typed-array spec for a numeric array, or None if it is not numeric."""
+    try:
+        array = np.asarray(values)
+    except ValueError:  # ragged nested lists
+        return None
+    if array.dtype == bool or not np.issubdtype(array.dtype, np.number) or array.ndim not in (1, 2):
+        return None
+    if array.size < MIN_TYPED_LENGTH:
+        return None
+    if np.issubdtype(array.dtype, np.floating) and np.isfinite(array).all() and (array == np.round(array)).all() \
+            and np.abs(array).max() < 2**31:
+        array = array.astype(np.int64)
+    if np.issubdtype(array.dtype, np.integer):
+        low, high = array.min(), array.max()
+        for code, dtype in _INT_TYPES:
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                break
+        else:
+            code, dtype = "f8", np.float64
+    else:
+        code, dtype = ("f4", np.float32) if float32 else ("f8", np.float64)
+    spec = {"dtype": code, "bdata": base64.b64encode(np.ascontiguousarray(array, dtype=dtype).tobytes()).decode()}
+    if array.ndim == 2:
+        spec["shape"] = f"{array.shape[0]},{array.shape[1]}"
+    return spec
+
+
+def _quantize_heatmap(trace: dict):
+    z = np.asarray(_as_array(trace["z"]), dtype=float)
+    low = float(np.nanmin(z)) if trace.get("zmin") is None else trace["zmin"]
+    high = float(np.nanmax(z)) if trace.get("zmax") is None else trace["zmax"]
+    scale = 255.0 / (high - low) if high > low else 0.0
+    trace["z"] = np.clip(np.round((z - low) * scale), 0, 255).astype(np.uint8)
+    trace["zmin"], trace["zmax"] = 0, 255
+
+
+def _encode_trace(trace: dict, float32: bool, quantize_heatmaps: bool):
+    if quantize_heatmaps and trace.get("type") == "heatmap" and trace.get("z") is not None:
+        _quantize_heatmap(trace)
+    for key in ARRAY_KEYS:
+        value = _as_array(trace.get(key))
+        if value is None or isinstance(value, (str, dict)):
+            continue
+        spec = encode_typed_array(value, float32)
+        if spec is not None:
+            trace[key] = spec
+
+
+def _to_builtin(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot compare {type(value).__name__}")
+
+
+def _same(a: dict, b: dict) -> bool:
+    return json.dumps(a, sort_keys=True, default=_to_builtin) == json.dumps(b, sort_keys=True, default=_to_builtin)
+
+
+def drop_static_traces(figure: dict) -> int:
+    """
+    Remove traces that every frame repeats unchanged from the base figure.
+
+    Returns:
+        int: The number of trace copies removed from frames.
+    """
+    frames = figure.get("frames") or []
+    if not frames:
+        return 0
+    base = figure["data"]
+    # A frame without `traces` updates traces 0..len(data)-1
+    for frame in frames:
+        if frame.get("data") and frame.get("traces") is None:
+            frame["traces"] = list(range(len(frame["data"])))
+
+    static = set()
+    for index, trace in enumerate(base):
+        copies = [frame["data"][frame["traces"].index(index)] for frame in frames
+                  if frame.get("data") and index in frame["traces"]]
+        # Frames that do not mention the trace leave it as it is, which is also static
+        if all(_same(copy, trace) for copy in copies):
+            static.add(index)
+
+    removed = 0
+    for frame in frames:
+        if not frame.get("data"):
+            continue
+        keep = [k for k, index in enumerate(frame["traces"]) if index not in static]
+        removed += len(frame["traces"]) - len(keep)
+        frame["data"] = [frame["data"][k] for k in keep]
+        frame["traces"] = [frame["traces"][k] for k in keep]
+    return removed
+
+
+def compact_figure(fig, float32: bool = True, quantize_heatmaps: bool = False) -> dict:
+    """Return a compacted figure dict (static traces shared, arrays typed) for `pio.write_html`."""
+    figure = copy.deepcopy(fig.to_plotly_json() if hasattr(fig, "to_plotly_json") else dict(fig))
+    drop_static_traces(figure)
+    if not _supports_typed_arrays():
+        return figure
+    for trace in figure.get("data", []):
+        _encode_trace(trace, float32, quantize_heatmaps)
+    for frame in figure.get("frames") or []:
+        for trace in frame.get("data") or []:
+            _encode_trace(trace, float32, quantize_heatmaps)
+    return figure
+
+
+def write_compact_html(fig, path, float32: bool = True, quantize_heatmaps: bool = False,
+                       include_plotlyjs="cdn", **kwargs) -> int:
+    """
+    Write a compacted figure as HTML. Extra keyword arguments go to `pio.write_html`.
+
+    Returns:
+        int: The size of the written file in bytes.
+    """
+    figure = compact_figure(fig, float32=float32, quantize_heatmaps=quantize_heatmaps)
+    pio.write_html(figure, str(path), include_plotlyjs=include_plotlyjs, validate=False, **kwargs)
+    return Path(path).stat().st_size
@@ -0,0 +1,291 @@
+"""
+Incremental, parallel build of the generated files under book/assets.
+
+Generator scripts declare what they produce with module-level constants, paths
+relative to the script's directory:
+
+    ASSET_OUTPUTS = ["gd_animation.html"]          # required: marks a generator
+    ASSET_INPUTS = ["../ch09/glove.6B.50d.txt"]    # optional data files
+
+This script discovers every such generator under book/assets and fingerprints
+it from the script source, the source of the local modules it imports (e.g.
+cnn_ops.py, plotly_export.py), its declared input files and the versions of the
+third-party packages it imports. A generator runs only when that fingerprint
+changed since its last successful build or one of its outputs is missing.
+Stale generators run concurrently, each in its own Python process started from
+the repository root (the directory the scripts are written to be run from),
+and their outputs are mirrored into book/_output/assets so a rendered book
+picks them up without a full Quarto render.
+
+Usage:
+    python book/build_assets.py              # rebuild stale assets
+    python book/build_assets.py --list       # show generators and their state
+    python book/build_assets.py ch11 --force # rebuild generators matching "ch11"
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import functools
+import hashlib
+import importlib.metadata
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+
+BOOK_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BOOK_DIR.parent
+ASSETS_DIR = BOOK_DIR / "assets"
+OUTPUT_ASSETS_DIR = BOOK_DIR / "_output" / "assets"
+MANIFEST_PATH = ASSETS_DIR / ".build_manifest.json"
+
+
+@dataclass
+class Generator:
+    script: Path
+    outputs: list[Path]
+    inputs: list[Path] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        return self.script.relative_to(ASSETS_DIR).as_posix()
+
+
+def _module_constants(tree: ast.Module) -> dict:
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name in ("ASSET_OUTPUTS", "ASSET_INPUTS"):
+                constants[name] = ast.literal_eval(node.value)
+    return constants
+
+
+def discover(assets_dir: Path = ASSETS_DIR) -> list[Generator]:
+    """Find every script under assets_dir that declares ASSET_OUTPUTS."""
+    generators = []
+    for script in sorted(assets_dir.rglob("*.py")):
+        if "__pycache__" in script.parts:
+            continue
+        constants = _module_constants(ast.parse(script.read_text(encoding="utf-8")))
+        if "ASSET_OUTPUTS" not in constants:
+            continue
+        generators.append(Generator(
+            script=script,
+            outputs=[(script.parent / p).resolve() for p in constants["ASSET_OUTPUTS"]],
+            inputs=[(script.parent / p).resolve() for p in constants.get("ASSET_INPUTS", [])],
+        ))
+    return generators
+
+
+# --- Fingerprints ---
+
+def imported_names(tree: ast.AST) -> set[str]:
+    """Top-level names of the absolute imports in a parsed module."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names.add(node.module.split(".")[0])
+    return names
+
+
+def _imports(script: Path) -> set[str]:
+    return imported_names(ast.parse(script.read_text(encoding="utf-8")))
+
+
+def local_modules(script: Path) -> list[Path]:
+    """Modules imported by the script (recursively) that live next to it or in book/assets."""
+    found, pending = set(), [script]
+    while pending:
+        current = pending.pop()
+        for name in _imports(current):
+            for directory in (current.parent, ASSETS_DIR):
+                candidate = (directory / f"{name}.py").resolve()
+                if candidate.exists() and candidate != script and candidate not in found:
+                    found.add(candidate)
+                    pending.append(candidate)
+                    break
+    return sorted(found)
+
+
+@functools.lru_cache(maxsize=None)
+def _distributions() -> dict:
+    # Scans every installed distribution; computed once per process
+    return importlib.metadata.packages_distributions()
+
+
+def package_versions(names) -> dict:
+    """Installed versions of the distributions that provide the given top-level modules."""
+    distributions = _distributions()
+    versions = {}
+    for name in names:
+        for dist in distributions.get(name, []):
+            try:
+                versions[dist] = importlib.metadata.version(dist)
+            except importlib.metadata.PackageNotFoundError:
+                pass
+    return dict(sorted(versions.items()))
+
+
+def _package_versions(scripts: list[Path]) -> dict:
+    return package_versions(set().union(*(_imports(script) for script in scripts)))
+
+
+def file_digest(path: Path, cache: dict) -> str:
+    """SHA-256 of a file, reusing the cached digest while its size and mtime are unchanged."""
+    stat = path.stat()
+    # Keyed relative to the repository so the manifest survives moving the checkout
+    key = Path(os.path.relpath(path.resolve(), REPO_ROOT)).as_posix()
+    entry = cache.get(key)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return cache[key]["sha256"]
+
+
+def fingerprint(generator: Generator, file_cache: dict) -> str:
+    sources = [generator.script, *local_modules(generator.script)]
+    digest = hashlib.sha256()
+    for path in sources + generator.inputs:
+        digest.update(str(path.relative_to(REPO_ROOT)).encode())
+        digest.update(file_digest(path, file_cache).encode())
+    digest.update(json.dumps([str(p.relative_to(REPO_ROOT)) for p in generator.outputs]).encode())
+    digest.update(json.dumps(_package_versions(sources)).encode())
+    return digest.hexdigest()
+
+
+# --- Build ---
+
+def load_manifest() -> dict:
+    if MANIFEST_PATH.exists():
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    return {"generators": {}, "files": {}}
+
+
+def save_manifest(manifest: dict):
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def run_generator(generator: Generator) -> tuple[bool, float, str]:
+    """Run one generator in a fresh interpreter; returns (success, seconds, output)."""
+    env = dict(os.environ, MPLBACKEND="Agg", PYTHONHASHSEED="0")
+    start = time.time()
+    result = subprocess.run(
+        [sys.executable, str(generator.script)],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    seconds = time.time() - start
+    log = result.stdout + result.stderr
+    # Some scripts report problems and exit 0, so also require fresh outputs
+    stale = [p for p in generator.outputs if not p.exists() or p.stat().st_mtime < start - 1]
+    if result.returncode != 0:
+        return False, seconds, log
+    if stale:
+        return False, seconds, log + f"\nOutputs not written: {', '.join(str(p) for p in stale)}"
+    return True, seconds, log
+
+
+def mirror(generator: Generator) -> int:
+    """Copy outputs that differ into book/_output/assets; returns the number of files copied."""
+    if not OUTPUT_ASSETS_DIR.exists():
+        return 0
+    copied = 0
+    for output in generator.outputs:
+        if not output.exists():
+            continue
+        target = OUTPUT_ASSETS_DIR / output.relative_to(ASSETS_DIR)
+        if target.exists() and target.stat().st_size == output.stat().st_size \
+                and target.read_bytes() == output.read_bytes():
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(output, target)
+        copied += 1
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild stale generated assets under book/assets")
+    parser.add_argument("patterns", nargs="*", help="Only consider generators whose path contains one of these")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the fingerprint is unchanged")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="Generators to run concurrently")
+    parser.add_argument("--list", action="store_true", help="Show generators and whether they are stale, then exit")
+    parser.add_argument("--no-mirror", action="store_true", help="Do not copy outputs into book/_output/assets")
+    args = parser.parse_args()
+
+    manifest = load_manifest()
+    generators = [g for g in discover() if not args.patterns or any(p in g.name for p in args.patterns)]
+
+    plan, skipped = [], []
+    for generator in generators:
+        missing_inputs = [p for p in generator.inputs if not p.exists()]
+        if missing_inputs:
+            skipped.append((generator, f"missing input {missing_inputs[0].relative_to(REPO_ROOT)}"))
+            continue
+        digest = fingerprint(generator, manifest["files"])
+        previous = manifest["generators"].get(generator.name, {}).get("fingerprint")
+        outputs_exist = all(p.exists() for p in generator.outputs)
+        if args.force or digest != previous or not outputs_exist:
+            plan.append((generator, digest))
+        else:
+            skipped.append((generator, "up to date"))
+
+    if args.list:
+        for generator, _ in plan:
+            print(f"stale       {generator.name}")
+        for generator, reason in skipped:
+            print(f"{'ok' if reason == 'up to date' else 'skipped':<12}{generator.name} ({reason})")
+        return
+
+    failures = 0
+    build_start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(run_generator, generator): (generator, digest) for generator, digest in plan}
+        for future in as_completed(futures):
+            generator, digest = futures[future]
+            ok, seconds, log = future.result()
+            if ok:
+                manifest["generators"][generator.name] = {
+                    "fingerprint": digest,
+                    "outputs": [str(p.relative_to(REPO_ROOT)) for p in generator.outputs],
+                    "built_at": time.time(),
+                    "seconds": round(seconds, 2),
+                }
+                save_manifest(manifest)
+                print(f"built       {generator.name} ({seconds:.1f}s)")
+            else:
+                failures += 1
+                print(f"FAILED      {generator.name} ({seconds:.1f}s)\n{log.rstrip()}")
+    for generator, reason in skipped:
+        print(f"{'ok' if reason == 'up to date' else 'skipped':<12}{generator.name} ({reason})")
+
+    copied = 0
+    if not args.no_mirror:
+        for generator in generators:
+            copied += mirror(generator)
+    save_manifest(manifest)
+    up_to_date = sum(reason == "up to date" for _, reason in skipped)
+    print(f"{len(plan) - failures} built, {failures} failed, {up_to_date} up to date, "
+          f"{len(skipped) - up_to_date} skipped, "
+          f"{copied} file(s) mirrored to {OUTPUT_ASSETS_DIR.relative_to(REPO_ROOT)} "
+          f"in {time.time() - build_start:.1f}s")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+A small LRU cache of prompt-prefix KV states for `generate_creative_text`.
+
+Every chat prompt starts with the same chat-template header, and production
+prompts usually also share a long fixed instruction preamble. Re-running the
+prefill over those shared tokens on every call is wasted work, so this module
+keeps the `past_key_values` of recently seen prompts (keyed by their token ids)
+and hands a copy of the longest matching prefix back to `model.generate`, which
+then only has to prefill the tokens that differ.
+
+Entries are evicted in least-recently-used order once the total size of the
+cached key/value tensors exceeds `max_bytes`.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers import DynamicCache
+
+
+def cache_to_layers(cache: DynamicCache) -> list:
+    """Returns the per-layer (keys, values) tensors held by a DynamicCache."""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    # Older transformers releases keep the tensors in two parallel lists
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def cache_from_layers(layers) -> DynamicCache:
+    """Builds a DynamicCache holding the given per-layer (keys, values) tensors."""
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+
+def crop_to(cache: DynamicCache, length: int):
+    """Drops every cached position after the first `length` tokens, in place."""
+    excess = cache.get_seq_length() - length
+    if excess > 0:
+        # A negative argument means "remove this many tokens" in every transformers release
+        cache.crop(-excess)
+
+
+def cache_nbytes(cache: DynamicCache) -> int:
+    """Returns the memory held by the key/value tensors of a cache, in bytes."""
+    return sum(
+        t.numel() * t.element_size()
+        for layer in cache_to_layers(cache)
+        for t in layer
+        if isinstance(t, torch.Tensor)
+    )
+
+
+class PrefixKVCache:
+    """
+    LRU cache mapping tokenized prompt prefixes to their KV states.
+
+    Args:
+        max_bytes (int, optional): Upper bound on the total size of the cached
+            key/value tensors. Defaults to 512 MiB.
+        min_prefix_tokens (int, optional): Shared prefixes shorter than this are
+            not worth reusing and are treated as a miss. Defaults to 8.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, min_prefix_tokens: int = 8):
+        self.max_bytes = max_bytes
+        self.min_prefix_tokens = min_prefix_tokens
+        self._entries = OrderedDict()  # token-id tuple -> (DynamicCache, nbytes)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, input_ids: torch.Tensor):
+        """
+        Finds the cached entry sharing the longest prefix with `input_ids`.
+
+        Args:
+            input_ids (torch.Tensor): Prompt token ids of shape (1, seq_len).
+
+        Returns:
+            DynamicCache | None: A private copy of the cached KV states cropped to
+            the shared prefix, or None on a miss. At least one prompt token is
+            always left uncached so that `generate` has something to prefill.
+        """
+        tokens = input_ids[0].tolist()
+        limit = len(tokens) - 1
+        best_key, best_len = None, 0
+        with self._lock:
+            for key in self._entries:
+                shared = 0
+                for a, b in zip(key, tokens[:limit]):
+                    if a != b:
+                        break
+                    shared += 1
+                if shared > best_len:
+                    best_key, best_len = key, shared
+
+            if best_key is None or best_len < self.min_prefix_tokens:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            cached, _ = self._entries[best_key]
+            # generate() appends to the cache in place, so never hand out the stored object
+            past_key_values = copy.deepcopy(cached)
+            self.hits += 1
+            self.reused_tokens += best_len
+
+        crop_to(past_key_values, best_len)
+        return past_key_values
+
+    def store(self, input_ids: torch.Tensor, past_key_values: DynamicCache):
+        """
+        Stores the KV states of a prompt, evicting old entries to stay within budget.
+
+        Args:
+            input_ids (torch.Tensor): Prompt token ids of shape (1, seq_len).
+            past_key_values (DynamicCache): A cache covering at least the prompt.
+                It is copied and cropped to the prompt length before storing.
+        """
+        key = tuple(input_ids[0].tolist())
+        entry = copy.deepcopy(past_key_values)
+        crop_to(entry, len(key))
+        nbytes = cache_nbytes(entry)
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (entry, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and current memory usage."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reused_tokens": self.reused_tokens,
+            }
@@ -0,0 +1,59 @@
+"""
+Batched temperature / top-p sampling shared by the ch14 decoding loops.
+
+`model.generate` applies its logits warpers to one request at a time, but a
+decode loop that batches several requests needs every row to keep its own
+temperature and top_p. These helpers do the same warping as transformers'
+TemperatureLogitsWarper, TopKLogitsWarper and TopPLogitsWarper (in that order),
+vectorised over the batch.
+"""
+
+import torch
+
+
+def generation_top_k(model) -> int:
+    """Returns the top_k that `model.generate` applies implicitly (the model's generation config, else 50)."""
+    top_k = getattr(model.generation_config, "top_k", None)
+    return 50 if top_k is None else top_k
+
+
+def warp_probs(logits: torch.Tensor, temperature: torch.Tensor, top_p: torch.Tensor, top_k: int = 0) -> torch.Tensor:
+    """
+    Turns raw logits into the sampling distribution after temperature and top-p.
+
+    Args:
+        logits (torch.Tensor): Next-token logits of shape (batch, vocab).
+        temperature (torch.Tensor): Per-row temperature of shape (batch,).
+        top_p (torch.Tensor): Per-row nucleus threshold of shape (batch,).
+        top_k (int, optional): Keep only the k most likely tokens; 0 disables it. Defaults to 0.
+
+    Returns:
+        torch.Tensor: Probabilities of shape (batch, vocab); tokens outside the
+        nucleus get exactly zero mass.
+    """
+    scores = logits.float() / temperature.float().clamp_min(1e-5).unsqueeze(-1)
+
+    if 0 < top_k < scores.shape[-1]:
+        kth_best = torch.topk(scores, top_k, dim=-1).values[..., -1:]
+        scores = scores.masked_fill(scores < kth_best, float("-inf"))
+
+    # Same rule as TopPLogitsWarper: drop the low-probability tail whose total mass is <= 1 - top_p
+    sorted_scores, sorted_idx = torch.sort(scores, dim=-1, descending=False)
+    cumulative = sorted_scores.softmax(dim=-1).cumsum(dim=-1)
+    sorted_remove = cumulative <= (1 - top_p.float()).unsqueeze(-1)
+    sorted_remove[..., -1] = False  # always keep the most likely token
+    remove = sorted_remove.scatter(-1, sorted_idx, sorted_remove)
+    scores = scores.masked_fill(remove, float("-inf"))
+    return scores.softmax(dim=-1)
+
+
+def sample_next_tokens(logits: torch.Tensor, temperature: torch.Tensor, top_p: torch.Tensor,
+                       top_k: int = 0) -> torch.Tensor:
+    """
+    Samples one token per row with per-row temperature and top_p.
+
+    Returns:
+        torch.Tensor: Token ids of shape (batch,).
+    """
+    probs = warp_probs(logits, temperature, top_p, top_k)
+    return torch.multinomial(probs, num_samples=1).squeeze(-1)
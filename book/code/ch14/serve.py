@@ -0,0 +1,379 @@
+"""
+A long-running local HTTP generation server for the ch14 model.
+
+The model is loaded once with `load_model` from vibe.py and shared by all
+requests. A single scheduler thread runs a continuous-batching decode loop:
+every step it decodes one token for all running requests at once, retires the
+ones that hit EOS or their token limit, and immediately admits waiting requests
+into the freed batch slots instead of waiting for the whole batch to drain.
+
+Requests wait in a bounded queue. When the queue is full the server answers
+503 with a Retry-After header so that clients back off instead of piling up.
+A prompt that fails to prefill (out of memory, too long) fails only its own
+request, and requests whose client has already received a 504 are dropped from
+the batch instead of being decoded to the end.
+
+Usage:
+    python serve.py --port 8000 --max-batch-size 8 --max-queue 64
+
+    curl -s localhost:8000/generate -d '{"prompt": "写一句广告语", "temperature": 0.7, "top_p": 0.9}'
+    curl -s localhost:8000/metrics
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+from prefix_cache import cache_from_layers, cache_to_layers
+from sampling import generation_top_k, sample_next_tokens
+from vibe import MODEL_NAME, encode_prompt, load_model
+
+
+class GenerationRequest:
+    """One queued prompt plus the event its HTTP handler waits on."""
+
+    def __init__(self, input_ids: torch.Tensor, temperature: float, top_p: float, max_new_tokens: int):
+        self.input_ids = input_ids
+        self.temperature = temperature
+        self.top_p = top_p
+        self.max_new_tokens = max_new_tokens
+        self.generated = []
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.error = None
+        self.cancelled = False  # set by the handler after a timeout; the scheduler drops the request
+
+
+class ContinuousBatchScheduler:
+    """
+    Decodes many requests in one batch, admitting new ones as old ones finish.
+
+    The running batch keeps a single left-padded KV cache. A newly admitted
+    request is prefilled on its own and then spliced into the batch cache; a
+    finished request's row is dropped, and columns that have become pure
+    padding are trimmed away.
+
+    Args:
+        model: The pre-loaded causal language model.
+        tokenizer: The matching tokenizer.
+        max_batch_size (int, optional): Maximum number of requests decoded together. Defaults to 8.
+        max_queue (int, optional): Maximum number of requests waiting for a batch slot. Defaults to 64.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 8, max_queue: int = 64):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.top_k = generation_top_k(model)  # match what model.generate would sample from
+
+        eos = model.generation_config.eos_token_id
+        eos = eos if isinstance(eos, (list, tuple)) else [eos]
+        self.eos_token_ids = {t for t in eos + [tokenizer.eos_token_id] if t is not None}
+
+        # Running batch state
+        self.active = []
+        self.layers = None          # per-layer (keys, values) of shape (batch, heads, seq, dim)
+        self.attention_mask = None  # (batch, seq), 0 marks left padding
+        self.next_tokens = None     # (batch,), sampled but not yet fed to the model
+
+        # Metrics
+        self._lock = threading.Lock()
+        self._token_log = deque()   # (timestamp, tokens decoded in that step)
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_tokens = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="decode-loop", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def submit(self, request: GenerationRequest) -> bool:
+        """Queues a request; returns False when the queue is full."""
+        try:
+            self.queue.put_nowait(request)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+    def metrics(self, window: float = 10.0) -> dict:
+        """Returns queue depth, batch occupancy and recent decode throughput."""
+        now = time.perf_counter()
+        with self._lock:
+            while self._token_log and now - self._token_log[0][0] > window:
+                self._token_log.popleft()
+            recent = sum(n for _, n in self._token_log)
+            active = len(self.active)
+            return {
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "active_requests": active,
+                "batch_occupancy": active / self.max_batch_size,
+                "tokens_per_sec": recent / window,
+                "total_tokens": self.total_tokens,
+                "completed_requests": self.completed,
+                "rejected_requests": self.rejected,
+                "failed_requests": self.failed,
+                "cancelled_requests": self.cancelled,
+            }
+
+    # --- decode loop ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._admit()
+                if not self.active:
+                    continue
+                self._decode_step()
+            except Exception as e:
+                # A failed decode step leaves the batch cache unusable: fail the running
+                # requests rather than killing the server thread
+                self._fail(self.active, e)
+                self.active, self.layers, self.attention_mask, self.next_tokens = [], None, None, None
+
+    def _fail(self, requests, error: Exception):
+        for request in requests:
+            request.error = f"{type(error).__name__}: {error}"
+            request.done.set()
+        with self._lock:
+            self.failed += len(requests)
+
+    def _admit(self):
+        while len(self.active) < self.max_batch_size:
+            try:
+                # Block briefly only when there is nothing to decode
+                request = self.queue.get(timeout=0.05) if not self.active else self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if request.cancelled:
+                with self._lock:
+                    self.cancelled += 1
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                # _prefill only touches the batch state once everything it needs is computed,
+                # so a failing prompt (OOM, too long) fails alone and the batch keeps decoding
+                self._fail([request], e)
+
+    @torch.no_grad()
+    def _prefill(self, request: GenerationRequest):
+        input_ids = request.input_ids.to(self.model.device)
+        outputs = self.model(input_ids=input_ids, use_cache=True)
+        first_token = sample_next_tokens(
+            outputs.logits[:, -1, :],
+            torch.tensor([request.temperature], device=input_ids.device),
+            torch.tensor([request.top_p], device=input_ids.device),
+            self.top_k,
+        )
+        layers = cache_to_layers(outputs.past_key_values)
+        mask = torch.ones_like(input_ids)
+
+        if self.layers is not None:
+            # Left-pad whichever side is shorter so the sequence axes line up, then stack on the batch axis
+            batch_len, new_len = self.attention_mask.shape[1], mask.shape[1]
+            width = max(batch_len, new_len)
+            layers = [
+                (torch.cat([_left_pad(bk, width), _left_pad(nk, width)]),
+                 torch.cat([_left_pad(bv, width), _left_pad(nv, width)]))
+                for (bk, bv), (nk, nv) in zip(self.layers, layers)
+            ]
+            mask = torch.cat([_left_pad(self.attention_mask, width), _left_pad(mask, width)])
+            first_token = torch.cat([self.next_tokens, first_token])
+        self.layers, self.attention_mask, self.next_tokens = layers, mask, first_token
+        self.active.append(request)
+
+    @torch.no_grad()
+    def _decode_step(self):
+        device = self.attention_mask.device
+        for request, token in zip(self.active, self.next_tokens.tolist()):
+            request.generated.append(token)
+
+        # Retire finished requests, and those whose client already got a 504, before spending compute on them
+        keep = [
+            i for i, r in enumerate(self.active)
+            if not r.cancelled and r.generated[-1] not in self.eos_token_ids and len(r.generated) < r.max_new_tokens
+        ]
+        self._record(len(self.active))
+        if len(keep) < len(self.active):
+            retired = [r for i, r in enumerate(self.active) if i not in keep]
+            for request in retired:
+                request.done.set()
+            with self._lock:
+                cancelled = sum(r.cancelled for r in retired)
+                self.cancelled += cancelled
+                self.completed += len(retired) - cancelled
+            if not keep:
+                self.active, self.layers, self.attention_mask, self.next_tokens = [], None, None, None
+                return
+            index = torch.tensor(keep, device=device)
+            self.active = [self.active[i] for i in keep]
+            self.layers = [(k.index_select(0, index), v.index_select(0, index)) for k, v in self.layers]
+            self.attention_mask = self.attention_mask.index_select(0, index)
+            self.next_tokens = self.next_tokens.index_select(0, index)
+            self._trim_padding()
+
+        # Positions continue from each row's own number of real tokens
+        position_ids = self.attention_mask.sum(dim=-1, keepdim=True)
+        attention_mask = torch.cat([self.attention_mask, torch.ones_like(position_ids)], dim=-1)
+        outputs = self.model(
+            input_ids=self.next_tokens.unsqueeze(-1),
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=cache_from_layers(self.layers),
+            use_cache=True,
+        )
+        self.layers = cache_to_layers(outputs.past_key_values)
+        self.attention_mask = attention_mask
+        self.next_tokens = sample_next_tokens(
+            outputs.logits[:, -1, :],
+            torch.tensor([r.temperature for r in self.active], device=device),
+            torch.tensor([r.top_p for r in self.active], device=device),
+            self.top_k,
+        )
+
+    def _trim_padding(self):
+        """Drops leading columns that are padding for every remaining row."""
+        first_real = int((self.attention_mask.sum(dim=0) > 0).float().argmax())
+        if first_real > 0:
+            self.layers = [(k[:, :, first_real:], v[:, :, first_real:]) for k, v in self.layers]
+            self.attention_mask = self.attention_mask[:, first_real:]
+
+    def _record(self, n_tokens: int):
+        with self._lock:
+            self._token_log.append((time.perf_counter(), n_tokens))
+            self.total_tokens += n_tokens
+
+
+def _left_pad(tensor: torch.Tensor, width: int) -> torch.Tensor:
+    """Zero-pads the sequence axis (dim 2 for KV tensors, dim 1 for masks) on the left up to `width`."""
+    seq_dim = 2 if tensor.dim() == 4 else 1
+    missing = width - tensor.shape[seq_dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[seq_dim] = missing
+    return torch.cat([tensor.new_zeros(shape), tensor], dim=seq_dim)
+
+
+def make_handler(scheduler: ContinuousBatchScheduler, request_timeout: float):
+    """Builds the HTTP handler class bound to one scheduler."""
+
+    class GenerationHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, payload: dict, headers: dict = None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/metrics":
+                self._send_json(200, scheduler.metrics())
+            elif self.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(payload, dict):
+                    raise TypeError("body is not a JSON object")
+                prompt, system_prompt = payload["prompt"], payload.get("system_prompt")
+                if not isinstance(prompt, str) or not isinstance(system_prompt, (str, type(None))):
+                    raise TypeError("prompt and system_prompt must be strings")
+                temperature = float(payload.get("temperature", 0.7))
+                top_p = float(payload.get("top_p", 0.9))
+                max_new_tokens = int(payload.get("max_new_tokens", 150))
+                if max_new_tokens < 1:
+                    raise ValueError("max_new_tokens must be at least 1")
+            except (ValueError, KeyError, TypeError) as error:
+                self._send_json(400, {"error": f"expected a JSON object with a string 'prompt' field: {error}"})
+                return
+
+            request = GenerationRequest(
+                encode_prompt(scheduler.tokenizer, prompt, system_prompt),
+                temperature=temperature,
+                top_p=top_p,
+                max_new_tokens=max_new_tokens,
+            )
+            if not scheduler.submit(request):
+                self._send_json(503, {"error": "server busy, retry later"}, headers={"Retry-After": "1"})
+                return
+            if not request.done.wait(request_timeout):
+                request.cancelled = True  # stop decoding for a client that is no longer waiting
+                self._send_json(504, {"error": "generation timed out"})
+                return
+            if request.error:
+                self._send_json(500, {"error": request.error})
+                return
+
+            text = scheduler.tokenizer.decode(request.generated, skip_special_tokens=True)
+            self._send_json(200, {
+                "text": text,
+                "completion_tokens": len(request.generated),
+                "latency_sec": round(time.perf_counter() - request.enqueued_at, 3),
+            })
+
+        def log_message(self, format, *args):
+            pass  # keep the console for the startup banner and errors
+
+    return GenerationHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuous-batching HTTP server for the ch14 model.")
+    parser.add_argument("--model", default=MODEL_NAME, help="Hugging Face model id or local path.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Requests decoded together per step.")
+    parser.add_argument("--max-queue", type=int, default=64, help="Waiting requests before answering 503.")
+    parser.add_argument("--request-timeout", type=float, default=300.0, help="Seconds a client waits for its result.")
+    parser.add_argument("--dtype", default="best", help="'best', 'auto', 'float32', 'bfloat16' or 'float16'; with --mmap 'best' keeps the checkpoint dtype.")
+    parser.add_argument("--quantize", choices=["int8"], help="Dynamic int8 quantization of the Linear layers (CPU).")
+    parser.add_argument("--mmap", action="store_true", help="Memory-map the weights so worker processes share them.")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.model, dtype=args.dtype, quantize=args.quantize, mmap=args.mmap)
+    scheduler = ContinuousBatchScheduler(model, tokenizer, args.max_batch_size, args.max_queue)
+    scheduler.start()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(scheduler, args.request_timeout))
+    print(f"Serving '{args.model}' on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch_size}, queue {args.max_queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()
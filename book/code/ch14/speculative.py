@@ -0,0 +1,140 @@
+"""
+Speculative decoding with a prompt-lookup (n-gram) drafter.
+
+On CPU each decode step is dominated by streaming the model weights through
+memory, so verifying several tokens in one forward pass costs about the same
+as producing one. The drafter here is free: it looks for the most recent
+earlier occurrence of the last few tokens in the prompt + generated text and
+proposes the tokens that followed it. This works well whenever the output
+copies from the input (rewriting, summarising, code editing, lists).
+
+The target model then scores the pending token plus all draft tokens in one
+forward pass, and each draft token is accepted with the standard speculative
+sampling rule, using the same temperature / top-k / top-p warping that
+`model.generate` applies. Because the drafter's proposal is a point mass q(x) = 1, the
+rule reduces to: accept draft token d with probability p(d); on rejection,
+sample from p with d removed and renormalised. The output distribution is
+therefore exactly the temperature/top-p distribution of ordinary sampling.
+"""
+
+import torch
+from transformers import DynamicCache
+
+from prefix_cache import crop_to
+from sampling import generation_top_k, warp_probs
+
+
+def propose_prompt_lookup(tokens: list, num_draft_tokens: int, max_ngram_size: int = 3) -> list:
+    """
+    Proposes draft tokens by matching the trailing n-gram against earlier text.
+
+    Args:
+        tokens (list): Prompt plus generated token ids so far.
+        num_draft_tokens (int): Maximum number of tokens to propose.
+        max_ngram_size (int, optional): Longest suffix to match; shorter ones are tried
+            if it does not occur. Defaults to 3.
+
+    Returns:
+        list: Up to `num_draft_tokens` proposed ids, empty if nothing matches.
+    """
+    if num_draft_tokens <= 0:
+        return []
+    for n in range(min(max_ngram_size, len(tokens) - 1), 0, -1):
+        suffix = tokens[-n:]
+        # Scan backwards so the most recent occurrence wins
+        for start in range(len(tokens) - n - 1, -1, -1):
+            if tokens[start:start + n] == suffix:
+                follow = tokens[start + n:start + n + num_draft_tokens]
+                if follow:
+                    return follow
+    return []
+
+
+@torch.no_grad()
+def speculative_generate(model, input_ids: torch.Tensor, temperature: float, top_p: float,
+                         max_new_tokens: int, eos_token_ids, num_draft_tokens: int = 4,
+                         max_ngram_size: int = 3, past_key_values: DynamicCache = None):
+    """
+    Samples a completion with prompt-lookup speculative decoding.
+
+    Args:
+        model: The pre-loaded causal language model.
+        input_ids (torch.Tensor): Prompt token ids of shape (1, seq_len).
+        temperature (float): Sampling temperature.
+        top_p (float): Nucleus sampling parameter.
+        max_new_tokens (int): The maximum number of new tokens to generate.
+        eos_token_ids (set): Token ids that end the completion.
+        num_draft_tokens (int, optional): Draft tokens verified per forward pass. Defaults to 4.
+        max_ngram_size (int, optional): Longest n-gram the drafter matches. Defaults to 3.
+        past_key_values (DynamicCache, optional): KV states of a cached prompt prefix,
+            e.g. from a PrefixKVCache. Defaults to None.
+
+    Returns:
+        tuple: (generated token ids, final DynamicCache, stats dict with the draft
+        acceptance rate and the number of target forward passes).
+    """
+    device = input_ids.device
+    temperature_t = torch.tensor([temperature], device=device)
+    top_p_t = torch.tensor([top_p], device=device)
+    top_k = generation_top_k(model)  # generate() applies it implicitly, so we must too
+    tokens = input_ids[0].tolist()
+
+    # The cache always holds every token except the last one, which is "pending"
+    cache = past_key_values if past_key_values is not None else DynamicCache()
+    cached = cache.get_seq_length()
+    if cached < len(tokens) - 1:
+        model(input_ids=input_ids[:, cached:-1], past_key_values=cache, use_cache=True)
+    pending = tokens[-1]
+
+    generated = []
+    drafted = accepted = forward_passes = 0
+    while len(generated) < max_new_tokens:
+        # Leave room for the token sampled from the target at the end of the block
+        budget = min(num_draft_tokens, max_new_tokens - len(generated) - 1)
+        draft = propose_prompt_lookup(tokens, budget, max_ngram_size)
+
+        block = torch.tensor([[pending] + draft], device=device)
+        logits = model(input_ids=block, past_key_values=cache, use_cache=True).logits[0]
+        forward_passes += 1
+        probs = warp_probs(logits, temperature_t.expand(len(block[0])), top_p_t.expand(len(block[0])), top_k)
+
+        new_tokens = []
+        drafted += len(draft)
+        for i, token in enumerate(draft):
+            if torch.rand((), device=device) < probs[i, token]:
+                accepted += 1
+                new_tokens.append(token)
+                if token in eos_token_ids:
+                    break
+                continue
+            # Rejected: sample from the residual distribution p - q, i.e. p without the draft token
+            residual = probs[i].clone()
+            residual[token] = 0
+            new_tokens.append(int(torch.multinomial(residual / residual.sum(), 1)))
+            break
+        else:
+            # Every draft token was accepted, so the last position gives one extra token for free
+            new_tokens.append(int(torch.multinomial(probs[len(draft)], 1)))
+
+        # Drop KV entries of rejected draft tokens; the cache must end just before the new pending token
+        crop_to(cache, len(tokens) + len(new_tokens) - 1)
+
+        for token in new_tokens:
+            generated.append(token)
+            tokens.append(token)
+            if token in eos_token_ids or len(generated) >= max_new_tokens:
+                return generated, cache, _stats(drafted, accepted, forward_passes, len(generated))
+        pending = tokens[-1]
+
+    return generated, cache, _stats(drafted, accepted, forward_passes, len(generated))
+
+
+def _stats(drafted: int, accepted: int, forward_passes: int, generated: int) -> dict:
+    return {
+        "generated_tokens": generated,
+        "drafted_tokens": drafted,
+        "accepted_tokens": accepted,
+        "acceptance_rate": accepted / drafted if drafted else 0.0,
+        "forward_passes": forward_passes,
+        "tokens_per_forward": generated / forward_passes if forward_passes else 0.0,
+    }
@@ -1,69 +1,144 @@
+import sys
+from pathlib import Path
+
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
 
-def generate_creative_text(model, tokenizer, prompt: str, temperature: float, top_p: float, max_new_tokens: int = 150):
+from prefix_cache import PrefixKVCache
+from speculative import speculative_generate
+
+# The model loader is shared with the other chapters in book/code
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from model_loading import load_causal_lm, load_tokenizer
+
+def encode_prompt(tokenizer, prompt: str, system_prompt: str = None) -> torch.Tensor:
     """
-    Generates creative text based on a prompt with adjustable parameters.
+    Formats a single-turn prompt with the chat template and tokenizes it.
 
     Args:
-        model: The pre-loaded transformer model.
         tokenizer: The pre-loaded tokenizer.
-        prompt (str): The input text to generate from.
-        temperature (float): Controls randomness. Higher is more random.
-        top_p (float): Nucleus sampling parameter.
-        max_new_tokens (int, optional): The maximum number of new tokens to generate. Defaults to 150.
+        prompt (str): The user message.
+        system_prompt (str, optional): A fixed instruction preamble sent as the system message. Defaults to None.
 
     Returns:
-        str: The generated text, decoded.
+        torch.Tensor: Token ids of shape (1, seq_len).
     """
     messages = [
         {"role": "user", "content": prompt}
     ]
-    
+    if system_prompt:
+        messages.insert(0, {"role": "system", "content": system_prompt})
+
     # Format the input using the chat template
-    input_ids = tokenizer.apply_chat_template(
+    return tokenizer.apply_chat_template(
         messages,
         add_generation_prompt=True,
         return_tensors="pt",
+        return_dict=False,
         enable_thinking=False,  # Disable thinking mode
-    ).to(model.device)
-
-    # Generate text using the specified parameters
-    outputs = model.generate(
-        input_ids,
-        max_new_tokens=max_new_tokens,
-        do_sample=True,  # do_sample must be True to use temperature and top_p
-        temperature=temperature,
-        top_p=top_p
     )
-    
-    # Decode only the newly generated tokens, not the input prompt
-    response = outputs[0][input_ids.shape[-1]:]
-    return tokenizer.decode(response, skip_special_tokens=True)
+
+def generate_creative_text(model, tokenizer, prompt: str, temperature: float, top_p: float, max_new_tokens: int = 150,
+                           system_prompt: str = None, prefix_cache: PrefixKVCache = None,
+                           speculative: bool = False, num_draft_tokens: int = 4, return_stats: bool = False):
+    """
+    Generates creative text based on a prompt with adjustable parameters.
+
+    Args:
+        model: The pre-loaded transformer model.
+        tokenizer: The pre-loaded tokenizer.
+        prompt (str): The input text to generate from.
+        temperature (float): Controls randomness. Higher is more random.
+        top_p (float): Nucleus sampling parameter.
+        max_new_tokens (int, optional): The maximum number of new tokens to generate. Defaults to 150.
+        system_prompt (str, optional): A fixed instruction preamble sent as the system message. Defaults to None.
+        prefix_cache (PrefixKVCache, optional): If given, the KV states of the longest previously seen
+            prompt prefix are reused instead of prefilling it again, and this prompt is added to the cache.
+        speculative (bool, optional): Use prompt-lookup speculative decoding. The sampled distribution is
+            unchanged, but several tokens can be produced per forward pass. Defaults to False.
+        num_draft_tokens (int, optional): Draft tokens verified per forward pass in speculative mode. Defaults to 4.
+        return_stats (bool, optional): Also return a dict of decoding statistics, including the draft
+            acceptance rate in speculative mode. Defaults to False.
+
+    Returns:
+        str: The generated text, decoded. A (text, stats) tuple if `return_stats` is True.
+    """
+    input_ids = encode_prompt(tokenizer, prompt, system_prompt).to(model.device)
+
+    # Reuse the KV states of a shared prefix (chat header, instruction preamble) if we have them
+    past_key_values = prefix_cache.lookup(input_ids) if prefix_cache is not None else None
+
+    if speculative:
+        eos = model.generation_config.eos_token_id
+        eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos]) | {tokenizer.eos_token_id}
+        response, past_key_values, stats = speculative_generate(
+            model,
+            input_ids,
+            temperature=temperature,
+            top_p=top_p,
+            max_new_tokens=max_new_tokens,
+            eos_token_ids=eos_token_ids,
+            num_draft_tokens=num_draft_tokens,
+            past_key_values=past_key_values,
+        )
+    else:
+        # Generate text using the specified parameters
+        outputs = model.generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,  # do_sample must be True to use temperature and top_p
+            temperature=temperature,
+            top_p=top_p,
+            return_dict_in_generate=True,
+        )
+        past_key_values = outputs.past_key_values
+        # Decode only the newly generated tokens, not the input prompt
+        response = outputs.sequences[0][input_ids.shape[-1]:]
+        stats = {"generated_tokens": len(response), "forward_passes": len(response)}
+
+    if prefix_cache is not None:
+        prefix_cache.store(input_ids, past_key_values)
+
+    text = tokenizer.decode(response, skip_special_tokens=True)
+    return (text, stats) if return_stats else text
+
+MODEL_NAME = "Qwen/Qwen3-0.6B"
+
+def load_model(model_name: str = MODEL_NAME, dtype: str = "best", quantize: str = None, mmap: bool = False):
+    """
+    Loads the model and tokenizer through the shared CPU-friendly loader.
+
+    Args:
+        model_name (str, optional): Hugging Face model id or local path. Defaults to MODEL_NAME.
+        dtype (str, optional): "best" picks bfloat16 on CUDA and on CPUs with native bf16 support,
+            float32 otherwise; "auto" keeps the checkpoint dtype. Defaults to "best".
+        quantize (str, optional): "int8" for dynamic int8 quantization of the Linear layers (CPU only). Defaults to None.
+        mmap (bool, optional): Memory-map the safetensors weights so several worker processes share one copy
+            (CPU only). Defaults to False.
+
+    Returns:
+        tuple: The loaded (model, tokenizer).
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    options = f"dtype '{dtype}'" + (f", quantize '{quantize}'" if quantize else "") + (", mmap" if mmap else "")
+    print(f"Loading model '{model_name}' on '{device}' with {options}...")
+
+    tokenizer = load_tokenizer(model_name)
+    model = load_causal_lm(model_name, device=device, dtype=dtype, quantize=quantize, mmap=mmap)
+    return model, tokenizer
 
 # Main execution block
 if __name__ == "__main__":
     # 1. Model and Tokenizer Loading
-    MODEL_NAME = "Qwen/Qwen3-0.6B"
-    
-    # Check for CUDA and bfloat16 support
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    torch_dtype = "auto"
-    if device == "cuda":
-        # The prompt specifically requests bfloat16 for CUDA devices
-        torch_dtype = torch.bfloat16
-
-    print(f"Loading model '{MODEL_NAME}' on '{device}' with dtype '{torch_dtype}'...")
-    
     try:
-        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-        model = AutoModelForCausalLM.from_pretrained(
-            MODEL_NAME,
-            torch_dtype=torch_dtype,
-            device_map=device
-        )
+        model, tokenizer = load_model(MODEL_NAME)
         print("Model and tokenizer loaded successfully.")
 
+        # Both examples share this instruction preamble, so its KV states are computed only once
+        system_prompt = "你是一位富有想象力的中文创意写作助手，擅长写故事开头、广告语和短诗。请用简洁生动的中文回答。"
+        prefix_cache = PrefixKVCache(max_bytes=256 * 1024 * 1024)
+
         # 4. Calling examples
         print("\n" + "="*50)
         print("Running creative text generation examples...")
@@ -83,7 +158,9 @@ if __name__ == "__main__":
             prompt=prompt1,
             temperature=temp1,
             top_p=top_p1,
-            max_new_tokens=100
+            max_new_tokens=100,
+            system_prompt=system_prompt,
+            prefix_cache=prefix_cache
         )
         
         print("\n>>> Generated Text:")
@@ -103,11 +180,41 @@ if __name__ == "__main__":
             prompt=prompt2,
             temperature=temp2,
             top_p=top_p2,
-            max_new_tokens=30
+            max_new_tokens=30,
+            system_prompt=system_prompt,
+            prefix_cache=prefix_cache
         )
         
         print("\n>>> Generated Text:")
         print(generated_text2)
+
+        # Example 3: Rewrite a passage with speculative decoding
+        # The answer copies many phrases from the prompt, which is exactly what the prompt-lookup drafter exploits
+        prompt3 = "请把下面这段话改写得更正式一些：我们的AI工具DevDoctor能自动找到代码里的bug，然后自动把bug修好，用起来特别省事。"
+        temp3 = 0.7
+        top_p3 = 0.9
+        print(f"\n--- Example 3: Rewriting with Speculative Decoding ---")
+        print(f"Prompt: {prompt3}")
+        print(f"Settings: temperature={temp3}, top_p={top_p3}, speculative=True")
+
+        generated_text3, stats3 = generate_creative_text(
+            model=model,
+            tokenizer=tokenizer,
+            prompt=prompt3,
+            temperature=temp3,
+            top_p=top_p3,
+            max_new_tokens=80,
+            system_prompt=system_prompt,
+            prefix_cache=prefix_cache,
+            speculative=True,
+            return_stats=True
+        )
+
+        print("\n>>> Generated Text:")
+        print(generated_text3)
+        print(f"Draft acceptance rate: {stats3['acceptance_rate']:.0%}, "
+              f"tokens per forward pass: {stats3['tokens_per_forward']:.2f}")
+        print(f"\nPrefix cache: {prefix_cache.stats()}")
         print("\n" + "="*50)
         print("Script finished.")
 
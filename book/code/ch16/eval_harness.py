@@ -0,0 +1,230 @@
+"""
+策略模型与参考模型的批量对比评估。
+
+vibe.py 末尾的“效果对比”只拿一个提示词、先后各调用一次 generate。要在几百条
+留出 (held-out) 提示词上评估对齐效果，逐条生成比训练本身还慢。本模块：
+
+1.  **批量生成**：提示词按长度排序后左填充 (left padding) 组批，两个模型各自批量生成；
+2.  **隐式奖励打分**：DPO 训练出的策略模型自带一个隐式奖励
+    r(x, y) = β · (log π(y|x) − log π_ref(y|x))。对每个提示词，两个模型的回答都用它打分，
+    策略模型回答的奖励更高即记为一次“胜出”，得到胜率代理指标和平均奖励差；
+3.  **长度统计**：DPO 常见的副作用是回答变长，因此同时报告两边回答的 token 长度；
+4.  **对照报告**：逐条结果写入 `results.jsonl`，汇总与并排对照写入 `report.md`。
+
+用法示例：
+    python vibe.py --eval-prompts heldout.txt --eval-batch-size 16
+"""
+
+import contextlib
+import json
+import os
+import statistics
+
+import torch
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+def load_eval_prompts(path: str) -> list:
+    """读取评估提示词：.txt 每行一条，.jsonl 每行一个含 "prompt" 字段的对象。"""
+    prompts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            prompts.append(json.loads(line)["prompt"] if path.endswith(".jsonl") else line)
+    if not prompts:
+        raise ValueError(f"No prompts found in {path}")
+    return prompts
+
+
+def encode_chat_prompts(tokenizer, prompts: list) -> list:
+    """按与 vibe.py 相同的聊天模板（关闭 thinking 模式）把提示词编码成 token id 列表。"""
+    encoded = []
+    for prompt in prompts:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        text = tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True, enable_thinking=False
+        )
+        encoded.append(tokenizer(text, add_special_tokens=False)["input_ids"])
+    return encoded
+
+
+def _length_sorted_batches(sequences: list, batch_size: int):
+    """按长度排序后切批，长度相近的序列放在一起，减少填充。产出原始下标列表。"""
+    order = sorted(range(len(sequences)), key=lambda i: len(sequences[i]), reverse=True)
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def _pad(sequences: list, pad_id: int, side: str, device):
+    width = max(len(seq) for seq in sequences)
+    input_ids = torch.full((len(sequences), width), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+    for row, seq in enumerate(sequences):
+        if side == "left":
+            input_ids[row, width - len(seq):] = torch.tensor(seq)
+            attention_mask[row, width - len(seq):] = 1
+        else:
+            input_ids[row, :len(seq)] = torch.tensor(seq)
+            attention_mask[row, :len(seq)] = 1
+    return input_ids.to(device), attention_mask.to(device)
+
+
+@torch.no_grad()
+def batch_generate(model, tokenizer, prompt_ids: list, batch_size: int, max_new_tokens: int) -> list:
+    """
+    左填充批量贪心生成，返回每个提示词对应的回答 token id（截止到第一个结束符，含结束符）。
+
+    评估用贪心解码，使两个模型的对比不受采样随机性影响。
+    """
+    eos_ids = {tokenizer.eos_token_id, tokenizer.pad_token_id}
+    responses = [None] * len(prompt_ids)
+    for indices in _length_sorted_batches(prompt_ids, batch_size):
+        input_ids, attention_mask = _pad([prompt_ids[i] for i in indices], tokenizer.pad_token_id, "left", model.device)
+        output = model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id,
+        )
+        for row, index in enumerate(indices):
+            tokens = output[row, input_ids.shape[1]:].tolist()
+            for end, token in enumerate(tokens):
+                if token in eos_ids:
+                    tokens = tokens[:end + 1]
+                    break
+            responses[index] = tokens
+    return responses
+
+
+@torch.no_grad()
+def batch_response_logps(model, prompt_ids: list, response_ids: list, pad_id: int, batch_size: int) -> list:
+    """批量计算 log π(response | prompt)，即回答部分每个 token 对数概率之和。"""
+    logps = [0.0] * len(prompt_ids)
+    sequences = [p + r for p, r in zip(prompt_ids, response_ids)]
+    for indices in _length_sorted_batches(sequences, batch_size):
+        input_ids, attention_mask = _pad([sequences[i] for i in indices], pad_id, "right", model.device)
+        logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+        for row, index in enumerate(indices):
+            start, end = len(prompt_ids[index]), len(sequences[index])
+            if end == start:
+                continue
+            # 第 t 个位置的 logits 预测第 t+1 个 token；逐行做 log_softmax，避免整批词表大小的副本
+            row_logps = logits[row, start - 1:end - 1].float().log_softmax(-1)
+            targets = input_ids[row, start:end]
+            logps[index] = row_logps.gather(-1, targets.unsqueeze(-1)).sum().item()
+    return logps
+
+
+def evaluate_models(policy_model, ref_model, tokenizer, prompts: list, beta: float, batch_size: int = 8,
+                    max_new_tokens: int = 100, ref_context=None) -> list:
+    """
+    在一批提示词上对比策略模型与参考模型。
+
+    Args:
+        policy_model: DPO 训练后的策略模型。
+        ref_model: 参考模型（训练前的原始模型）。
+        tokenizer: 分词器。
+        prompts (list): 评估提示词。
+        beta (float): 训练时的 DPO beta，用于换算隐式奖励。
+        batch_size (int, optional): 生成与打分的批大小。默认 8。
+        max_new_tokens (int, optional): 每条回答的最大生成长度。默认 100。
+        ref_context (callable, optional): 运行参考模型时进入的上下文，例如 LoRA 模式下
+            传入 `policy_model.disable_adapter`（此时 ref_model 与 policy_model 是同一个对象）。
+
+    Returns:
+        list: 每个提示词一条字典，包含两边的回答、长度与隐式奖励。
+    """
+    ref_context = ref_context or contextlib.nullcontext
+    policy_model.eval()  # 训练结束后模型仍处于 train 模式，dropout 会干扰打分
+    ref_model.eval()
+    pad_id = tokenizer.pad_token_id
+    prompt_ids = encode_chat_prompts(tokenizer, prompts)
+
+    print(f"Generating {len(prompts)} responses per model (batch size {batch_size})...")
+    policy_responses = batch_generate(policy_model, tokenizer, prompt_ids, batch_size, max_new_tokens)
+    with ref_context():
+        ref_responses = batch_generate(ref_model, tokenizer, prompt_ids, batch_size, max_new_tokens)
+
+    # 两个回答都要在两个模型下各打一次分：r = β · (log π − log π_ref)
+    print("Scoring responses under both models...")
+    scores = {}
+    for side, responses in (("policy", policy_responses), ("ref", ref_responses)):
+        policy_logps = batch_response_logps(policy_model, prompt_ids, responses, pad_id, batch_size)
+        with ref_context():
+            ref_logps = batch_response_logps(ref_model, prompt_ids, responses, pad_id, batch_size)
+        scores[side] = [beta * (p - r) for p, r in zip(policy_logps, ref_logps)]
+
+    results = []
+    for i, prompt in enumerate(prompts):
+        results.append({
+            "prompt": prompt,
+            "policy_response": tokenizer.decode(policy_responses[i], skip_special_tokens=True).strip(),
+            "ref_response": tokenizer.decode(ref_responses[i], skip_special_tokens=True).strip(),
+            "policy_tokens": len(policy_responses[i]),
+            "ref_tokens": len(ref_responses[i]),
+            "policy_reward": scores["policy"][i],
+            "ref_reward": scores["ref"][i],
+            "reward_margin": scores["policy"][i] - scores["ref"][i],
+        })
+    return results
+
+
+def summarize(results: list) -> dict:
+    """汇总胜率代理指标、平均奖励差与长度统计。"""
+    margins = [r["reward_margin"] for r in results]
+    policy_lengths = [r["policy_tokens"] for r in results]
+    ref_lengths = [r["ref_tokens"] for r in results]
+    return {
+        "num_prompts": len(results),
+        "win_rate": sum(m > 0 for m in margins) / len(margins),
+        "tie_rate": sum(m == 0 for m in margins) / len(margins),
+        "mean_reward_margin": statistics.fmean(margins),
+        "policy_mean_tokens": statistics.fmean(policy_lengths),
+        "policy_median_tokens": statistics.median(policy_lengths),
+        "ref_mean_tokens": statistics.fmean(ref_lengths),
+        "ref_median_tokens": statistics.median(ref_lengths),
+    }
+
+
+def _cell(text: str) -> str:
+    return text.replace("|", "\\|").replace("\n", "<br>")
+
+
+def write_report(results: list, output_dir: str) -> dict:
+    """把逐条结果写入 results.jsonl，并排对照报告写入 report.md，返回汇总指标。"""
+    os.makedirs(output_dir, exist_ok=True)
+    summary = summarize(results)
+    with open(os.path.join(output_dir, "results.jsonl"), "w", encoding="utf-8") as f:
+        for row in results:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    lines = [
+        "# DPO policy vs reference",
+        "",
+        "| metric | value |",
+        "| --- | --- |",
+        f"| prompts | {summary['num_prompts']} |",
+        f"| win rate (policy reward > ref reward) | {summary['win_rate']:.1%} |",
+        f"| tie rate | {summary['tie_rate']:.1%} |",
+        f"| mean reward margin | {summary['mean_reward_margin']:.4f} |",
+        f"| policy tokens (mean / median) | {summary['policy_mean_tokens']:.1f} / {summary['policy_median_tokens']:.0f} |",
+        f"| ref tokens (mean / median) | {summary['ref_mean_tokens']:.1f} / {summary['ref_median_tokens']:.0f} |",
+        "",
+        "| # | prompt | reference | DPO policy | margin |",
+        "| --- | --- | --- | --- | --- |",
+    ]
+    for i, row in enumerate(results, 1):
+        lines.append(
+            f"| {i} | {_cell(row['prompt'])} | {_cell(row['ref_response'])} | "
+            f"{_cell(row['policy_response'])} | {row['reward_margin']:+.3f} |"
+        )
+    with open(os.path.join(output_dir, "report.md"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return summary
@@ -0,0 +1,127 @@
+"""
+大规模偏好数据集的数据准备阶段。
+
+脚本里演示用的三条样本可以直接写成 Python 列表，但真实的偏好数据往往有数百万对，
+既放不进一个列表，也不该每次训练都重新分词。本模块负责：
+
+1.  **分片读取**：从本地 JSONL / Parquet 分片中流式读取 prompt / chosen / rejected 三元组，
+    由 `datasets` 逐块写成内存映射的 Arrow 文件，数据不会整体进入 Python 内存；
+2.  **并行计算长度**：用多进程分词得到每个样本训练时的长度，结果同样缓存在 Arrow 文件中，
+    再次运行时直接复用；
+3.  **按长度分桶**：生成 `length` 列，配合 `DPOConfig(group_by_length=True)`，
+    让长度相近的样本落在同一个批次里，减少填充 (padding) 浪费的计算。
+
+注意：这里的分词只用来得到长度，token id 随即丢弃。DPOTrainer 无论输入里有没有
+token id 列，都会在 `_prepare_dataset` 中对 prompt / chosen / rejected 重新分词
+（同样多进程并缓存，见 `dataset_num_proc`），所以整个流程会分词两次。
+
+用法示例：
+    python vibe.py --data "data/prefs-*.jsonl" --num-proc 8
+"""
+
+import glob
+import os
+
+from datasets import load_dataset
+
+LENGTH_COLUMN = "length"
+REQUIRED_COLUMNS = ("prompt", "chosen", "rejected")
+
+
+def resolve_shards(patterns) -> list:
+    """把若干路径或通配符展开成排好序的分片文件列表。"""
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    files = sorted({path for pattern in patterns for path in glob.glob(os.path.expanduser(pattern))})
+    if not files:
+        raise FileNotFoundError(f"No preference shards match: {patterns}")
+    return files
+
+
+def load_preference_shards(patterns, cache_dir: str = None):
+    """
+    读取 JSONL 或 Parquet 格式的偏好数据分片。
+
+    Args:
+        patterns (str | list): 分片路径或通配符，例如 "data/prefs-*.parquet"。
+        cache_dir (str, optional): Arrow 缓存目录，默认使用 datasets 的全局缓存。
+
+    Returns:
+        datasets.Dataset: 只保留 prompt / chosen / rejected 三列、由 Arrow 文件支撑的数据集。
+    """
+    files = resolve_shards(patterns)
+    suffixes = {os.path.splitext(path)[1].lower() for path in files}
+    if suffixes <= {".jsonl", ".json"}:
+        builder = "json"
+    elif suffixes == {".parquet"}:
+        builder = "parquet"
+    else:
+        raise ValueError(f"Shards must be all JSONL or all Parquet, got: {sorted(suffixes)}")
+
+    dataset = load_dataset(builder, data_files=files, split="train", cache_dir=cache_dir)
+    missing = [name for name in REQUIRED_COLUMNS if name not in dataset.column_names]
+    if missing:
+        raise ValueError(f"Preference shards are missing columns: {missing}")
+    return dataset.select_columns(list(REQUIRED_COLUMNS))
+
+
+def add_length_column(dataset, tokenizer, max_prompt_length: int, max_length: int, num_proc: int = None):
+    """
+    并行分词并计算每个样本在训练时的实际长度，写入 `length` 列。
+
+    长度按 DPOTrainer 的截断规则估算：prompt 截断到 max_prompt_length，
+    加上较长的那个回答（含结束符），总长不超过 max_length。
+
+    只保留长度、不保留 token id：DPOTrainer 不接受预先分好词的数据，
+    训练时仍会自己再分词一遍，存下 token id 只会让 Arrow 缓存多占一份空间。
+    """
+
+    def compute_lengths(batch):
+        prompt = tokenizer(batch["prompt"], add_special_tokens=False)["input_ids"]
+        chosen = tokenizer(batch["chosen"], add_special_tokens=False)["input_ids"]
+        rejected = tokenizer(batch["rejected"], add_special_tokens=False)["input_ids"]
+        lengths = []
+        for p, c, r in zip(prompt, chosen, rejected):
+            prompt_len = min(len(p), max_prompt_length)
+            lengths.append(min(prompt_len + max(len(c), len(r)) + 1, max_length))
+        return {LENGTH_COLUMN: lengths}
+
+    return dataset.map(
+        compute_lengths,
+        batched=True,
+        batch_size=1000,
+        num_proc=num_proc,
+        desc="Tokenizing preference pairs",
+    )
+
+
+def padding_ratio(dataset, batch_size: int, group_size: int = None, seed: int = 42) -> float:
+    """
+    估算一个 epoch 中填充 token 占全部 token 的比例，用于比较分桶前后的效果。
+
+    Args:
+        batch_size (int): 每个设备上一个批次的样本数（同一批次内才会相互填充）。
+        group_size (int, optional): 按长度分桶时的分组大小，与 Trainer 一致取
+            batch_size × gradient_accumulation_steps；为 None 时按随机打乱的顺序估算。
+    """
+    import numpy as np
+    import torch
+    from transformers.trainer_pt_utils import LengthGroupedSampler
+
+    # 直接取 Arrow 列对应的 NumPy 数组，不逐个转换成 Python 整数
+    lengths = dataset.with_format("numpy")[LENGTH_COLUMN][:]
+    if len(lengths) == 0:
+        return 0.0
+    generator = torch.Generator().manual_seed(seed)
+    if group_size:
+        order = np.fromiter(LengthGroupedSampler(group_size, lengths=lengths, generator=generator),
+                            dtype=np.int64, count=len(lengths))
+    else:
+        order = torch.randperm(len(lengths), generator=generator).numpy()
+
+    # 按批次切分后，用 reduceat 一次求出每个批次的最大长度
+    ordered = lengths[order]
+    starts = np.arange(0, len(ordered), batch_size)
+    sizes = np.diff(np.append(starts, len(ordered)))
+    padded = int((np.maximum.reduceat(ordered, starts) * sizes).sum())
+    return 1 - int(ordered.sum()) / padded
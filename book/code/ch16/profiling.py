@@ -0,0 +1,290 @@
+"""
+DPO 训练过程的吞吐与内存剖析。
+
+`dpo_trainer.train()` 默认每 10 步只打印一次损失，看不出时间花在了哪里。
+`TrainingProfiler` 是一个 `TrainerCallback`，在每个优化步记录：
+
+1.  **步耗时与吞吐**：一步（含全部梯度累积的微批次）的墙钟时间、tokens/sec，
+    以及批次中填充 token 的占比；
+2.  **时间分解**：策略模型前向、参考模型前向（无梯度）、反向传播、优化器更新，
+    剩余部分记为 other（数据加载、损失计算、梯度裁剪等）；
+3.  **内存**：进程 RSS 峰值，以及 CUDA / MPS 分配器的统计。
+
+结果写入 `profile.json`（逐步明细 + 汇总）和 `phases.trace.json`
+（Chrome trace 格式，可在 chrome://tracing 或 https://ui.perfetto.dev 中打开）。
+另外可以指定一个步数区间，用 `torch.profiler` 录制算子级别的 trace。
+
+用法示例：
+    python vibe.py --profile ./profile --profile-steps 3-5
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+
+import torch
+from transformers import TrainerCallback
+
+from model_loading import current_rss_mb
+
+PHASES = ("forward", "ref_forward", "backward", "optimizer")
+
+
+def parse_step_window(spec: str):
+    """把 "3-5" 或 "4" 解析成闭区间 (3, 5) / (4, 4)。"""
+    if not spec:
+        return None
+    start, _, end = spec.partition("-")
+    start, end = int(start), int(end or start)
+    if start < 1 or end < start:
+        raise ValueError(f"Invalid profile step window: {spec!r}")
+    return start, end
+
+
+def peak_rss_mb() -> float:
+    """进程启动以来的 RSS 峰值（MiB）。"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KiB，macOS 上是字节
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def allocator_stats(device: str) -> dict:
+    """当前设备分配器的统计（MiB）；CPU 上没有独立的分配器统计，只看 RSS。"""
+    if device == "cuda":
+        return {
+            "allocated_mb": torch.cuda.memory_allocated() / 2**20,
+            "peak_allocated_mb": torch.cuda.max_memory_allocated() / 2**20,
+            "reserved_mb": torch.cuda.memory_reserved() / 2**20,
+        }
+    if device == "mps":
+        return {
+            "allocated_mb": torch.mps.current_allocated_memory() / 2**20,
+            "driver_allocated_mb": torch.mps.driver_allocated_memory() / 2**20,
+        }
+    return {}
+
+
+def synchronize(device: str):
+    """GPU 上的内核是异步执行的，计时前必须等它们跑完。"""
+    if device == "cuda":
+        torch.cuda.synchronize()
+    elif device == "mps":
+        torch.mps.synchronize()
+
+
+class TrainingProfiler(TrainerCallback):
+    """
+    记录每个优化步的耗时分解、吞吐和内存。
+
+    回调本身拿不到前向和反向的时间点，所以需要在创建训练器之后调用 `attach(trainer)`：
+    它在模型上注册前向钩子，并包装 `trainer.accelerator.backward`。
+
+    Args:
+        output_dir (str): 结果输出目录。
+        profile_steps (tuple, optional): 用 torch.profiler 录制的步数闭区间，例如 (3, 5)。
+        device (str, optional): 训练所在设备，用于同步和读取分配器统计。默认 "cpu"。
+    """
+
+    def __init__(self, output_dir: str, profile_steps: tuple = None, device: str = "cpu"):
+        self.output_dir = output_dir
+        self.profile_steps = profile_steps
+        self.device = device
+        self.steps = []
+        self.trace_events = []
+        self._origin = time.perf_counter()
+        self._step = None
+        self._open = {}
+        self._torch_profiler = None
+        self._hooks = []
+
+    # --- 挂载到训练器 ---
+
+    def attach(self, trainer):
+        """注册前向钩子并包装反向传播；返回 self，便于链式调用。"""
+        models = [trainer.model]
+        if getattr(trainer, "ref_model", None) is not None:
+            models.append(trainer.ref_model)
+        for model in models:
+            self._hooks.append(model.register_forward_pre_hook(self._forward_start, with_kwargs=True))
+            self._hooks.append(model.register_forward_hook(self._forward_end))
+
+        backward = trainer.accelerator.backward
+
+        def timed_backward(loss, **kwargs):
+            self._begin("backward")
+            try:
+                return backward(loss, **kwargs)
+            finally:
+                self._end("backward")
+
+        trainer.accelerator.backward = timed_backward
+        return self
+
+    def _forward_start(self, module, args, kwargs):
+        # 参考模型（或 LoRA 模式下关闭适配器的同一个模型）在 no_grad 下前向
+        phase = "forward" if torch.is_grad_enabled() else "ref_forward"
+        self._begin(phase)
+        if phase == "forward" and self._step is not None:
+            attention_mask = kwargs.get("attention_mask")
+            input_ids = kwargs.get("input_ids", args[0] if args else None)
+            if attention_mask is not None:
+                self._step["tokens"] += int(attention_mask.sum())
+                self._step["padded_tokens"] += attention_mask.numel()
+            elif input_ids is not None:
+                self._step["tokens"] += input_ids.numel()
+                self._step["padded_tokens"] += input_ids.numel()
+
+    def _forward_end(self, module, args, output):
+        self._end("forward" if torch.is_grad_enabled() else "ref_forward")
+
+    def _begin(self, phase: str):
+        synchronize(self.device)
+        self._open[phase] = time.perf_counter()
+
+    def _end(self, phase: str):
+        start = self._open.pop(phase, None)
+        if start is None:
+            return
+        synchronize(self.device)
+        end = time.perf_counter()
+        if self._step is not None:
+            self._step["phases"][phase] += end - start
+        self._trace(phase, start, end, tid=1)
+
+    def _trace(self, name: str, start: float, end: float, tid: int):
+        self.trace_events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": tid,
+        })
+
+    # --- 训练器回调 ---
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        if self.device == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+        if self.profile_steps and self.profile_steps[0] == 1:
+            self._start_torch_profiler()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        synchronize(self.device)
+        self._step = {
+            "step": state.global_step + 1,
+            "start": time.perf_counter(),
+            "tokens": 0,
+            "padded_tokens": 0,
+            "phases": defaultdict(float),
+        }
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self._begin("optimizer")
+
+    def on_optimizer_step(self, args, state, control, **kwargs):
+        self._end("optimizer")
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self._step is None:
+            return
+        synchronize(self.device)
+        end = time.perf_counter()
+        step, self._step = self._step, None
+        wall = end - step["start"]
+        phases = {name: step["phases"].get(name, 0.0) for name in PHASES}
+        phases["other"] = max(wall - sum(phases.values()), 0.0)
+        self.steps.append({
+            "step": step["step"],
+            "wall_sec": wall,
+            "tokens": step["tokens"],
+            "tokens_per_sec": step["tokens"] / wall if wall > 0 else 0.0,
+            "padding_ratio": 1 - step["tokens"] / step["padded_tokens"] if step["padded_tokens"] else 0.0,
+            "phases_sec": phases,
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+            **allocator_stats(self.device),
+        })
+        self._trace(f"step {step['step']}", step["start"], end, tid=0)
+
+        if self.profile_steps:
+            if step["step"] == self.profile_steps[0] - 1:
+                self._start_torch_profiler()
+            elif step["step"] == self.profile_steps[1]:
+                self._stop_torch_profiler()
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self._stop_torch_profiler()
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+        self.save()
+        self.print_summary()
+
+    # --- torch.profiler 窗口 ---
+
+    def _start_torch_profiler(self):
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.device == "cuda":
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._torch_profiler = torch.profiler.profile(
+            activities=activities,
+            record_shapes=True,
+            profile_memory=True,
+        )
+        self._torch_profiler.start()
+
+    def _stop_torch_profiler(self):
+        if self._torch_profiler is None:
+            return
+        self._torch_profiler.stop()
+        os.makedirs(self.output_dir, exist_ok=True)
+        start, end = self.profile_steps
+        path = os.path.join(self.output_dir, f"torch_profiler_steps_{start}-{end}.trace.json")
+        self._torch_profiler.export_chrome_trace(path)
+        self._torch_profiler = None
+        print(f"torch.profiler trace written to {path}")
+
+    # --- 输出 ---
+
+    def summary(self) -> dict:
+        """汇总各步的均值；第一步包含预热开销，步数足够时不计入。"""
+        steps = self.steps[1:] if len(self.steps) > 1 else self.steps
+        if not steps:
+            return {}
+        total_wall = sum(s["wall_sec"] for s in steps)
+        phase_totals = {name: sum(s["phases_sec"][name] for s in steps) for name in (*PHASES, "other")}
+        return {
+            "measured_steps": len(steps),
+            "mean_step_sec": total_wall / len(steps),
+            "tokens_per_sec": sum(s["tokens"] for s in steps) / total_wall if total_wall > 0 else 0.0,
+            "mean_padding_ratio": sum(s["padding_ratio"] for s in steps) / len(steps),
+            "phase_share": {name: t / total_wall if total_wall > 0 else 0.0 for name, t in phase_totals.items()},
+            "peak_rss_mb": max(s["peak_rss_mb"] for s in self.steps),
+            **({"peak_allocated_mb": max(s["peak_allocated_mb"] for s in self.steps)} if self.device == "cuda" else {}),
+        }
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, "profile.json"), "w", encoding="utf-8") as f:
+            json.dump({"device": self.device, "summary": self.summary(), "steps": self.steps}, f, indent=2)
+        with open(os.path.join(self.output_dir, "phases.trace.json"), "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, f)
+        print(f"Profile written to {self.output_dir}")
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print(f"\n--- Training profile ({summary['measured_steps']} steps, first step excluded as warm-up) ---")
+        print(f"step time: {summary['mean_step_sec'] * 1000:.1f} ms, "
+              f"throughput: {summary['tokens_per_sec']:.1f} tokens/sec, "
+              f"padding: {summary['mean_padding_ratio']:.1%}")
+        print("time breakdown: " + ", ".join(f"{name} {share:.1%}" for name, share in summary["phase_share"].items()))
+        memory = f"peak RSS: {summary['peak_rss_mb']:.0f} MiB"
+        if "peak_allocated_mb" in summary:
+            memory += f", peak CUDA allocated: {summary['peak_allocated_mb']:.0f} MiB"
+        print(memory)
@@ -0,0 +1,155 @@
+"""
+预先计算并缓存参考模型 (reference model) 的对数概率。
+
+DPO 损失只需要参考模型在每个样本上的两个数：chosen 回答与 rejected 回答的
+对数概率。参考模型在训练中是冻结的，所以这两个数在整个训练过程中都不会变。
+因此可以先只加载参考模型，把整个偏好数据集跑一遍，把结果存到磁盘，
+然后释放参考模型，再加载策略模型进行训练：
+
+1.  内存峰值只有一份模型，而不是策略模型 + 参考模型两份；
+2.  每个训练步少了一次参考模型的前向计算；
+3.  再次训练同一份数据时直接读取磁盘缓存，连这一遍也省掉了。
+
+缓存目录中保存一个 Arrow 数据集（两列 `ref_chosen_logps` / `ref_rejected_logps`）
+和一个 `meta.json`，其中的指纹由模型名、长度截断参数和数据集内容共同决定，
+任何一项变化都会让旧缓存失效。
+
+本模块按 trl 0.x 的 DPOTrainer 编写：批次里带有这两列时训练器直接使用它们，
+`compute_ref_log_probs(batch)` 对一个填充好的批次计算参考对数概率。trl 1.x 改写了
+偏好数据的处理流程，也自带参考对数概率的缓存；`check_trl_support` 在这种版本上直接报错。
+"""
+
+import dataclasses
+import gc
+import hashlib
+import inspect
+import json
+import os
+
+import torch
+import trl
+from datasets import Dataset, concatenate_datasets, load_from_disk
+from torch.utils.data import DataLoader
+from trl import DPOConfig, DPOTrainer
+
+REF_COLUMNS = ("ref_chosen_logps", "ref_rejected_logps")
+
+
+def check_trl_support():
+    """已安装的 trl 不支持外部缓存的参考对数概率时抛出 RuntimeError。"""
+    params = list(inspect.signature(DPOTrainer.compute_ref_log_probs).parameters)
+    fields = {f.name for f in dataclasses.fields(DPOConfig)}
+    if params != ["self", "batch"] or "max_prompt_length" not in fields:
+        raise RuntimeError(
+            f"--ref-logps-cache needs the trl 0.x DPOTrainer (compute_ref_log_probs(batch)); "
+            f"installed trl {trl.__version__} is not supported. With trl>=1.0 set "
+            f"precompute_ref_log_probs=True instead, which caches the log-probs in the datasets cache."
+        )
+
+
+def dataset_fingerprint(dataset: Dataset, model_name: str, dpo_config: DPOConfig, model) -> str:
+    """根据模型（含精度与设备类型）、截断长度和数据内容计算缓存指纹。"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        "model": model_name,
+        # 同一模型在 GPU 上用 float16、在 CPU 上用 bfloat16/float32 计算，对数概率并不相同
+        "dtype": str(model.dtype),
+        "device": model.device.type,
+        "max_prompt_length": dpo_config.max_prompt_length,
+        "max_length": dpo_config.max_length,
+        "num_rows": len(dataset),
+    }, sort_keys=True).encode("utf-8"))
+    # 按批遍历，避免把百万级数据集一次性读入 Python 列表
+    for batch in dataset.select_columns(["prompt", "chosen", "rejected"]).iter(batch_size=10_000):
+        digest.update(json.dumps(batch, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_ref_logps(cache_dir: str, fingerprint: str):
+    """读取缓存；目录不存在或指纹不匹配时返回 None。"""
+    meta_file = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, encoding="utf-8") as f:
+        if json.load(f).get("fingerprint") != fingerprint:
+            return None
+    return load_from_disk(os.path.join(cache_dir, "logps"))
+
+
+def compute_ref_logps(ref_model, tokenizer, dataset: Dataset, dpo_config: DPOConfig) -> Dataset:
+    """
+    用参考模型把数据集完整跑一遍，返回只含两列参考对数概率的数据集（行顺序与输入一致）。
+
+    分词、截断、填充和对数概率的计算都交给 DPOTrainer（它的 `train_dataset`、`data_collator`
+    和 `compute_ref_log_probs`），保证与正式训练完全一致；前向计算的循环在这里显式执行。
+    """
+    check_trl_support()
+    # 开启预计算时 DPOTrainer 不会再复制一份参考模型，ref_model=None 表示用传入的 model 本身计算
+    scoring_config = dataclasses.replace(dpo_config, precompute_ref_log_probs=True)
+    scorer = DPOTrainer(
+        model=ref_model,
+        ref_model=None,
+        args=scoring_config,
+        train_dataset=dataset,
+        processing_class=tokenizer,
+    )
+    loader = DataLoader(
+        scorer.train_dataset,
+        batch_size=dpo_config.precompute_ref_batch_size or dpo_config.per_device_train_batch_size,
+        collate_fn=scorer.data_collator,
+        shuffle=False,
+    )
+    device = scorer.accelerator.device
+    chosen, rejected = [], []
+    for batch in loader:
+        batch = {k: v.to(device) if torch.is_tensor(v) else v for k, v in batch.items()}
+        chosen_logps, rejected_logps = scorer.compute_ref_log_probs(batch)
+        chosen.append(chosen_logps.float().cpu())
+        rejected.append(rejected_logps.float().cpu())
+    del scorer
+
+    logps = Dataset.from_dict({
+        "ref_chosen_logps": torch.cat(chosen).numpy(),
+        "ref_rejected_logps": torch.cat(rejected).numpy(),
+    })
+    if len(logps) != len(dataset):
+        raise RuntimeError(f"DPOTrainer produced {len(logps)} reference log-probs for {len(dataset)} rows")
+    return logps
+
+
+def mark_ref_logps_precomputed(trainer: DPOTrainer):
+    """
+    告诉训练器数据集里已经带有参考对数概率，跳过 `get_train_dataloader` 中的预计算。
+
+    trl 0.x 没有公开的开关，只能设置训练器的内部标志；标志不存在时直接报错，
+    否则训练器会重新计算并与已有的两列冲突。
+    """
+    if not hasattr(trainer, "_precomputed_train_ref_log_probs"):
+        raise RuntimeError(
+            f"DPOTrainer in trl {trl.__version__} has no _precomputed_train_ref_log_probs flag; "
+            f"cached reference log-probs cannot be used with this version"
+        )
+    trainer._precomputed_train_ref_log_probs = True
+
+
+def save_ref_logps(cache_dir: str, fingerprint: str, logps: Dataset):
+    """把参考对数概率写入缓存目录。"""
+    os.makedirs(cache_dir, exist_ok=True)
+    logps.save_to_disk(os.path.join(cache_dir, "logps"))
+    with open(os.path.join(cache_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "num_rows": len(logps)}, f)
+
+
+def attach_ref_logps(dataset: Dataset, logps: Dataset) -> Dataset:
+    """把缓存的两列参考对数概率按列拼接到偏好数据集上（Arrow 层面拼接，不复制数据）。"""
+    existing = [name for name in REF_COLUMNS if name in dataset.column_names]
+    return concatenate_datasets([dataset.remove_columns(existing), logps], axis=1)
+
+
+def release_memory():
+    """在删除模型的所有引用之后调用，尽快归还内存（包括 GPU/MPS 显存）。"""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if torch.backends.mps.is_available():
+        torch.mps.empty_cache()
@@ -1,86 +1,180 @@
 # 请在运行 Python 脚本的终端中，执行以下命令：
 # export PYTORCH_ENABLE_MPS_FALLBACK=1
 
+import argparse
+import contextlib
 import os
+import sys
+from pathlib import Path
 import torch
 from datasets import Dataset
-from transformers import AutoModelForCausalLM, AutoTokenizer
 from trl import DPOConfig, DPOTrainer
 import warnings
 
+# 模型加载逻辑与其他章节共用，位于 book/code/model_loading.py
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from model_loading import default_device, load_causal_lm, load_tokenizer
+from eval_harness import evaluate_models, load_eval_prompts, write_report
+from profiling import TrainingProfiler, parse_step_window
+from preference_data import LENGTH_COLUMN, add_length_column, load_preference_shards, padding_ratio
+from ref_logps import (
+    attach_ref_logps, check_trl_support, compute_ref_logps, dataset_fingerprint, load_ref_logps,
+    mark_ref_logps_precomputed, release_memory, save_ref_logps,
+)
+
 # 忽略一些不影响核心功能的警告
 warnings.filterwarnings("ignore")
 
-def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="DPO 对齐训练：让 Qwen3 的回答更礼貌")
+    parser.add_argument("--model", default="Qwen/Qwen3-0.6B", help="Hugging Face 模型名或本地路径")
+    parser.add_argument(
+        "--ref-logps-cache",
+        default=None,
+        help="预先计算参考模型的对数概率并缓存到该目录；训练时不再加载第二份模型",
+    )
+    parser.add_argument(
+        "--data",
+        nargs="+",
+        default=None,
+        help="JSONL/Parquet 偏好数据分片（可用通配符），每行包含 prompt/chosen/rejected；不指定则使用脚本内置的示例数据",
+    )
+    parser.add_argument("--num-proc", type=int, default=None, help="并行分词的进程数")
+    parser.add_argument("--data-cache-dir", default=None, help="Arrow 缓存目录，默认使用 datasets 的全局缓存")
+    parser.add_argument(
+        "--lora",
+        action="store_true",
+        help="只训练 LoRA 低秩适配器；参考模型即关闭适配器后的基座模型，只保存适配器权重",
+    )
+    parser.add_argument("--lora-r", type=int, default=16, help="LoRA 的秩")
+    parser.add_argument("--lora-alpha", type=int, default=32, help="LoRA 的缩放系数")
+    parser.add_argument("--lora-dropout", type=float, default=0.05)
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="记录每步耗时分解、吞吐和内存，结果（JSON 与 Chrome trace）写入该目录",
+    )
+    parser.add_argument(
+        "--profile-steps",
+        default=None,
+        help="配合 --profile，用 torch.profiler 录制的步数区间，例如 3-5",
+    )
+    parser.add_argument(
+        "--eval-prompts",
+        default=None,
+        help="留出提示词文件（.txt 每行一条或 .jsonl 含 prompt 字段）；指定后批量对比两个模型并输出报告",
+    )
+    parser.add_argument("--eval-batch-size", type=int, default=8)
+    parser.add_argument("--eval-output", default="./dpo_eval", help="评估报告输出目录")
+    return parser.parse_args()
+
+def main(args):
     """
     一个完整的DPO（Direct Preference Optimization）训练脚本，
     用于微调语言模型使其回答更礼貌。
     """
     # 1. 模型选择
-    model_name = "Qwen/Qwen3-0.6B"
+    model_name = args.model
     
+    if args.ref_logps_cache is not None:
+        check_trl_support()  # 在加载模型之前发现不支持的 trl 版本
+
     # 确定设备，优先使用MPS (Apple Silicon GPU)
-    device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
+    device = default_device()
     print(f"Using device: {device}")
+
+    # GPU/MPS 上使用 float16 避免在旧版macOS上的bfloat16错误；
+    # CPU 上 float16 运算很慢，改为在支持原生 bf16 的 CPU 上用 bfloat16，否则用 float32
+    dtype = torch.float16 if device != "cpu" else "best"
     
     # 2. 模型加载
     # 加载策略模型 (policy model)，这是我们将在DPO中进行训练和更新的模型。
     print(f"Loading policy model from: {model_name}")
-    policy_model = AutoModelForCausalLM.from_pretrained(
+    policy_model = load_causal_lm(
         model_name,
-        torch_dtype=torch.float16,  # 使用 float16 避免在旧版macOS上的bfloat16错误
+        device=device,
+        dtype=dtype,
         trust_remote_code=True       # Qwen模型需要信任远程代码
-    ).to(device)
+    )
     
     # 显式地创建参考模型 (reference model)。
     # 在DPO中，参考模型是策略模型优化前的一个固定快照，用于计算KL散度来约束策略模型的更新幅度。
-    print(f"Loading reference model from: {model_name}")
-    ref_model = AutoModelForCausalLM.from_pretrained(
-        model_name,
-        torch_dtype=torch.float16, # 同样使用 float16
-        trust_remote_code=True
-    ).to(device)
+    # LoRA 模式下参考模型就是关闭适配器的基座模型，同样不需要第二份模型。
+    ref_model = None
+    if args.lora:
+        print("LoRA mode: the reference model is the base model with adapters disabled.")
+    elif args.ref_logps_cache is None:
+        print(f"Loading reference model from: {model_name}")
+        ref_model = load_causal_lm(
+            model_name,
+            device=device,
+            dtype=dtype, # 同样的精度
+            trust_remote_code=True
+        )
+    else:
+        # 参考模型只用来给每个样本算两个对数概率，训练前算好存盘即可，不必常驻内存
+        print(f"Reference log-probs will be precomputed and cached in: {args.ref_logps_cache}")
     
     # 加载分词器 (Tokenizer)
-    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-    # 如果分词器没有定义填充符 (pad_token)，则使用句末符 (eos_token) 作为填充符
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token
+    # 如果分词器没有定义填充符 (pad_token)，load_tokenizer 会使用句末符 (eos_token) 作为填充符
+    tokenizer = load_tokenizer(model_name, trust_remote_code=True)
         
     # 3. 偏好数据集
-    # 直接在脚本中创建一个小型的、内存中的偏好数据集。
-    # 数据集围绕“礼貌”这一主题，每个样本包含一个提示(prompt)、一个偏好的回答(chosen)和一个不偏好的回答(rejected)。
-    print("Creating in-memory preference dataset...")
-    preference_dataset = [
-        {
-            "prompt": "我的代码运行不了，你能帮我看看吗？",
-            "chosen": "当然可以，我很乐意帮助你。为了更好地理解问题，你能否分享一下你的代码片段、你期望它实现的功能，以及它报了什么错吗？",
-            "rejected": "代码是你写的，你自己搞定。",
-        },
-        {
-            "prompt": "你能解释一下什么是机器学习吗？我完全不懂。",
-            "chosen": "没问题。机器学习可以看作是教计算机从数据中学习规律和模式，而不是直接编程告诉它怎么做。就像我们通过看很多猫的照片学会识别猫一样。你想从哪个方面开始了解呢？",
-            "rejected": "自己上网搜，这个很简单。",
-        },
-        {
-            "prompt": "我预订的会议室被别人占用了，该怎么办？",
-            "chosen": "遇到这种情况确实很麻烦。我建议你先友好地和对方确认一下预订信息，也许是个误会。如果不行，可以联系行政部门寻求帮助。需要我帮你查看其他可用的会议室吗？",
-            "rejected": "那你去跟他们吵啊，问我干嘛？",
-        },
-    ]
+    if args.data is None:
+        # 直接在脚本中创建一个小型的、内存中的偏好数据集。
+        # 数据集围绕“礼貌”这一主题，每个样本包含一个提示(prompt)、一个偏好的回答(chosen)和一个不偏好的回答(rejected)。
+        print("Creating in-memory preference dataset...")
+        preference_dataset = [
+            {
+                "prompt": "我的代码运行不了，你能帮我看看吗？",
+                "chosen": "当然可以，我很乐意帮助你。为了更好地理解问题，你能否分享一下你的代码片段、你期望它实现的功能，以及它报了什么错吗？",
+                "rejected": "代码是你写的，你自己搞定。",
+            },
+            {
+                "prompt": "你能解释一下什么是机器学习吗？我完全不懂。",
+                "chosen": "没问题。机器学习可以看作是教计算机从数据中学习规律和模式，而不是直接编程告诉它怎么做。就像我们通过看很多猫的照片学会识别猫一样。你想从哪个方面开始了解呢？",
+                "rejected": "自己上网搜，这个很简单。",
+            },
+            {
+                "prompt": "我预订的会议室被别人占用了，该怎么办？",
+                "chosen": "遇到这种情况确实很麻烦。我建议你先友好地和对方确认一下预订信息，也许是个误会。如果不行，可以联系行政部门寻求帮助。需要我帮你查看其他可用的会议室吗？",
+                "rejected": "那你去跟他们吵啊，问我干嘛？",
+            },
+        ]
     
-    # 将Python列表转换为Hugging Face的Dataset对象，以便与Trainer兼容
-    train_dataset = Dataset.from_list(preference_dataset)
+        # 将Python列表转换为Hugging Face的Dataset对象，以便与Trainer兼容
+        train_dataset = Dataset.from_list(preference_dataset)
+    else:
+        # 真实规模的偏好数据：从 JSONL/Parquet 分片流式读入 Arrow 文件，而不是 Python 列表
+        print(f"Loading preference shards: {args.data}")
+        train_dataset = load_preference_shards(args.data, cache_dir=args.data_cache_dir)
+        print(f"Loaded {len(train_dataset)} preference pairs.")
 
     # 4. DPO 训练器配置
-    output_dir = "./dpo_qwen_polite_aligned_model"
+    # LoRA 模式只保存适配器权重（几 MB），与完整模型分开存放
+    output_dir = "./dpo_qwen_polite_aligned_lora" if args.lora else "./dpo_qwen_polite_aligned_model"
+
+    peft_config = None
+    if args.lora:
+        from peft import LoraConfig
+
+        # 只在全部线性层（注意力的 q/k/v/o 与 MLP 的 gate/up/down）旁路上加低秩矩阵，
+        # 基座权重冻结，优化器状态只覆盖适配器参数
+        peft_config = LoraConfig(
+            r=args.lora_r,
+            lora_alpha=args.lora_alpha,
+            lora_dropout=args.lora_dropout,
+            target_modules="all-linear",
+            task_type="CAUSAL_LM",
+        )
     
     dpo_config = DPOConfig(
         output_dir=output_dir,
         num_train_epochs=2,
-        per_device_train_batch_size=1,
+        # 分桶只在同一批次内减少填充，批次大小为 1 时没有可省的填充
+        per_device_train_batch_size=4 if args.data is not None else 1,
         gradient_accumulation_steps=2,
-        learning_rate=5e-5,
+        learning_rate=5e-4 if args.lora else 5e-5,  # 适配器参数少、从零初始化，通常需要更大的学习率
         lr_scheduler_type="cosine",
         warmup_ratio=0.1,
         logging_steps=10,
@@ -90,8 +184,40 @@ def main():
         max_prompt_length=128,      # 提示的最大长度
         max_length=256,             # 样本（提示+回答）的最大总长度
         remove_unused_columns=False,# DPO需要'prompt', 'chosen', 'rejected'列，不要移除它们
+        dataset_num_proc=args.num_proc,         # 训练器内部分词同样多进程并行
+        group_by_length=args.data is not None,  # 按长度分桶，长度相近的样本组成同一批次以减少填充
+        length_column_name=LENGTH_COLUMN,
     )
 
+    if args.data is not None:
+        # 预先并行分词得到每个样本的长度，供按长度分桶的采样器使用（结果缓存在 Arrow 文件中）
+        train_dataset = add_length_column(
+            train_dataset,
+            tokenizer,
+            max_prompt_length=dpo_config.max_prompt_length,
+            max_length=dpo_config.max_length,
+            num_proc=args.num_proc,
+        )
+        batch_size = dpo_config.per_device_train_batch_size
+        group_size = batch_size * dpo_config.gradient_accumulation_steps
+        print(f"Padding ratio: random batches {padding_ratio(train_dataset, batch_size):.1%}, "
+              f"length-grouped {padding_ratio(train_dataset, batch_size, group_size):.1%}")
+
+    if args.ref_logps_cache is not None:
+        fingerprint = dataset_fingerprint(train_dataset, model_name, dpo_config, policy_model)
+        ref_logps = load_ref_logps(args.ref_logps_cache, fingerprint)
+        if ref_logps is None:
+            # 训练开始前，策略模型的权重与参考模型完全相同，直接用它计算参考对数概率
+            print("Precomputing reference log-probs...")
+            ref_logps = compute_ref_logps(policy_model, tokenizer, train_dataset, dpo_config)
+            save_ref_logps(args.ref_logps_cache, fingerprint, ref_logps)
+            release_memory()
+        else:
+            print("Loaded cached reference log-probs.")
+        train_dataset = attach_ref_logps(train_dataset, ref_logps)
+        # 数据集中已带有 ref_chosen_logps / ref_rejected_logps 两列，DPOTrainer 会直接使用它们
+        dpo_config.precompute_ref_log_probs = True
+
     # 初始化DPOTrainer
     # DPOTrainer封装了DPO训练循环的所有逻辑
     dpo_trainer = DPOTrainer(
@@ -100,7 +226,16 @@ def main():
         args=dpo_config,            # 传入DPO配置
         train_dataset=train_dataset,# 传入训练数据集
         processing_class=tokenizer, # 正确的参数名
+        peft_config=peft_config,    # 非 None 时由训练器把策略模型包装成 PeftModel
     )
+    if args.lora:
+        dpo_trainer.model.print_trainable_parameters()
+    if args.profile is not None:
+        profiler = TrainingProfiler(args.profile, parse_step_window(args.profile_steps), device=device)
+        dpo_trainer.add_callback(profiler.attach(dpo_trainer))
+    if args.ref_logps_cache is not None:
+        # 告诉训练器参考对数概率已经就绪，跳过它自己的预计算
+        mark_ref_logps_precomputed(dpo_trainer)
     
     # 启动训练
     print("\nStarting DPO training...")
@@ -117,7 +252,35 @@ def main():
     
     # 在DPO训练中，policy_model的权重已经被原地更新，可以直接用于生成
     dpo_model = dpo_trainer.model 
+
+    if args.lora:
+        # 关闭适配器即得到原始模型，无需再加载一份
+        ref_model = dpo_model
+    elif ref_model is None:
+        # 训练时没有加载参考模型，对比前再加载一份原始模型
+        print(f"Loading original model for comparison from: {model_name}")
+        ref_model = load_causal_lm(model_name, device=device, dtype=dtype, trust_remote_code=True)
     
+    if args.eval_prompts is not None:
+        # 在一批留出提示词上批量生成并打分，代替下面的单条对比
+        prompts = load_eval_prompts(args.eval_prompts)
+        results = evaluate_models(
+            dpo_model,
+            ref_model,
+            tokenizer,
+            prompts,
+            beta=dpo_config.beta,
+            batch_size=args.eval_batch_size,
+            ref_context=dpo_model.disable_adapter if args.lora else None,
+        )
+        summary = write_report(results, args.eval_output)
+        print(f"\nWin rate (implicit reward, policy vs reference): {summary['win_rate']:.1%}, "
+              f"mean reward margin: {summary['mean_reward_margin']:.4f}")
+        print(f"Mean response length: policy {summary['policy_mean_tokens']:.1f} tokens, "
+              f"reference {summary['ref_mean_tokens']:.1f} tokens")
+        print(f"Side-by-side report written to {os.path.join(args.eval_output, 'report.md')}")
+        return
+
     # 选择一个测试prompt
     test_prompt = "我不太明白你刚才说的那个概念，能再解释一遍吗？"
     
@@ -138,11 +301,12 @@ def main():
 
     # 使用原始模型（参考模型）生成回答
     print("\n--- Response from Original Model (ref_model) ---")
-    generated_ids_ref = ref_model.generate(
-        model_inputs.input_ids,
-        max_new_tokens=100,
-        pad_token_id=tokenizer.eos_token_id
-    )
+    with dpo_model.disable_adapter() if args.lora else contextlib.nullcontext():
+        generated_ids_ref = ref_model.generate(
+            model_inputs.input_ids,
+            max_new_tokens=100,
+            pad_token_id=tokenizer.eos_token_id
+        )
     response_ref_full = tokenizer.decode(generated_ids_ref[0], skip_special_tokens=True)
     # 精确提取模型生成的回答部分
     response_ref = response_ref_full.split("<|im_start|>assistant\n")[-1].strip()
@@ -164,4 +328,4 @@ def main():
     print("Notice how the DPO-aligned model's response is likely more polite and helpful.")
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
@@ -0,0 +1,105 @@
+"""
+可配置的审批规则表。
+
+在调用 LLM 之前，先用一张规则表处理界限分明的情形，例如“历史记录良好、金额不大的交通住宿费直接批准”、
+“超过硬性上限的申请直接拒绝”。规则存放在 JSON 文件中（默认是同目录下的 `approval_rules.json`），
+财务政策变化时只改配置，不改代码。
+
+每条规则的格式：
+
+    {
+        "name": "规则名",
+        "decision": "批准" 或 "拒绝",
+        "when": {
+            "amount_min": 500,                    # 金额 >= amount_min
+            "amount_max": 2000,                   # 金额 <  amount_max
+            "reason_keywords": ["交通", "住宿"],  # 事由包含其中任意一个
+            "history_contains": ["无异常"],       # 历史记录包含其中任意一个
+            "history_excludes": ["大额"],         # 历史记录不包含其中任何一个
+            "employees": ["王五"]                 # 申请人在名单中
+        }
+    }
+
+`when` 中的条件全部满足才算匹配，省略的条件不做限制；规则按顺序匹配，第一条命中的生效。
+"""
+
+import json
+import os
+import threading
+from collections import Counter
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "approval_rules.json")
+
+
+def _matches(when: dict, employee_name: str, amount: int, reason: str, history: str) -> bool:
+    if "amount_min" in when and amount < when["amount_min"]:
+        return False
+    if "amount_max" in when and amount >= when["amount_max"]:
+        return False
+    if "reason_keywords" in when and not any(k in reason for k in when["reason_keywords"]):
+        return False
+    if "history_contains" in when and not any(k in history for k in when["history_contains"]):
+        return False
+    if "history_excludes" in when and any(k in history for k in when["history_excludes"]):
+        return False
+    if "employees" in when and employee_name not in when["employees"]:
+        return False
+    return True
+
+
+class RuleTable:
+    """
+    按顺序匹配的规则表，并统计每条规则的命中次数。
+
+    Args:
+        rules (list, optional): 规则列表，格式见模块说明。默认为空表（全部交给 LLM）。
+    """
+
+    def __init__(self, rules: list = None):
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._hits = Counter()
+        self.rules = []
+        self.set_rules(rules or [])
+
+    @classmethod
+    def from_file(cls, path: str = DEFAULT_RULES_FILE):
+        table = cls()
+        table.load(path)
+        return table
+
+    def load(self, path: str):
+        """从 JSON 文件（重新）加载规则。"""
+        with open(path, encoding="utf-8") as f:
+            self.set_rules(json.load(f)["rules"])
+
+    def set_rules(self, rules: list):
+        for rule in rules:
+            if rule.get("decision") not in ("批准", "拒绝"):
+                raise ValueError(f"Rule {rule.get('name')!r} must decide '批准' or '拒绝'")
+        with self._lock:
+            self.rules = list(rules)
+
+    def evaluate(self, employee_name: str, amount: int, reason: str, history: str):
+        """
+        返回第一条匹配规则的 (规则名, 决定)；没有匹配时返回 None。
+        """
+        with self._lock:
+            self._lookups += 1
+            rules = self.rules
+        for rule in rules:
+            if _matches(rule.get("when", {}), employee_name, amount, reason, history or ""):
+                with self._lock:
+                    self._hits[rule["name"]] += 1
+                return rule["name"], rule["decision"]
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(self._hits.values())
+            return {
+                "lookups": self._lookups,
+                "hits": hits,
+                "hit_rate": hits / self._lookups if self._lookups else 0.0,
+                "by_rule": dict(self._hits),
+            }
@@ -0,0 +1,267 @@
+"""
+批量并发执行差旅报销审批流程。
+
+vibe.py 只演示了逐条调用 `app.invoke`。月底集中报销时一次有成千上万条申请，
+每条大额申请都要阻塞等待一次 LLM 调用，串行执行一晚上也跑不完。本脚本：
+
+1.  **流式读取**：从 CSV 或 JSONL 文件逐行读取申请（employee_name / amount / reason，
+    可选 claim_id），不会把整个文件读进内存；
+2.  **并发执行**：用 `app.ainvoke` 在 asyncio 中并发运行已编译的图，
+    同时在途的申请数不超过 `--concurrency`；
+3.  **流式输出**：每完成一条就立即写出一行 JSON 决策，单条失败只记录错误，不影响其他申请；
+    输入文件中无法解析的行同样写出一条带行号和错误的记录；
+4.  **批量预取**：每读入 `--prefetch-size` 条申请，先用一次批量查询取回其中所有员工的
+    历史记录，之后逐条执行时查询直接命中缓存；
+5.  **断点续跑**：指定 `--checkpoint` 时，每个节点的输出按申请记录到 SQLite。
+    中断后用同一个检查点文件重跑，已完成的申请直接输出记录的结果，
+    未完成的申请从最后一个完成的节点继续，已经付过费的 LLM 调用不会重复。
+
+图中的节点是同步函数，LangGraph 在 `ainvoke` 时会把它们放进事件循环的默认线程池执行，
+因此这里把默认线程池的大小设为并发上限，否则并发度会被线程池（默认最多 32 个线程）卡住。
+
+用法示例：
+    python batch_runner.py claims.csv --concurrency 64 --output decisions.jsonl
+"""
+
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from checkpoint_store import SQLiteCheckpointStore, claim_digest
+from llm_client import build_llm
+from tracing import Tracer
+
+
+def _parse_claim(row, index: int) -> dict:
+    if isinstance(row, str):  # JSONL 的一行
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object, got {type(row).__name__}")
+    missing = [key for key in ("employee_name", "amount", "reason") if row.get(key) in (None, "")]
+    if missing:
+        raise ValueError(f"missing field(s): {', '.join(missing)}")
+    return {
+        "claim_id": str(row.get("claim_id") or index),
+        "employee_name": row["employee_name"],
+        "amount": int(float(row["amount"])),
+        "reason": row["reason"],
+        "messages": [],
+    }
+
+
+def read_claims(path: str):
+    """
+    逐行读取报销申请，产出图的输入字典（附带 claim_id）。
+
+    无法解析的行（缺字段、金额不是数字、JSON 格式错误）不会中断整批，
+    而是产出一条带 row（从 0 开始的数据行号）和 error 的记录。
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = csv.DictReader(f) if path.endswith(".csv") else (line for line in f if line.strip())
+        for index, row in enumerate(rows):
+            try:
+                yield _parse_claim(row, index)
+            except (ValueError, TypeError) as e:
+                claim_id = row.get("claim_id") if isinstance(row, dict) else None
+                yield {"claim_id": str(claim_id or index), "row": index, "error": f"{type(e).__name__}: {e}"}
+
+
+async def _run_one(app, claim: dict, config: dict = None, checkpoint_store=None) -> dict:
+    claim_id = claim.pop("claim_id")
+    digest = claim_digest(claim["employee_name"], claim["amount"], claim["reason"])
+    start = time.perf_counter()
+    # claim_id 与申请摘要放进 configurable，供检查点包装器按申请记录节点输出
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), "claim_id": claim_id, "claim_digest": digest}
+    record = {
+        "claim_id": claim_id,
+        "employee_name": claim["employee_name"],
+        "amount": claim["amount"],
+        "reason": claim["reason"],
+    }
+    try:
+        final_state = await app.ainvoke(claim, config=config)
+        record["decision"] = final_state.get("decision", "").strip()
+        record["decision_source"] = final_state.get("decision_source")
+        record["history_check_result"] = final_state.get("history_check_result")
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed_sec"] = round(time.perf_counter() - start, 3)
+    if checkpoint_store is not None and "error" not in record:
+        checkpoint_store.mark_finished(claim_id, digest, record)
+    return record
+
+
+async def _prefetched(claims, prefetch, chunk_size: int):
+    """按块读取申请，每块先在线程池里执行一次批量预取，再逐条产出。"""
+    loop = asyncio.get_running_loop()
+    chunk = []
+    for claim in claims:
+        chunk.append(claim)
+        if len(chunk) >= chunk_size:
+            await loop.run_in_executor(None, prefetch, [c["employee_name"] for c in chunk if "error" not in c])
+            for item in chunk:
+                yield item
+            chunk = []
+    if chunk:
+        await loop.run_in_executor(None, prefetch, [c["employee_name"] for c in chunk if "error" not in c])
+        for item in chunk:
+            yield item
+
+
+async def _plain(claims):
+    for claim in claims:
+        yield claim
+
+
+async def run_batch(app, claims, concurrency: int = 16, config: dict = None, prefetch=None,
+                    prefetch_size: int = 256, checkpoint_store=None):
+    """
+    并发执行一批申请，按完成顺序逐条产出结果。
+
+    Args:
+        app: 编译好的 LangGraph 应用。
+        claims (iterable): 申请输入字典，可以是生成器（按需读取）。
+        concurrency (int, optional): 同时在途的申请数上限。默认 16。
+        config (dict, optional): 传给每次 `ainvoke` 的配置，例如注入共享的 LLM 客户端。
+        prefetch (callable, optional): 批量预取函数，接收一块申请的员工姓名列表，
+            例如 `history_service.prefetch`。默认不预取。
+        prefetch_size (int, optional): 每次预取覆盖的申请条数。默认 256。
+        checkpoint_store (SQLiteCheckpointStore, optional): 检查点存储；app 需由
+            `build_app(checkpoint_store)` 构建。已完成的申请直接产出记录的结果；
+            claim_id 相同但内容已经改变的申请重新执行。
+
+    Yields:
+        dict: 每条申请的决策记录，包含 decision 或 error 以及耗时。
+    """
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    finished = checkpoint_store.finished_results() if checkpoint_store is not None else {}
+    claims = _prefetched(claims, prefetch, prefetch_size) if prefetch else _plain(claims)
+    pending = set()
+
+    async def fill():
+        """补充任务直到达到并发上限；已完成的申请不再执行，直接产出记录的结果。"""
+        async for claim in claims:
+            if "error" in claim:  # 读取时就无法解析的行，直接作为失败记录产出
+                yield claim
+                continue
+            digest, result = finished.get(claim["claim_id"], (None, None))
+            if result is not None and digest == claim_digest(claim["employee_name"], claim["amount"], claim["reason"]):
+                yield dict(result, from_checkpoint=True)
+                continue
+            pending.add(asyncio.create_task(_run_one(app, claim, config, checkpoint_store)))
+            if len(pending) >= concurrency:
+                break
+
+    # 滑动窗口：完成一条补进一条，任务数始终不超过并发上限，也不会一次性读入全部申请
+    async for record in fill():
+        yield record
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()
+        async for record in fill():
+            yield record
+
+
+def _traced_prefetch(tracer, prefetch):
+    def wrapper(names):
+        with tracer.span("history_prefetch", "tool", employees=len(names)):
+            return prefetch(names)
+    return wrapper
+
+
+async def _main(args, out):
+    from vibe import app, build_app, decision_cache, history_service, rule_table
+
+    checkpoint_store = SQLiteCheckpointStore(args.checkpoint) if args.checkpoint else None
+    tracer = Tracer().install() if args.trace else None
+    if checkpoint_store or tracer:
+        app = build_app(checkpoint_store, tracer)
+
+    if args.rules:
+        rule_table.load(args.rules)
+
+    # 所有申请共享一个客户端：连接池大小与并发上限一致，连接在申请之间复用
+    llm = build_llm(max_connections=args.concurrency, max_retries=args.max_retries, requests_per_second=args.rps)
+    config = {"configurable": {"llm": llm}}
+    if tracer:
+        config["callbacks"] = [tracer.callback_handler()]
+
+    decisions = Counter()
+    errors = 0
+    start = time.perf_counter()
+    prefetch = history_service.prefetch if args.prefetch_size > 0 else None
+    if prefetch and tracer:
+        prefetch = _traced_prefetch(tracer, prefetch)
+    records = run_batch(
+        app, read_claims(args.input), args.concurrency, config, prefetch, args.prefetch_size, checkpoint_store
+    )
+    resumed = 0
+    try:
+        async for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            resumed += record.get("from_checkpoint", False)
+            if "error" in record:
+                errors += 1
+            else:
+                decisions[record["decision"]] += 1
+    finally:
+        if checkpoint_store is not None:
+            checkpoint_store.close()
+    elapsed = time.perf_counter() - start
+    total = sum(decisions.values()) + errors
+    print(f"\n处理 {total} 条申请，耗时 {elapsed:.1f} 秒（{total / elapsed if elapsed else 0:.1f} 条/秒），"
+          f"失败 {errors} 条", file=sys.stderr)
+    if checkpoint_store is not None:
+        stats = checkpoint_store.stats()
+        print(f"检查点：跳过已完成的申请 {resumed} 条，复用节点输出 {stats['node_hits']} 次，"
+              f"写入 {stats['node_writes']} 条（{stats['flushes']} 个事务）", file=sys.stderr)
+    for decision, count in decisions.most_common():
+        print(f"  {decision}: {count}", file=sys.stderr)
+    stats = history_service.stats()
+    print(f"历史记录查询：命中率 {stats['hit_rate']:.1%}，后端调用 {stats['backend_calls']} 次"
+          f"（共 {stats['backend_keys']} 名员工）", file=sys.stderr)
+    stats = rule_table.stats()
+    print(f"规则表：命中率 {stats['hit_rate']:.1%}（{stats['hits']}/{stats['lookups']}）", file=sys.stderr)
+    for name, count in stats["by_rule"].items():
+        print(f"  {name}: {count}", file=sys.stderr)
+    stats = decision_cache.stats()
+    print(f"决定缓存：命中率 {stats['hit_rate']:.1%}（{stats['hits']}/{stats['lookups']}）", file=sys.stderr)
+    if tracer:
+        tracer.export_chrome_trace(args.trace)
+        print(f"\n{tracer.format_summary()}\nChrome trace 已写入 {args.trace}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量并发执行报销审批流程")
+    parser.add_argument("input", help="报销申请文件（.csv 或 .jsonl）")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时在途的申请数上限")
+    parser.add_argument("--rps", type=float, default=None, help="每秒 LLM 请求数上限，默认不限流")
+    parser.add_argument("--max-retries", type=int, default=3, help="LLM 请求失败（429/5xx/连接错误）的最大重试次数")
+    parser.add_argument("--prefetch-size", type=int, default=256, help="每块批量预取历史记录的申请条数，0 表示不预取")
+    parser.add_argument("--rules", default=None, help="审批规则表 JSON 文件，默认使用 approval_rules.json")
+    parser.add_argument("--checkpoint", default=None, help="SQLite 检查点文件；中断后用同一文件重跑即可续跑")
+    parser.add_argument("--trace", default=None, help="记录每个节点/路由/工具/LLM 调用的耗时，Chrome trace 写入该文件")
+    parser.add_argument("--output", default="-", help="决策输出文件（JSONL），默认写到标准输出")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        # 节点里的过程日志改写到标准错误，标准输出只留给决策流
+        with contextlib.redirect_stdout(sys.stderr):
+            asyncio.run(_main(args, out))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
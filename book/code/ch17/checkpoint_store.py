@@ -0,0 +1,210 @@
+"""
+基于 SQLite 的逐节点检查点，让长时间运行的审批批次可以中断后续跑。
+
+`GraphState` 只在 `app.invoke` 期间存在于内存中。一批申请跑到一半失败时，
+所有申请都要重来，包括已经付过费的 LLM 调用。`SQLiteCheckpointStore`：
+
+1.  **逐节点记录**：用 `wrap` 包装图中的每个节点，节点输出按 (claim_id, 节点名) 写入 SQLite；
+    重跑同一条申请时，已有输出的节点直接返回记录的结果，不再执行（也就不会再调用 LLM），
+    相当于从最后一个完成的节点继续；
+2.  **跳过已完成的申请**：整条申请完成后记录最终结果，批量执行时直接跳过；
+3.  **批量写入**：写操作先进入队列，由后台线程每攒够 `batch_size` 条或每隔
+    `flush_interval` 秒在一个事务里写入，避免每个节点一次 fsync 成为瓶颈。
+    代价是进程崩溃时最多丢失最后一批尚未落盘的记录，这些节点在续跑时会重新执行。
+
+申请的 claim_id 通过 `config["configurable"]["claim_id"]` 传给节点包装器；
+没有 claim_id 的调用（例如 vibe.py 中的示例）不做检查点。
+
+claim_id 可能只是输入文件中的行号，换了输入文件或改过某一行后，同一个 claim_id 对应的
+已经是另一条申请。因此每条记录同时保存申请内容 (employee_name, amount, reason) 的摘要
+（`claim_digest`，通过 `config["configurable"]["claim_digest"]` 传入），
+只有摘要一致时才复用记录，否则重新执行并覆盖旧记录。
+"""
+
+import hashlib
+import inspect
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS node_outputs (
+    claim_id TEXT NOT NULL,
+    node TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    output TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (claim_id, node)
+);
+CREATE TABLE IF NOT EXISTS finished_claims (
+    claim_id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    result TEXT NOT NULL,
+    finished_at REAL NOT NULL
+);
+"""
+
+
+def claim_digest(employee_name: str, amount, reason: str) -> str:
+    """申请内容的摘要，用来确认检查点记录属于同一条申请。"""
+    payload = json.dumps([employee_name, amount, reason], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class SQLiteCheckpointStore:
+    """
+    逐节点输出与已完成申请的 SQLite 存储。
+
+    Args:
+        path (str): 数据库文件路径。
+        batch_size (int, optional): 攒够多少条写操作就提交一次事务。默认 200。
+        flush_interval (float, optional): 最长等待多少秒提交一次。默认 0.5。
+    """
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # WAL 模式下读写互不阻塞；synchronous=NORMAL 只在检查点时 fsync
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(node_outputs)")}
+        if columns and "digest" not in columns:
+            # 旧版本的检查点没有摘要，无法确认属于哪条申请，只能丢弃
+            self._conn.executescript("DROP TABLE node_outputs; DROP TABLE IF EXISTS finished_claims;")
+        self._conn.executescript(_SCHEMA)
+        self._conn_lock = threading.Lock()
+
+        # 尚未落盘的写入也要能被读到，否则同一进程内的重复查询会看不到它们
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stats = {"node_hits": 0, "node_writes": 0, "flushes": 0}
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    # --- 读取 ---
+
+    def get_node_output(self, claim_id: str, node: str, digest: str):
+        """返回记录的节点输出；没有记录或记录属于另一条申请（摘要不同）时返回 None。"""
+        with self._pending_lock:
+            pending = self._pending.get(("node", claim_id, node))
+        if pending is not None:
+            return pending[1] if pending[0] == digest else None
+        with self._conn_lock:
+            row = self._conn.execute(
+                "SELECT digest, output FROM node_outputs WHERE claim_id = ? AND node = ?", (claim_id, node)
+            ).fetchone()
+        return json.loads(row[1]) if row and row[0] == digest else None
+
+    def finished_results(self) -> dict:
+        """返回所有已完成申请的 {claim_id: (申请摘要, 最终结果)}。"""
+        with self._conn_lock:
+            rows = self._conn.execute("SELECT claim_id, digest, result FROM finished_claims").fetchall()
+        results = {claim_id: (digest, json.loads(result)) for claim_id, digest, result in rows}
+        with self._pending_lock:
+            for (kind, claim_id, _), value in self._pending.items():
+                if kind == "finished":
+                    results[claim_id] = value
+        return results
+
+    # --- 写入（异步批量） ---
+
+    def put_node_output(self, claim_id: str, node: str, digest: str, output: dict):
+        try:
+            payload = json.dumps(output, ensure_ascii=False)
+        except TypeError:
+            return  # 无法序列化的输出（例如消息对象）不做检查点，续跑时重新执行该节点
+        self._enqueue(("node", claim_id, node), digest, output, payload)
+
+    def mark_finished(self, claim_id: str, digest: str, result: dict):
+        self._enqueue(("finished", claim_id, None), digest, result, json.dumps(result, ensure_ascii=False))
+
+    def _enqueue(self, key: tuple, digest: str, value, payload: str):
+        with self._pending_lock:
+            self._pending[key] = (digest, value)
+        self._queue.put((key, digest, payload, time.time()))
+
+    def _write_loop(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                batch.append(item)
+                deadline = deadline or time.monotonic() + self.flush_interval
+            done = item is not None and item[0] is None  # flush / close 哨兵
+            if batch and (done or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write_batch([entry for entry in batch if entry[0] is not None])
+                batch, deadline = [], None
+            if done:
+                item[2].set()
+
+    def _write_batch(self, batch: list):
+        nodes = [(key[1], key[2], digest, payload, ts) for key, digest, payload, ts in batch if key[0] == "node"]
+        finished = [(key[1], digest, payload, ts) for key, digest, payload, ts in batch if key[0] == "finished"]
+        with self._conn_lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO node_outputs VALUES (?, ?, ?, ?, ?)", nodes)
+            self._conn.executemany("INSERT OR REPLACE INTO finished_claims VALUES (?, ?, ?, ?)", finished)
+            self._conn.execute("COMMIT")
+        with self._pending_lock:
+            for key, digest, _, _ in batch:
+                # 落盘期间同一个键可能又被写入了新值，只移除已经写入的那一个
+                if self._pending.get(key, (None,))[0] == digest:
+                    self._pending.pop(key, None)
+            self._stats["node_writes"] += len(nodes)
+            self._stats["flushes"] += 1
+
+    def flush(self):
+        """阻塞直到队列中已有的写入全部落盘。"""
+        done = threading.Event()
+        self._queue.put((None, None, done, None))
+        done.wait()
+
+    def close(self):
+        self.flush()
+        with self._conn_lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            return dict(self._stats)
+
+    # --- 节点包装 ---
+
+    def wrap(self, node_name: str, node):
+        """
+        包装一个图节点：有同一条申请（claim_id 与申请摘要都一致）的记录时直接返回记录的输出，
+        否则执行节点并记录输出。
+        """
+        accepts_config = "config" in inspect.signature(node).parameters
+
+        # 不用 functools.wraps：LangGraph 按 __wrapped__ 的签名决定是否传入 config
+        def wrapper(state, config):
+            configurable = (config or {}).get("configurable", {})
+            claim_id = configurable.get("claim_id")
+            digest = configurable.get("claim_digest")
+            if digest is None and claim_id is not None:
+                digest = claim_digest(state.get("employee_name"), state.get("amount"), state.get("reason"))
+            if claim_id is not None:
+                output = self.get_node_output(claim_id, node_name, digest)
+                if output is not None:
+                    with self._pending_lock:
+                        self._stats["node_hits"] += 1
+                    return output
+            output = node(state, config) if accepts_config else node(state)
+            if claim_id is not None:
+                self.put_node_output(claim_id, node_name, digest, output)
+            return output
+
+        wrapper.__name__ = getattr(node, "__name__", node_name)
+        wrapper.__doc__ = node.__doc__
+        return wrapper
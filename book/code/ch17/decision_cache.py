@@ -0,0 +1,127 @@
+"""
+审批决定缓存。
+
+大部分需要经理审批的申请都是例行公事：同一个人、相近的金额、同样的事由、同样的背景调查结果，
+LLM 给出的决定也一样。`DecisionCache` 把 LLM 的决定按归一化后的
+(员工, 金额区间, 事由, 历史记录) 四元组缓存起来，相同情形再次出现时直接复用，不再调用 LLM。
+
+归一化规则：
+-   员工姓名与历史记录去掉首尾空白；
+-   事由做 NFKC 归一化（全角转半角）、转小写，并去掉空白和标点；
+-   金额按 `AMOUNT_BUCKETS` 划分区间，同一区间内的金额视为同一情形。
+"""
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_right
+from collections import OrderedDict
+
+# 金额区间的分界点（元）：[500, 1000)、[1000, 2000)……
+AMOUNT_BUCKETS = (500, 1000, 2000, 5000, 10000, 20000, 50000)
+
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def amount_bucket(amount: int, buckets=AMOUNT_BUCKETS) -> str:
+    """把金额映射到区间标签，例如 1200 -> "1000-2000"。"""
+    index = bisect_right(buckets, amount)
+    if index == 0:
+        return f"<{buckets[0]}"
+    if index == len(buckets):
+        return f">={buckets[-1]}"
+    return f"{buckets[index - 1]}-{buckets[index]}"
+
+
+def normalize_reason(reason: str) -> str:
+    """事由归一化：全角转半角、转小写、去掉空白和标点。"""
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFKC", reason).lower())
+
+
+# “不批准”“不予批准”“未批准”等否定形式含有“批准”二字，必须先于“批准”判断
+_NEGATED_APPROVAL = re.compile(r"(不|未|没有?|无法|暂不)(予以?|能|可|应|同意)?批准")
+_NEGATED_REFUSAL = re.compile(r"(不|未|没有?|无须|不必)(予以?|能|会|应)?拒绝")
+_NEGATION = re.compile(r"[不未没无非否]")
+
+
+def normalize_decision(text: str):
+    """
+    把 LLM 的回答归一化为“批准”/“拒绝”；无法明确判断时返回 None（不缓存）。
+
+    “不批准”“不予批准，金额过高”等否定形式视为“拒绝”；同时出现两种决定，
+    或“批准”前后还有其他否定词（例如“批准，但不报销住宿”）时不做判断。
+
+    >>> [normalize_decision(t) for t in ("批准。", "不批准", "不予批准，金额过高", "未批准", "拒绝，理由不足")]
+    ['批准', '拒绝', '拒绝', '拒绝', '拒绝']
+    >>> [normalize_decision(t) for t in ("不拒绝", "批准，但不报销住宿", "批准或拒绝")]
+    [None, None, None]
+    """
+    compact = _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text))
+    if compact in ("批准", "拒绝"):
+        return compact
+    if _NEGATED_REFUSAL.search(compact):
+        return None
+    if _NEGATED_APPROVAL.search(compact):
+        return "拒绝"
+    if "拒绝" in compact and "批准" not in compact:
+        return "拒绝"
+    if "批准" in compact and "拒绝" not in compact and not _NEGATION.search(compact):
+        return "批准"
+    return None
+
+
+class DecisionCache:
+    """
+    线程安全的 LRU 决定缓存。
+
+    Args:
+        max_entries (int, optional): 缓存条目上限。默认 100000。
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    @staticmethod
+    def key(employee_name: str, amount: int, reason: str, history: str) -> tuple:
+        return (employee_name.strip(), amount_bucket(amount), normalize_reason(reason), (history or "").strip())
+
+    def get(self, employee_name: str, amount: int, reason: str, history: str):
+        """返回缓存的决定，未命中时返回 None。"""
+        key = self.key(employee_name, amount, reason, history)
+        with self._lock:
+            self._lookups += 1
+            decision = self._entries.get(key)
+            if decision is not None:
+                self._hits += 1
+                self._entries.move_to_end(key)
+            return decision
+
+    def put(self, employee_name: str, amount: int, reason: str, history: str, decision: str):
+        """缓存一个决定；只接受能归一化为“批准”/“拒绝”的回答。"""
+        decision = normalize_decision(decision)
+        if decision is None:
+            return
+        key = self.key(employee_name, amount, reason, history)
+        with self._lock:
+            self._entries[key] = decision
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """审批政策变化后应清空缓存。"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "hit_rate": self._hits / self._lookups if self._lookups else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,139 @@
+"""
+一个本地的 OpenAI 兼容聊天接口，用于在没有 API Key、不产生费用的情况下测试审批流程。
+
+它实现了 `POST /v1/chat/completions`，总是回答“批准”，并且可以模拟：
+
+1.  **建连开销**：每个新的 TCP 连接先等待 `--connect-latency` 秒，近似真实服务的 TLS 握手；
+2.  **推理延迟**：每个请求等待 `--latency` 秒；
+3.  **偶发失败**：按 `--error-rate` 的比例返回 429 / 503，用来验证客户端的重试与退避。
+
+`GET /stats` 返回累计的连接数与请求数，可以据此确认客户端是否复用了连接。
+
+用法示例：
+    python fake_chat_server.py --port 8765 --connect-latency 0.05 --latency 0.2
+    DEEPSEEK_API_KEY=test DEEPSEEK_API_BASE=http://127.0.0.1:8765/v1 python batch_runner.py claims.csv
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeChatServer(ThreadingHTTPServer):
+    """在 ThreadingHTTPServer 上附加模拟参数与统计计数。"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.2, connect_latency: float = 0.0,
+                 error_rate: float = 0.0, reply: str = "批准"):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.error_rate = error_rate
+        self.reply = reply
+        self.lock = threading.Lock()
+        self.counters = {"connections": 0, "requests": 0, "errors": 0}
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counters)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才支持 keep-alive，同一个连接上可以连续处理多个请求
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 每个连接只会创建一个 handler 实例，这里就是“新建连接”的时刻
+        self.server.count("connections")
+        time.sleep(self.server.connect_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        self.server.count("requests")
+        time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            self.server.count("errors")
+            status = random.choice((429, 503))
+            self._send_json(status, {"error": {"message": "simulated failure", "type": "server_error"}},
+                            headers={"Retry-After": "0"})
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+        self._send_json(200, {
+            "id": f"chatcmpl-{self.server.stats()['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.server.reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 1, "total_tokens": prompt_tokens + 1},
+        })
+
+
+def start_in_background(port: int = 0, **options) -> FakeChatServer:
+    """在后台线程启动服务，返回 server 对象；port=0 时由系统分配空闲端口。"""
+    server = FakeChatServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的模拟聊天服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="每个请求的模拟推理延迟（秒）")
+    parser.add_argument("--connect-latency", type=float, default=0.0, help="每个新连接的模拟握手延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429/503 的请求比例")
+    args = parser.parse_args()
+
+    server = FakeChatServer(
+        (args.host, args.port),
+        latency=args.latency,
+        connect_latency=args.connect_latency,
+        error_rate=args.error_rate,
+    )
+    print(f"Fake chat server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
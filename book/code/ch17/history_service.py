@@ -0,0 +1,130 @@
+"""
+带缓存、请求合并和批量预取的员工历史记录查询服务。
+
+`query_employee_history` 在生产环境中是一次数据库或 HR 系统 API 的往返。
+同一员工一个月内往往提交多笔报销，批量处理时这些重复查询占了图延迟的很大一部分。
+`EmployeeHistoryService` 包装一个“批量查询”后端函数，提供：
+
+1.  **TTL 缓存**：查询结果在 `ttl_seconds` 内直接复用，条目数超过上限时淘汰最久未用的；
+2.  **请求合并 (coalescing)**：同一员工的查询正在进行时，其他线程不再重复发起，
+    而是等待同一个 Future 的结果；
+3.  **批量预取**：一批申请到达时，调用 `prefetch` 把其中所有尚未缓存的员工
+    用一次批量查询取回，之后逐条执行时全部命中缓存。
+
+后端函数的签名是 `fetch_many(employee_names: list) -> dict`，返回姓名到历史记录的映射。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+_MISSING = object()
+
+
+class EmployeeHistoryService:
+    """
+    线程安全的员工历史记录查询服务（图中的同步节点运行在线程池里）。
+
+    Args:
+        fetch_many (callable): 批量查询后端，输入员工姓名列表，返回 {姓名: 历史记录}。
+        ttl_seconds (float, optional): 缓存有效期（秒）。默认 300。
+        max_entries (int, optional): 缓存条目上限。默认 10000。
+    """
+
+    def __init__(self, fetch_many, ttl_seconds: float = 300.0, max_entries: int = 10_000):
+        self.fetch_many = fetch_many
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # name -> (expires_at, history)
+        self._inflight = {}  # name -> Future
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "backend_calls": 0, "backend_keys": 0}
+
+    def _cached(self, name: str):
+        """在持有锁的情况下读取未过期的缓存条目。"""
+        entry = self._cache.get(name)
+        if entry is None:
+            return _MISSING
+        expires_at, history = entry
+        if expires_at < time.monotonic():
+            del self._cache[name]
+            return _MISSING
+        self._cache.move_to_end(name)
+        return history
+
+    def _fetch(self, names: list, futures: dict):
+        """调用一次批量后端，把结果写入缓存并完成对应的 Future。"""
+        try:
+            results = self.fetch_many(names)
+        except Exception as e:
+            with self._lock:
+                for name in names:
+                    self._inflight.pop(name, None)
+            for future in futures.values():
+                future.set_exception(e)
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._stats["backend_calls"] += 1
+            self._stats["backend_keys"] += len(names)
+            for name in names:
+                self._cache[name] = (expires_at, results.get(name))
+                self._cache.move_to_end(name)
+                self._inflight.pop(name, None)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        for name, future in futures.items():
+            future.set_result(results.get(name))
+
+    def get(self, employee_name: str) -> str:
+        """查询单个员工的历史记录：命中缓存直接返回，已有相同查询在途则等待它的结果。"""
+        with self._lock:
+            history = self._cached(employee_name)
+            if history is not _MISSING:
+                self._stats["hits"] += 1
+                return history
+            future = self._inflight.get(employee_name)
+            owner = future is None
+            if owner:
+                self._stats["misses"] += 1
+                future = self._inflight[employee_name] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if owner:
+            self._fetch([employee_name], {employee_name: future})
+        return future.result()
+
+    def prefetch(self, employee_names) -> int:
+        """
+        用一次批量查询取回一批员工中尚未缓存、也不在查询中的那部分。
+
+        Returns:
+            int: 实际交给后端查询的员工数。
+        """
+        futures = {}
+        with self._lock:
+            for name in dict.fromkeys(employee_names):  # 去重并保持顺序
+                if self._cached(name) is not _MISSING or name in self._inflight:
+                    continue
+                futures[name] = self._inflight[name] = Future()
+        if futures:
+            self._fetch(list(futures), futures)
+        return len(futures)
+
+    def invalidate(self, employee_name: str = None):
+        """让某个员工（或全部员工）的缓存失效，例如新的报销入账之后。"""
+        with self._lock:
+            if employee_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(employee_name, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached"] = len(self._cache)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
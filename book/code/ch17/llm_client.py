@@ -0,0 +1,157 @@
+"""
+审批流程共用的 LLM 客户端。
+
+原来的 `manager_approval_node` 每次调用都会新建一个 `ChatDeepSeek`，
+相当于每条申请都要新建 HTTP 客户端、重新建立 TCP 连接并完成一次 TLS 握手。
+本模块只创建一个客户端，供所有节点和并发任务共享：
+
+1.  **连接池与 keep-alive**：同步与异步各一个 httpx 客户端，连接用完放回池中复用；
+2.  **限流**：令牌桶 (`InMemoryRateLimiter`) 控制每秒请求数，避免触发服务端的 429；
+3.  **重试与退避**：429、5xx 和连接错误由 openai SDK 按指数退避（带抖动）自动重试。
+
+节点通过 `config["configurable"]["llm"]` 拿到注入的客户端，没有注入时使用进程级的默认实例。
+
+运行基准测试（在本地模拟服务上对比“每次新建客户端”与“共享连接池”）：
+    python llm_client.py --benchmark
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import httpx
+from langchain_core.messages import HumanMessage
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_deepseek import ChatDeepSeek
+
+DEFAULT_MODEL = "deepseek-chat"
+
+_default_llm = None
+_default_lock = threading.Lock()
+
+
+def build_llm(model: str = DEFAULT_MODEL, max_connections: int = 64, keepalive_expiry: float = 30.0,
+              timeout: float = 60.0, max_retries: int = 3, requests_per_second: float = None, **kwargs):
+    """
+    创建一个带连接池、限流和重试的 ChatDeepSeek。
+
+    Args:
+        model (str, optional): 模型名。默认 "deepseek-chat"。
+        max_connections (int, optional): 连接池的最大连接数，应不小于并发数。默认 64。
+        keepalive_expiry (float, optional): 空闲连接保留的秒数。默认 30。
+        timeout (float, optional): 单次请求超时（秒）。默认 60。
+        max_retries (int, optional): 429 / 5xx / 连接错误的最大重试次数。默认 3。
+        requests_per_second (float, optional): 每秒请求数上限，None 表示不限流。
+        **kwargs: 其余参数原样传给 ChatDeepSeek（例如 api_base、api_key）。
+
+    Returns:
+        ChatDeepSeek: 可在多个线程和协程之间共享的客户端。
+    """
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    rate_limiter = None
+    if requests_per_second:
+        rate_limiter = InMemoryRateLimiter(
+            requests_per_second=requests_per_second,
+            check_every_n_seconds=0.05,
+            max_bucket_size=max(1, requests_per_second),
+        )
+    return ChatDeepSeek(
+        model=model,
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+        max_retries=max_retries,
+        rate_limiter=rate_limiter,
+        **kwargs,
+    )
+
+
+def get_llm():
+    """返回进程级共享的默认客户端，首次调用时创建。"""
+    global _default_llm
+    if _default_llm is None:
+        with _default_lock:
+            if _default_llm is None:
+                _default_llm = build_llm()
+    return _default_llm
+
+
+def llm_from_config(config) -> ChatDeepSeek:
+    """优先使用通过 `config["configurable"]["llm"]` 注入的客户端。"""
+    configurable = (config or {}).get("configurable", {})
+    return configurable.get("llm") or get_llm()
+
+
+# --- Benchmark ---
+
+def _time_calls(make_llm, num_calls: int) -> list:
+    latencies = []
+    messages = [HumanMessage(content="你的决定是（请只回答“批准”或“拒绝”）:")]
+    for _ in range(num_calls):
+        start = time.perf_counter()
+        llm, cleanup = make_llm()
+        llm.invoke(messages)
+        cleanup()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def benchmark(num_calls: int = 50, latency: float = 0.05, connect_latency: float = 0.05) -> list:
+    """在本地模拟服务上逐条调用，对比每次新建客户端与共享连接池的单条延迟和建连次数。"""
+    from fake_chat_server import start_in_background
+
+    results = []
+    for label, shared in (("new client per claim", False), ("shared pooled client", True)):
+        server = start_in_background(latency=latency, connect_latency=connect_latency)
+        options = {
+            "api_base": f"http://127.0.0.1:{server.server_address[1]}/v1",
+            "api_key": "fake",
+        }
+        if shared:
+            pooled = build_llm(**options)
+            make_llm = lambda: (pooled, lambda: None)
+        else:
+            # 旧行为：每条申请一个新的 HTTP 客户端，用完即关闭
+            def make_llm():
+                client = httpx.Client()
+                return ChatDeepSeek(model=DEFAULT_MODEL, http_client=client, **options), client.close
+
+        latencies = _time_calls(make_llm, num_calls)
+        stats = server.stats()
+        server.shutdown()
+        server.server_close()
+        results.append({
+            "config": label,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": statistics.quantiles(latencies, n=20)[-1] * 1000,
+            "connections": stats["connections"],
+            "requests": stats["requests"],
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享 LLM 客户端的基准测试")
+    parser.add_argument("--benchmark", action="store_true", help="在本地模拟服务上对比两种客户端")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟的推理延迟（秒）")
+    parser.add_argument("--connect-latency", type=float, default=0.05, help="模拟的建连/握手延迟（秒）")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        return
+
+    print(f"{'config':<24}{'mean (ms)':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}{'connections':>13}")
+    for row in benchmark(args.calls, args.latency, args.connect_latency):
+        print(f"{row['config']:<24}{row['mean_ms']:>11.1f}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['connections']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+审批流程的逐节点耗时追踪与汇总指标。
+
+流程里只有 `print` 打出的进度信息，看不出一条申请的时间究竟花在工具查询上还是 LLM 上。
+`Tracer` 记录以下几类调用的开始时间、耗时和是否出错：
+
+1.  **node**：图中的每个节点（由 `build_app(tracer=...)` 包装）；
+2.  **router**：条件路由函数；
+3.  **tool**：用 `traced_tool` 装饰的工具函数，例如 `query_employee_history`；
+4.  **llm**：通过 LangChain 回调记录每次模型调用的耗时和 token 用量
+    （把 `tracer.callback_handler()` 放进 `config["callbacks"]`）。
+
+结果可以导出为 Chrome trace JSON（在 chrome://tracing 或 https://ui.perfetto.dev 中打开），
+也可以打印每个节点 p50 / p95 耗时的汇总表。
+"""
+
+import contextvars
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# 当前正在处理的申请，由节点包装器设置，工具和 LLM 回调据此标注 claim_id
+_current_claim = contextvars.ContextVar("current_claim", default=None)
+_active_tracer = None
+
+
+def percentile(values: list, q: float) -> float:
+    """最近秩 (nearest-rank) 百分位数，q 取 0~100。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Tracer:
+    """线程安全的调用追踪器。"""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def install(self):
+        """设为当前进程的活动追踪器，`traced_tool` 装饰的工具会向它报告。返回 self。"""
+        global _active_tracer
+        _active_tracer = self
+        return self
+
+    def record(self, name: str, kind: str, start: float, end: float, error: str = None, **extra):
+        span = {
+            "name": name,
+            "kind": kind,
+            "start": start,
+            "duration": end - start,
+            "thread": threading.get_ident(),
+            "claim_id": _current_claim.get(),
+            "error": error,
+            **extra,
+        }
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str, **extra):
+        """记录一段代码的耗时；代码抛出异常时记为错误并继续向上抛。"""
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.record(name, kind, start, time.perf_counter(), error, **extra)
+
+    # --- 包装 ---
+
+    def wrap_node(self, name: str, node):
+        """包装一个图节点；节点签名里有 config 时照常传入。"""
+        accepts_config = "config" in inspect.signature(node).parameters
+
+        # 不用 functools.wraps：LangGraph 按 __wrapped__ 的签名决定是否传入 config
+        def wrapper(state, config):
+            claim_id = (config or {}).get("configurable", {}).get("claim_id")
+            token = _current_claim.set(claim_id)
+            try:
+                with self.span(name, "node"):
+                    return node(state, config) if accepts_config else node(state)
+            finally:
+                _current_claim.reset(token)
+
+        wrapper.__name__ = getattr(node, "__name__", name)
+        wrapper.__doc__ = node.__doc__
+        return wrapper
+
+    def wrap_router(self, name: str, router):
+        def wrapper(state):
+            with self.span(name, "router"):
+                return router(state)
+
+        wrapper.__name__ = getattr(router, "__name__", name)
+        wrapper.__doc__ = router.__doc__
+        return wrapper
+
+    def callback_handler(self):
+        """返回记录 LLM 调用耗时与 token 用量的 LangChain 回调。"""
+        return _LLMTraceHandler(self)
+
+    # --- 导出 ---
+
+    def spans(self) -> list:
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self) -> list:
+        """按 (类型, 名称) 汇总调用次数、错误数、总耗时和 p50 / p95 / max（毫秒）。"""
+        groups = defaultdict(list)
+        for span in self.spans():
+            groups[(span["kind"], span["name"])].append(span)
+        rows = []
+        for (kind, name), spans in groups.items():
+            durations = [s["duration"] * 1000 for s in spans]
+            row = {
+                "kind": kind,
+                "name": name,
+                "calls": len(spans),
+                "errors": sum(s["error"] is not None for s in spans),
+                "total_ms": sum(durations),
+                "p50_ms": percentile(durations, 50),
+                "p95_ms": percentile(durations, 95),
+                "max_ms": max(durations),
+            }
+            if kind == "llm":
+                row["input_tokens"] = sum(s.get("input_tokens", 0) for s in spans)
+                row["output_tokens"] = sum(s.get("output_tokens", 0) for s in spans)
+            rows.append(row)
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def format_summary(self) -> str:
+        header = f"{'kind':<8}{'name':<28}{'calls':>7}{'errors':>8}{'total (s)':>11}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+        lines = [header, "-" * len(header)]
+        for row in self.summary():
+            lines.append(
+                f"{row['kind']:<8}{row['name']:<28}{row['calls']:>7}{row['errors']:>8}"
+                f"{row['total_ms'] / 1000:>11.2f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+            )
+            if row["kind"] == "llm":
+                lines.append(f"{'':<8}  tokens: input {row['input_tokens']}, output {row['output_tokens']}")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path: str):
+        """每个线程一条泳道，每次调用一个 complete 事件，参数中附带 claim_id、错误和 token 数。"""
+        lanes = {}
+        events = []
+        for span in self.spans():
+            tid = lanes.setdefault(span["thread"], len(lanes))
+            args = {k: v for k, v in span.items()
+                    if k not in ("name", "kind", "start", "duration", "thread") and v is not None}
+            events.append({
+                "name": span["name"],
+                "cat": span["kind"],
+                "ph": "X",
+                "ts": (span["start"] - self._origin) * 1e6,
+                "dur": span["duration"] * 1e6,
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            })
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+def traced_tool(func):
+    """工具函数装饰器：存在活动追踪器时记录每次调用，否则原样执行。"""
+
+    def wrapper(*args, **kwargs):
+        if _active_tracer is None:
+            return func(*args, **kwargs)
+        with _active_tracer.span(func.__name__, "tool"):
+            return func(*args, **kwargs)
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+class _LLMTraceHandler(BaseCallbackHandler):
+    """在 LLM 调用开始和结束时记录耗时，并从响应中读取 token 用量。"""
+
+    def __init__(self, tracer: Tracer):
+        self.tracer = tracer
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = (kwargs.get("metadata") or {}).get("ls_model_name") or "llm"
+        self._starts[run_id] = (time.perf_counter(), model)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, **kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, model = self._starts.pop(run_id, (None, "llm"))
+        if start is None:
+            return
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        if not input_tokens and response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            input_tokens = usage.get("prompt_tokens", 0)
+            output_tokens = usage.get("completion_tokens", 0)
+        self.tracer.record(model, "llm", start, time.perf_counter(),
+                           input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start, model = self._starts.pop(run_id, (None, "llm"))
+        if start is not None:
+            self.tracer.record(model, "llm", start, time.perf_counter(), error=type(error).__name__)
@@ -4,6 +4,7 @@
 核心功能：
 1.  **状态管理**: 使用 TypedDict 定义图的共享状态，跟踪申请信息和审批决定。
 2.  **条件路由**: 根据报销金额（<500元）决定是自动批准还是需要经理审批。
+    需要经理审批的申请先经过规则表和决定缓存，只有两者都无法决定时才调用 LLM。
 3.  **工具使用**: 定义并调用一个工具来查询员工的历史报销记录。
 4.  **大模型集成**: 利用 DeepSeek 的聊天模型，模拟经理根据综合信息（申请详情、历史记录）进行决策。
 5.  **端到端流程**: 完整实现了从申请提交到最终决策的图流程，并提供了两个不同场景的调用示例。
@@ -19,10 +20,16 @@ import os
 from typing import TypedDict, Annotated, List
 import operator
 from langchain_core.messages import HumanMessage, BaseMessage
-from langchain_deepseek import ChatDeepSeek
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from dotenv import load_dotenv
 
+from approval_rules import RuleTable
+from decision_cache import DecisionCache
+from history_service import EmployeeHistoryService
+from llm_client import llm_from_config
+from tracing import traced_tool
+
 # 加载 .env 文件中的环境变量
 load_dotenv()
 
@@ -37,6 +44,7 @@ class GraphState(TypedDict):
         reason: 事由
         history_check_result: 历史记录检查结果
         decision: 最终决定 ("自动批准", "批准", "拒绝")
+        decision_source: 决定的来源（金额阈值、规则名、缓存或 LLM）
         messages: 交流消息列表
     """
     employee_name: str
@@ -44,38 +52,83 @@ class GraphState(TypedDict):
     reason: str
     history_check_result: str
     decision: str
+    decision_source: str
     messages: Annotated[List[BaseMessage], operator.add]
 
 
 # --- 2. 定义工具 ---
-def query_employee_history(employee_name: str) -> str:
+def fetch_employee_histories(employee_names: list) -> dict:
     """
-    一个模拟的工具，用于查询员工的历史报销记录。
-    在真实场景中，这里会连接到公司的数据库或API。
+    一个模拟的批量查询，用于一次取回多名员工的历史报销记录。
+    在真实场景中，这里会是一条 `WHERE name IN (...)` 的数据库查询或一次批量 API 调用。
     """
-    print(f"--- 工具调用：正在查询 {employee_name} 的历史记录... ---")
+    print(f"--- 工具调用：正在查询 {'、'.join(employee_names)} 的历史记录... ---")
     # 模拟返回结果
-    if "王" in employee_name:
-        return f"员工 {employee_name} 的历史报销记录良好，无异常。"
-    else:
-        return f"员工 {employee_name} 在过去一年内有两次大额报销记录，需要注意。"
+    histories = {}
+    for employee_name in employee_names:
+        if "王" in employee_name:
+            histories[employee_name] = f"员工 {employee_name} 的历史报销记录良好，无异常。"
+        else:
+            histories[employee_name] = f"员工 {employee_name} 在过去一年内有两次大额报销记录，需要注意。"
+    return histories
+
+# 历史记录查询服务：结果缓存 5 分钟，同一员工的并发查询只发起一次
+history_service = EmployeeHistoryService(fetch_employee_histories, ttl_seconds=300)
+
+@traced_tool
+def query_employee_history(employee_name: str) -> str:
+    """
+    查询员工的历史报销记录的工具。
+    经由 history_service 查询，重复查询直接命中缓存。
+    """
+    return history_service.get(employee_name)
+
+# 规则表（approval_rules.json）与 LLM 决定缓存，在调用 LLM 之前先处理界限分明的和重复的情形
+rule_table = RuleTable.from_file()
+decision_cache = DecisionCache()
 
 # --- 3. 定义图的节点 ---
 
 def direct_approval_node(state: GraphState) -> dict:
     """直接批准节点：更新状态为自动批准"""
     print("--- 节点：进入直接批准流程 ---")
-    return {"decision": "自动批准"}
+    return {"decision": "自动批准", "decision_source": "金额阈值"}
+
+def history_check_node(state: GraphState) -> dict:
+    """背景调查节点：调用工具查询历史记录，供后面的规则、缓存和经理审批共用"""
+    print("--- 节点：进入背景调查流程 ---")
+    return {"history_check_result": query_employee_history(state["employee_name"])}
+
+def rules_node(state: GraphState) -> dict:
+    """规则节点：用规则表处理界限分明的情形"""
+    matched = rule_table.evaluate(
+        state["employee_name"], state["amount"], state["reason"], state["history_check_result"]
+    )
+    if matched is None:
+        return {}
+    name, decision = matched
+    print(f"--- 规则命中：{name} -> {decision} ---")
+    return {"decision": decision, "decision_source": f"规则：{name}"}
+
+def decision_cache_node(state: GraphState) -> dict:
+    """缓存节点：相同情形（员工、金额区间、事由、历史记录）已经由 LLM 决定过，直接复用"""
+    decision = decision_cache.get(
+        state["employee_name"], state["amount"], state["reason"], state["history_check_result"]
+    )
+    if decision is None:
+        return {}
+    print(f"--- 缓存命中：{decision} ---")
+    return {"decision": decision, "decision_source": "缓存"}
 
-def manager_approval_node(state: GraphState) -> dict:
-    """经理审批节点：调用工具和LLM进行决策"""
+def manager_approval_node(state: GraphState, config: RunnableConfig) -> dict:
+    """经理审批节点：调用LLM进行决策"""
     print("--- 节点：进入经理审批流程 ---")
     
-    # 1. 调用工具查询历史记录
-    history = query_employee_history(state["employee_name"])
+    # 1. 背景调查结果已由 history_check 节点写入状态
+    history = state["history_check_result"]
     
-    # 2. 准备与 LLM 交互
-    llm = ChatDeepSeek(model="deepseek-chat")
+    # 2. 准备与 LLM 交互：复用共享的连接池客户端，而不是每条申请新建一个
+    llm = llm_from_config(config)
     
     # 3. 构建提示
     prompt = f"""
@@ -101,10 +154,12 @@ def manager_approval_node(state: GraphState) -> dict:
     decision = response.content
     
     print(f"--- LLM决策结果：{decision} ---")
+    decision_cache.put(state["employee_name"], state["amount"], state["reason"], history, decision)
 
     return {
         "history_check_result": history,
-        "decision": decision
+        "decision": decision,
+        "decision_source": "LLM",
     }
 
 # --- 4. 定义条件路由 ---
@@ -119,57 +174,96 @@ def should_go_to_manager(state: GraphState) -> str:
         print(f"--- 金额 {state['amount']} >= 500，走向“经理审批” ---")
         return "manager_approval"
 
+def is_decided(state: GraphState) -> str:
+    """规则或缓存已经给出决定时直接结束，否则继续往下走"""
+    return "decided" if state.get("decision") else "undecided"
+
 # --- 5. 构建图 ---
+NODES = {
+    "direct_approval": direct_approval_node,
+    "history_check": history_check_node,
+    "rules": rules_node,
+    "decision_cache": decision_cache_node,
+    "manager_approval": manager_approval_node,
+}
+
+def build_app(checkpoint_store=None, tracer=None):
+    """
+    构建并编译审批流程图。
+
+    Args:
+        checkpoint_store (SQLiteCheckpointStore, optional): 传入时每个节点都被包装成
+            带逐节点检查点的版本（见 checkpoint_store.py），批量执行中断后可以续跑。
+        tracer (Tracer, optional): 传入时记录每个节点和路由函数的耗时（见 tracing.py）。
+    """
+    workflow = StateGraph(GraphState)
+
+    # 添加节点：检查点在内层，追踪在外层，因此命中检查点的节点也会被计时
+    for name, node in NODES.items():
+        if checkpoint_store:
+            node = checkpoint_store.wrap(name, node)
+        if tracer:
+            node = tracer.wrap_node(name, node)
+        workflow.add_node(name, node)
+
+    def router(name, func):
+        return tracer.wrap_router(name, func) if tracer else func
+
+    # 设置入口点和条件路由
+    workflow.set_conditional_entry_point(
+        router("should_go_to_manager", should_go_to_manager),
+        {
+            "direct_approval": "direct_approval",
+            "manager_approval": "history_check",
+        },
+    )
+
+    # 经理审批路径：背景调查 -> 规则表 -> 决定缓存 -> LLM，前面任何一步给出决定就提前结束
+    workflow.add_edge("history_check", "rules")
+    workflow.add_conditional_edges(
+        "rules", router("is_decided@rules", is_decided), {"decided": END, "undecided": "decision_cache"}
+    )
+    workflow.add_conditional_edges(
+        "decision_cache", router("is_decided@decision_cache", is_decided), {"decided": END, "undecided": "manager_approval"}
+    )
+
+    # 添加从节点到终点的边
+    workflow.add_edge("direct_approval", END)
+    workflow.add_edge("manager_approval", END)
+
+    # 编译图
+    return workflow.compile()
+
 print("构建审批流程图...")
-workflow = StateGraph(GraphState)
-
-# 添加节点
-workflow.add_node("direct_approval", direct_approval_node)
-workflow.add_node("manager_approval", manager_approval_node)
-
-# 设置入口点和条件路由
-workflow.set_conditional_entry_point(
-    should_go_to_manager,
-    {
-        "direct_approval": "direct_approval",
-        "manager_approval": "manager_approval",
-    },
-)
-
-# 添加从节点到终点的边
-workflow.add_edge("direct_approval", END)
-workflow.add_edge("manager_approval", END)
-
-# 编译图
-app = workflow.compile()
+app = build_app()
 print("审批流程图构建完成！\n")
 
 # --- 6. 提供调用示例 ---
+# 被 batch_runner.py 等模块导入时只构建图，不运行示例
+if __name__ == "__main__":
+    # 示例1: 小额报销，应自动批准
+    print("====== 案例1: 小额报销 ======")
+    small_expense_input = {
+        "employee_name": "张三",
+        "amount": 300,
+        "reason": "市内交通费",
+        "messages": []
+    }
+    final_state_small = app.invoke(small_expense_input)
+    print("\n--- 最终审批结果 [小额] ---")
+    print(final_state_small)
+    print("============================\n")
 
-# 示例1: 小额报销，应自动批准
-print("====== 案例1: 小额报销 ======")
-small_expense_input = {
-    "employee_name": "张三",
-    "amount": 300,
-    "reason": "市内交通费",
-    "messages": []
-}
-final_state_small = app.invoke(small_expense_input)
-print("\n--- 最终审批结果 [小额] ---")
-print(final_state_small)
-print("============================\n")
-
-
-# 示例2: 大额报销，需要经理审批
-print("====== 案例2: 大额报销 ======")
-large_expense_input = {
-    "employee_name": "李四",
-    "amount": 5000,
-    "reason": "交通费",
-    "messages": []
-}
-final_state_large = app.invoke(large_expense_input)
-print("\n--- 最终审批结果 [大额] ---")
-print(final_state_large)
-print("============================")
 
+    # 示例2: 大额报销，需要经理审批
+    print("====== 案例2: 大额报销 ======")
+    large_expense_input = {
+        "employee_name": "李四",
+        "amount": 5000,
+        "reason": "交通费",
+        "messages": []
+    }
+    final_state_large = app.invoke(large_expense_input)
+    print("\n--- 最终审批结果 [大额] ---")
+    print(final_state_large)
+    print("============================")
@@ -0,0 +1,286 @@
+"""
+CrewAI 团队运行的结构化遥测：每个 Agent 每一步一条 JSONL 记录。
+
+`verbose=2` 只在控制台打印过程，看不出一次运行慢在哪个 Agent、贵在哪个工具。
+`CrewTelemetry.attach(agent)` 给 Agent 装上两个钩子：
+
+1.  **LangChain 回调**：挂在 Agent 自己的 LLM 上（多个 Agent 共用一个 LLM 对象时先复制一份，
+    否则每个 Agent 的回调都会收到所有 Agent 的调用），记录每次 LLM 调用的耗时和 token 数。流式输出的响应里没有用量信息时，用 tiktoken 按提示词和输出文本估算，
+    并在记录中标注 `"estimated_tokens": true`；
+2.  **step_callback**：Agent 每完成一步（调用一次工具或给出最终答案）写一条记录，包含这一步中的
+    LLM 调用、工具名称、输入、耗时和结果长度。委派工具（“Delegate work to co-worker”、
+    “Ask question to co-worker”）记为 `delegation`，并记下被委派的同事。
+
+CrewAI 直接调用工具的 `_run`，不触发 LangChain 工具回调，所以工具耗时取这一步中最后一次
+LLM 调用结束到 step_callback 之间的时间；委派时其中包含同事完成任务的全部时间。
+
+汇总：
+    python agent_telemetry.py telemetry.jsonl
+"""
+
+import argparse
+import copy
+import json
+import math
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DELEGATION_TOOLS = ("Delegate work to co-worker", "Ask question to co-worker")
+
+_encoding = None
+
+
+def _count_tokens(text: str) -> int:
+    """用 tiktoken 的 cl100k_base 估计 token 数；没有 tiktoken 或词表无法下载时按字符数粗略估计。"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 2)
+
+
+def percentile(values: list, q: float) -> float:
+    """最近秩 (nearest-rank) 百分位数，q 取 0~100。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class CrewTelemetry:
+    """
+    把团队运行的逐步记录写入 JSONL 文件（追加写入，多次运行用 run_id 区分）。
+
+    Args:
+        path (str): JSONL 日志路径。
+        run_id (str, optional): 本次运行的标识。默认随机生成。
+    """
+
+    def __init__(self, path: str, run_id: str = None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def attach(self, agent):
+        """
+        给 Agent 装上遥测钩子。需要在 kickoff 之前调用（kickoff 会据此重建 Agent 执行器）；
+        会替换 Agent 已有的 step_callback。
+        """
+        handler = _AgentTelemetryHandler(self, agent.role)
+        # Agent 执行器构造时传入的 callbacks 不会传给内部的 LLM 调用，只能挂在 LLM 上
+        agent.llm = copy.copy(agent.llm)
+        agent.llm.callbacks = [*(agent.llm.callbacks or []), handler]
+        agent.step_callback = handler.on_step
+        return agent
+
+    def write(self, record: dict):
+        record = {"run_id": self.run_id, "ts": time.time(), **record}
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class _AgentTelemetryHandler(BaseCallbackHandler):
+    """一个 Agent 的 LLM 回调与 step_callback；按线程暂存一步之内的 LLM 调用。"""
+
+    def __init__(self, telemetry: CrewTelemetry, agent_role: str):
+        self.telemetry = telemetry
+        self.agent_role = agent_role
+        self._starts = {}  # run_id -> (开始时间, 估算的提示词 token 数)
+        self._local = threading.local()
+
+    def _pending(self) -> dict:
+        if not hasattr(self._local, "pending"):
+            self._local.pending = {"latencies": [], "prompt_tokens": 0, "completion_tokens": 0,
+                                   "estimated": False, "last_end": None, "step": 0}
+        return self._local.pending
+
+    # --- LLM 回调 ---
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = "\n".join(str(m.content) for batch in messages for m in batch)
+        self._starts[run_id] = (time.perf_counter(), _count_tokens(prompt))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = (time.perf_counter(), sum(_count_tokens(p) for p in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start, estimated_prompt = self._starts.pop(run_id, (None, 0))
+        if start is None:
+            return
+        end = time.perf_counter()
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        pending = self._pending()
+        if prompt_tokens is None:
+            text = "".join(g.text for generations in response.generations for g in generations)
+            prompt_tokens, completion_tokens = estimated_prompt, _count_tokens(text)
+            pending["estimated"] = True
+        pending["latencies"].append(end - start)
+        pending["prompt_tokens"] += prompt_tokens
+        pending["completion_tokens"] += completion_tokens or 0
+        pending["last_end"] = end
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start, _ = self._starts.pop(run_id, (None, 0))
+        if start is not None:
+            self.telemetry.write({"agent": self.agent_role, "kind": "llm_error",
+                                  "llm_seconds": time.perf_counter() - start, "error": repr(error)})
+
+    # --- step_callback ---
+
+    def on_step(self, step_output):
+        now = time.perf_counter()
+        pending = self._pending()
+        pending["step"] += 1
+        record = {
+            "agent": self.agent_role,
+            "step": pending["step"],
+            "llm_calls": len(pending["latencies"]),
+            "llm_latencies": pending["latencies"],
+            "llm_seconds": sum(pending["latencies"]),
+            "prompt_tokens": pending["prompt_tokens"],
+            "completion_tokens": pending["completion_tokens"],
+            "estimated_tokens": pending["estimated"],
+        }
+        tool_seconds = now - pending["last_end"] if pending["last_end"] is not None else 0.0
+
+        if isinstance(step_output, list):  # [(AgentAction, observation), ...]
+            actions = [
+                {
+                    "tool": action.tool,
+                    "tool_input": action.tool_input,
+                    "observation_chars": len(str(observation)),
+                }
+                for action, observation in step_output
+            ]
+            delegations = [a for a in actions if a["tool"] in DELEGATION_TOOLS]
+            record["kind"] = "delegation" if delegations else "tool"
+            record["actions"] = actions
+            record["tool_seconds"] = tool_seconds
+            for action in delegations:
+                tool_input = action["tool_input"]
+                if isinstance(tool_input, str):
+                    try:
+                        tool_input = json.loads(tool_input)
+                    except ValueError:
+                        tool_input = {}
+                action["coworker"] = tool_input.get("coworker") if isinstance(tool_input, dict) else None
+        else:  # AgentFinish
+            record["kind"] = "finish"
+            record["output_chars"] = len(str(step_output.return_values.get("output", "")))
+
+        self.telemetry.write(record)
+        self._local.pending = {"latencies": [], "prompt_tokens": 0, "completion_tokens": 0,
+                               "estimated": False, "last_end": None, "step": pending["step"]}
+
+
+# --- 汇总 ---
+
+def load_records(path: str, run_id: str = None) -> list:
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                records.append(json.loads(line))
+    if run_id is None and records:
+        run_id = records[-1]["run_id"]  # 默认只看最近一次运行
+    return [r for r in records if r["run_id"] == run_id]
+
+
+def summarize(records: list) -> dict:
+    """按 Agent 和工具汇总步数、LLM 调用次数、耗时与 token 数。"""
+    agents = defaultdict(lambda: {"steps": 0, "llm_calls": 0, "llm_seconds": 0.0, "latencies": [],
+                                  "prompt_tokens": 0, "completion_tokens": 0, "tool_seconds": 0.0,
+                                  "delegations": 0, "errors": 0})
+    tools = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+    delegations = defaultdict(int)
+    for r in records:
+        a = agents[r["agent"]]
+        if r["kind"] == "llm_error":
+            a["errors"] += 1
+            continue
+        a["steps"] += 1
+        a["llm_calls"] += r["llm_calls"]
+        a["llm_seconds"] += r["llm_seconds"]
+        a["latencies"].extend(r["llm_latencies"])
+        a["prompt_tokens"] += r["prompt_tokens"]
+        a["completion_tokens"] += r["completion_tokens"]
+        if r["kind"] in ("tool", "delegation"):
+            a["tool_seconds"] += r["tool_seconds"]
+            for action in r["actions"]:
+                # 一步调用多个工具时平均分摊这一步的工具耗时
+                tools[action["tool"]]["calls"] += 1
+                tools[action["tool"]]["seconds"] += r["tool_seconds"] / len(r["actions"])
+                if "coworker" in action:
+                    a["delegations"] += 1
+                    delegations[(r["agent"], action.get("coworker"))] += 1
+    for a in agents.values():
+        latencies = a.pop("latencies")
+        a["p50_llm_ms"] = percentile(latencies, 50) * 1000
+        a["p95_llm_ms"] = percentile(latencies, 95) * 1000
+    return {"agents": dict(agents), "tools": dict(tools), "delegations": dict(delegations)}
+
+
+def format_summary(summary: dict) -> str:
+    header = (f"{'agent':<36}{'steps':>6}{'llm':>6}{'llm (s)':>9}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+              f"{'prompt':>9}{'compl.':>8}{'tool (s)':>10}")
+    lines = [header, "-" * len(header)]
+    rows = sorted(summary["agents"].items(), key=lambda item: item[1]["llm_seconds"] + item[1]["tool_seconds"],
+                  reverse=True)
+    for agent, a in rows:
+        lines.append(
+            f"{agent[:35]:<36}{a['steps']:>6}{a['llm_calls']:>6}{a['llm_seconds']:>9.1f}{a['p50_llm_ms']:>10.0f}"
+            f"{a['p95_llm_ms']:>10.0f}{a['prompt_tokens']:>9}{a['completion_tokens']:>8}{a['tool_seconds']:>10.1f}"
+        )
+    if summary["tools"]:
+        lines += ["", f"{'tool':<36}{'calls':>6}{'time (s)':>10}"]
+        for tool, t in sorted(summary["tools"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+            lines.append(f"{tool[:35]:<36}{t['calls']:>6}{t['seconds']:>10.1f}")
+    if summary["delegations"]:
+        lines += ["", "delegations:"]
+        for (agent, coworker), count in summary["delegations"].items():
+            lines.append(f"  {agent} -> {coworker}: {count}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总 CrewAI 团队运行的遥测日志")
+    parser.add_argument("path", help="CrewTelemetry 写出的 JSONL 文件")
+    parser.add_argument("--run-id", default=None, help="要汇总的运行，默认是日志中最近一次")
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是表格")
+    args = parser.parse_args()
+
+    records = load_records(args.path, args.run_id)
+    if not records:
+        raise SystemExit(f"No telemetry records in {args.path}")
+    summary = summarize(records)
+    if args.json:
+        summary["delegations"] = [{"agent": agent, "coworker": coworker, "count": count}
+                                  for (agent, coworker), count in summary["delegations"].items()]
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(f"run {records[0]['run_id']}: {len(records)} steps")
+        print(format_summary(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+任务之间的上下文压缩：去重 + 抽取式摘要，并受 token 预算约束。
+
+CrewAI 把 `context=[...]` 中上游任务的完整原始输出拼接后放进下游任务的提示词，
+研究员各自整理的新闻往往有重复，分析师的长篇报告又会整体传给撰稿人，提示词一级比一级长。
+`ContextCompactor` 在下游任务开始前处理上游输出：
+
+1.  **切分**：按空行和列表项（`1.`、`-`、`*` 等开头的行）把上游输出切成条目，一条新闻通常就是一个条目；
+2.  **去重**：链接相同，或字符二元组的 Jaccard 相似度超过 `similarity_threshold` 的条目只保留第一次出现的；
+3.  **抽取式摘要**：去重后仍超出 `token_budget` 时，把条目拆成句子，按句子与全文高频词的重合程度打分
+    （每个条目的第一句通常是标题，额外加权；“链接：”这类几乎每个条目都有的词不计分，
+    只有链接的短句并入前一句），在预算内按分数从高到低挑选，再按原文顺序输出。
+
+不调用 LLM，压缩本身几乎没有延迟。token 数默认用字符数粗略估计（中文约 0.6、其他字符约 0.3 token/字符），
+需要精确计数时传入 `count_tokens`，例如 `lambda text: len(tokenizer.encode(text))`。
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+
+from search_tool import tokenize
+
+_LIST_ITEM_RE = re.compile(r"^\s*(?:\d+[.、)）]|[-*•])\s+")
+_URL_RE = re.compile(r"https?://\S+")
+_SENTENCE_RE = re.compile(r"[^。！？!?\n]+(?:[。！？!?]+|$)|[^\n]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符数粗略估计 token 数。"""
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+def split_items(text: str) -> list:
+    """按空行和列表项切分成条目；列表项之后不以列表标记开头的行归入该项。"""
+    items = []
+    for block in re.split(r"\n\s*\n", text):
+        current = []
+        for line in block.splitlines():
+            if not line.strip():
+                continue
+            if _LIST_ITEM_RE.match(line) and current:
+                items.append("\n".join(current))
+                current = []
+            current.append(line.rstrip())
+        if current:
+            items.append("\n".join(current))
+    return items
+
+
+def _shingles(text: str) -> set:
+    return set(tokenize(_URL_RE.sub(" ", text)))
+
+
+class ContextCompactor:
+    """
+    线程安全的上下文压缩器（并行执行时多个任务可能同时压缩各自的上下文）。
+
+    Args:
+        token_budget (int): 压缩后上下文的 token 上限。
+        similarity_threshold (float, optional): 判定两个条目重复的 Jaccard 相似度阈值。默认 0.6。
+        count_tokens (callable, optional): token 计数函数。默认使用 `estimate_tokens`。
+    """
+
+    def __init__(self, token_budget: int, similarity_threshold: float = 0.6, count_tokens=None):
+        self.token_budget = token_budget
+        self.similarity_threshold = similarity_threshold
+        self.count_tokens = count_tokens or estimate_tokens
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "tokens_in": 0, "tokens_out": 0, "duplicates_removed": 0, "sentences_dropped": 0}
+
+    def deduplicate(self, items: list) -> list:
+        kept, kept_shingles, kept_urls = [], [], set()
+        for item in items:
+            urls = set(_URL_RE.findall(item))
+            shingles = _shingles(item)
+            duplicate = bool(urls & kept_urls) or any(
+                shingles and len(shingles & other) / len(shingles | other) >= self.similarity_threshold
+                for other in kept_shingles
+            )
+            if not duplicate:
+                kept.append(item)
+                kept_shingles.append(shingles)
+                kept_urls |= urls
+        return kept
+
+    def summarize(self, items: list) -> tuple:
+        """
+        在 token 预算内挑选得分最高的句子，按原文顺序拼回各条目。
+
+        Returns:
+            tuple: (压缩后的条目列表, 丢弃的句子数)。
+        """
+        sentences = []  # (条目序号, 句中序号, 文本)
+        for i, item in enumerate(items):
+            parts = []
+            for match in _SENTENCE_RE.finditer(item):
+                text = match.group().strip()
+                if not text:
+                    continue
+                if parts and len(tokenize(_URL_RE.sub(" ", text))) <= 2:
+                    parts[-1] += " " + text  # “链接: https://...” 跟随它说明的那句话
+                else:
+                    parts.append(text)
+            sentences.extend((i, j, text) for j, text in enumerate(parts))
+
+        term_counts = Counter(term for _, _, text in sentences for term in set(tokenize(text)))
+        item_counts = Counter(term for item in items for term in _shingles(item))
+        boilerplate = {t for t, n in item_counts.items() if len(items) >= 4 and n > len(items) / 2}
+
+        def score(sentence):
+            _, position, text = sentence
+            terms = set(tokenize(_URL_RE.sub(" ", text))) - boilerplate
+            if not terms:
+                return 0.0
+            # 只被一个句子用到的词 log(1) = 0，不计分，避免偏向生僻内容
+            centrality = sum(math.log(term_counts[t]) for t in terms) / math.sqrt(len(terms))
+            return centrality * (1.5 if position == 0 else 1.0)
+
+        selected, used = set(), 0
+        for sentence in sorted(sentences, key=score, reverse=True):
+            cost = self.count_tokens(sentence[2])
+            if used + cost <= self.token_budget:
+                selected.add(sentence[:2])
+                used += cost
+
+        compacted = {}
+        for i, j, text in sentences:
+            if (i, j) in selected:
+                compacted.setdefault(i, []).append(text)
+        return [" ".join(compacted[i]) for i in sorted(compacted)], len(sentences) - len(selected)
+
+    def compact(self, texts: list) -> str:
+        """压缩多个上游任务的输出，返回拼接后的上下文。"""
+        original = "\n".join(texts)
+        tokens_in = self.count_tokens(original)
+
+        items = [item for text in texts for item in split_items(text)]
+        unique = self.deduplicate(items)
+        context = original if len(unique) == len(items) else "\n\n".join(unique)
+        dropped = 0
+        if self.count_tokens(context) > self.token_budget:
+            summarized, dropped = self.summarize(unique)
+            context = "\n\n".join(summarized)
+        tokens_out = self.count_tokens(context)
+
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["tokens_in"] += tokens_in
+            self._stats["tokens_out"] += tokens_out
+            self._stats["duplicates_removed"] += len(items) - len(unique)
+            self._stats["sentences_dropped"] += dropped
+        return context
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_out"]
+        stats["saved_ratio"] = stats["tokens_saved"] / stats["tokens_in"] if stats["tokens_in"] else 0.0
+        return stats
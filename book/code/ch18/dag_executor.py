@@ -0,0 +1,192 @@
+"""
+按任务依赖关系并行执行 CrewAI 团队的执行器。
+
+`Process.sequential` 严格按列表顺序一个接一个地执行任务，即使两个任务之间没有任何依赖，
+后一个也要等前一个的 LLM 调用全部结束。实际上 Task 的 `context=[...]` 已经写明了依赖关系：
+一个任务只需要等它 context 中的任务完成。`DagExecutor` 据此把任务组织成有向无环图 (DAG)：
+
+1.  **并行调度**：所有依赖都已完成的任务立即提交到线程池，互不依赖的任务（例如多个
+    研究员分头搜索的子问题）同时运行，结果再汇总给依赖它们的任务（例如分析师）；
+2.  **同一 Agent 串行**：同一个 Agent 对象内部保存执行状态，不能同时执行两个任务，
+    因此每个 Agent 配一把锁；想让多个子任务并行，就给每个子任务一个独立的 Agent；
+3.  **关键路径报告**：记录每个任务的实际耗时，计算 DAG 上耗时最长的依赖链（关键路径），
+    它就是并行执行的理论最短时间，再加多少线程也无法更快；
+4.  **上下文压缩**（可选）：传入 `compactor`（见 context_compaction.py）时，
+    上游任务的输出先去重、压缩到 token 预算以内，再作为下游任务的上下文。
+
+用法：
+    crew = Crew(agents=[...], tasks=[...], process=Process.sequential)
+    result = DagExecutor(crew).kickoff(inputs={})
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from crewai.tools.agent_tools import AgentTools
+from crewai.utilities import I18N
+
+
+class DagExecutor:
+    """
+    按 `context` 依赖并行执行一个 Crew 中的任务。
+
+    Args:
+        crew (Crew): 已定义好 agents 与 tasks 的团队；其 process 设置在这里不起作用。
+        max_workers (int, optional): 同时执行的任务数上限，默认等于任务数；为 1 时即顺序执行。
+        compactor (ContextCompactor, optional): 上下文压缩器；默认把上游输出原样传给下游。
+    """
+
+    def __init__(self, crew, max_workers: int = None, compactor=None):
+        self.crew = crew
+        self.compactor = compactor
+        self.tasks = list(crew.tasks)
+        self.max_workers = max_workers or len(self.tasks)
+        self.dependencies = {id(task): list(task.context or []) for task in self.tasks}
+        self.timings = {}
+        self._agent_locks = {}
+        self._validate()
+
+    def _validate(self):
+        known = {id(task) for task in self.tasks}
+        for task in self.tasks:
+            for dep in self.dependencies[id(task)]:
+                if id(dep) not in known:
+                    raise ValueError(f"Task '{task.description[:40]}' depends on a task that is not in the crew")
+        self.topological_order()  # 有环时抛出异常
+
+    def _graph(self) -> tuple:
+        """返回 (每个任务尚未完成的依赖数, 每个任务的下游任务列表)。"""
+        remaining = {id(task): len(self.dependencies[id(task)]) for task in self.tasks}
+        dependents = {id(task): [] for task in self.tasks}
+        for task in self.tasks:
+            for dep in self.dependencies[id(task)]:
+                dependents[id(dep)].append(task)
+        return remaining, dependents
+
+    def topological_order(self) -> list:
+        """Kahn 算法拓扑排序；同一层内保持任务在 crew 中的原始顺序。"""
+        remaining, dependents = self._graph()
+        order = []
+        ready = [task for task in self.tasks if remaining[id(task)] == 0]
+        while ready:
+            task = ready.pop(0)
+            order.append(task)
+            for child in dependents[id(task)]:
+                remaining[id(child)] -= 1
+                if remaining[id(child)] == 0:
+                    ready.append(child)
+        if len(order) != len(self.tasks):
+            raise ValueError("Task context dependencies contain a cycle")
+        return order
+
+    # --- 执行 ---
+
+    def _prepare(self, inputs: dict):
+        """与 Crew.kickoff 相同的准备工作：插值输入、设置回调，为每个 Agent 创建执行器。"""
+        crew = self.crew
+        crew._interpolate_inputs(inputs)
+        crew._set_tasks_callbacks()
+        i18n = I18N(language=crew.language, language_file=crew.language_file)
+        for agent in crew.agents:
+            agent.i18n = i18n
+            agent.crew = crew
+            if not agent.function_calling_llm:
+                agent.function_calling_llm = crew.function_calling_llm
+            if not agent.step_callback:
+                agent.step_callback = crew.step_callback
+            agent.create_agent_executor()
+            self._agent_locks[id(agent)] = threading.Lock()
+
+        # 与顺序流程一样，允许委派的 Agent 获得向其他 Agent 委派的工具
+        for task in self.tasks:
+            if task.agent.allow_delegation:
+                others = [agent for agent in crew.agents if agent is not task.agent]
+                if others:
+                    task.tools += AgentTools(agents=others).tools()
+
+    def _run_task(self, task):
+        lock = self._agent_locks.setdefault(id(task.agent), threading.Lock())
+        with lock:
+            start = time.perf_counter()
+            if self.compactor is not None and task.context:
+                context = self.compactor.compact([dep.output.raw_output for dep in task.context])
+                # Task.execute 在 task.context 非空时会忽略传入的 context，改用上游原始输出
+                dependencies, task.context = task.context, None
+                try:
+                    output = task.execute(context=context)
+                finally:
+                    task.context = dependencies
+            else:
+                # 依赖的任务都已完成，Task.execute 会自行从 context 任务的输出拼出上下文
+                output = task.execute()
+            if task.async_execution:
+                task.thread.join()
+                output = task.output.exported_output
+            end = time.perf_counter()
+        self.timings[id(task)] = (start, end)
+        return output
+
+    def kickoff(self, inputs: dict = None):
+        """
+        执行全部任务，返回最后一个任务的输出（与顺序流程一致）。
+        """
+        self._prepare(inputs or {})
+        self._origin = time.perf_counter()
+        remaining, dependents = self._graph()
+
+        outputs = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {pool.submit(self._run_task, task): task for task in self.tasks if remaining[id(task)] == 0}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    outputs[id(task)] = future.result()  # 任务失败时直接抛出，与顺序流程一致
+                    for child in dependents[id(task)]:
+                        remaining[id(child)] -= 1
+                        if remaining[id(child)] == 0:
+                            running[pool.submit(self._run_task, child)] = child
+        self.wall_time = time.perf_counter() - self._origin
+
+        metrics = [agent._token_process.get_summary() for agent in self.crew.agents]
+        self.crew.usage_metrics = {key: sum(m[key] for m in metrics if m is not None) for key in metrics[0]}
+        return outputs[id(self.tasks[-1])]
+
+    # --- 报告 ---
+
+    def critical_path(self) -> tuple:
+        """按实际耗时计算最长依赖链，返回 (任务列表, 总耗时秒数)。"""
+        finish = {}
+        previous = {}
+        for task in self.topological_order():
+            start, end = self.timings[id(task)]
+            best = max(self.dependencies[id(task)], key=lambda dep: finish[id(dep)], default=None)
+            finish[id(task)] = (finish[id(best)] if best is not None else 0.0) + (end - start)
+            previous[id(task)] = best
+        last = max(self.tasks, key=lambda task: finish[id(task)])
+        path = [last]
+        while previous[id(path[-1])] is not None:
+            path.append(previous[id(path[-1])])
+        return path[::-1], finish[id(last)]
+
+    def report(self) -> str:
+        """每个任务的起止时间，以及总耗时、顺序执行耗时与关键路径耗时的对比。"""
+        lines = [f"{'start (s)':>10}{'end (s)':>10}{'time (s)':>10}  task"]
+        for task in sorted(self.tasks, key=lambda t: self.timings[id(t)][0]):
+            start, end = self.timings[id(task)]
+            lines.append(f"{start - self._origin:>10.1f}{end - self._origin:>10.1f}{end - start:>10.1f}  "
+                         f"[{task.agent.role}] {task.description[:40]}")
+        sequential = sum(end - start for start, end in self.timings.values())
+        path, path_time = self.critical_path()
+        lines.append("")
+        lines.append(f"wall time: {self.wall_time:.1f}s, sequential sum: {sequential:.1f}s "
+                     f"(speed-up {sequential / self.wall_time:.2f}x)")
+        lines.append(f"critical path: {path_time:.1f}s = "
+                     + " -> ".join(f"{task.description[:16]}" for task in path))
+        if self.compactor is not None:
+            stats = self.compactor.stats()
+            lines.append(f"context compaction: {stats['tokens_in']} -> {stats['tokens_out']} tokens "
+                         f"(saved {stats['tokens_saved']}, {stats['saved_ratio']:.0%}; "
+                         f"{stats['duplicates_removed']} duplicate items removed)")
+        return "\n".join(lines)
@@ -0,0 +1,273 @@
+"""
+带持久缓存和请求去重的搜索工具。
+
+研究员每次调用 `DuckDuckGoSearchRun` 都是一次完整的网络往返：同一次运行里重复或几乎相同的查询
+（大小写、空白、标点不同）会各搜一遍，下一次运行还要再搜一遍，搜索延迟因此占了团队总耗时的很大一部分。
+`CachedSearch` 包装一个搜索后端，提供：
+
+1.  **持久缓存**：结果按 (后端名, 规范化后的查询) 存入 SQLite，`ttl_seconds` 内跨运行复用；
+    新闻类查询时效性强，过期条目不会返回，下次查询时覆盖；
+2.  **在途去重**：多个 Agent 并行（见 dag_executor.py）发起相同查询时，只有第一个真正访问后端，
+    其余等待同一个 Future 的结果；
+3.  **可替换的后端**：`DuckDuckGoBackend` 访问网络；`LocalDocumentIndex` 在本地保存的文档上做
+    BM25 检索，用于离线、可复现的运行。
+
+后端只需提供 `name` 属性和 `search(query) -> str` 方法。
+
+用法：
+    search = CachedSearch(LocalDocumentIndex("./docs"), cache_path="search_cache.db")
+    agent = Agent(..., tools=[search.as_tool()])
+"""
+
+import glob
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import Future
+
+from langchain_core.tools import Tool
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_results (
+    backend TEXT NOT NULL,
+    query TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (backend, query)
+);
+"""
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+
+def normalize_query(query: str) -> str:
+    """全角转半角、统一小写、合并空白并去掉首尾标点，让几乎相同的查询落到同一个缓存键上。"""
+    query = unicodedata.normalize("NFKC", query).casefold()
+    query = " ".join(query.split())
+    return query.strip(" \t\"'`.,;:!?。，；：！？、“”‘’")
+
+
+def tokenize(text: str) -> list:
+    """英文和数字按词切分，中文按相邻二字切分（单字词保留单字）。"""
+    tokens = []
+    for match in _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).casefold()):
+        if match.isascii():
+            tokens.append(match)
+        elif len(match) == 1:
+            tokens.append(match)
+        else:
+            tokens.extend(match[i:i + 2] for i in range(len(match) - 1))
+    return tokens
+
+
+# --- 后端 ---
+
+class DuckDuckGoBackend:
+    """通过 `DuckDuckGoSearchRun` 访问网络的搜索后端。"""
+
+    name = "duckduckgo"
+
+    def __init__(self):
+        from langchain_community.tools import DuckDuckGoSearchRun
+
+        self._tool = DuckDuckGoSearchRun()
+
+    def search(self, query: str) -> str:
+        return self._tool.run(query)
+
+
+class LocalDocumentIndex:
+    """
+    在本地文档目录上做 BM25 检索的离线搜索后端。
+
+    支持的文件：
+    - `.txt` / `.md`：第一行作为标题，全文作为正文；
+    - `.jsonl`：每行一个 {"title", "url", "content"}（也接受 "link"、"snippet"、"body"），
+      例如之前保存下来的网页搜索结果。
+
+    Args:
+        directory (str): 文档目录（递归读取）。
+        top_k (int, optional): 每次返回的文档数。默认 5。
+        snippet_chars (int, optional): 每条结果的摘要长度。默认 200。
+    """
+
+    def __init__(self, directory: str, top_k: int = 5, snippet_chars: int = 200, k1: float = 1.5, b: float = 0.75):
+        self.directory = directory
+        self.name = f"local:{os.path.abspath(directory)}"
+        self.top_k = top_k
+        self.snippet_chars = snippet_chars
+        self.k1 = k1
+        self.b = b
+        self.documents = self._load(directory)
+        if not self.documents:
+            raise ValueError(f"No .txt, .md or .jsonl documents found under {directory}")
+
+        self._term_freqs = [Counter(tokenize(doc["title"] + "\n" + doc["content"])) for doc in self.documents]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = sum(self._lengths) / len(self._lengths)
+        doc_freqs = Counter(term for tf in self._term_freqs for term in tf)
+        n = len(self.documents)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    @staticmethod
+    def _load(directory: str) -> list:
+        documents = []
+        for path in sorted(glob.glob(os.path.join(directory, "**", "*"), recursive=True)):
+            extension = os.path.splitext(path)[1].lower()
+            if extension in (".txt", ".md"):
+                with open(path, encoding="utf-8") as f:
+                    content = f.read()
+                title = content.strip().splitlines()[0].lstrip("# ") if content.strip() else os.path.basename(path)
+                documents.append({"title": title, "url": path, "content": content})
+            elif extension == ".jsonl":
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        record = json.loads(line)
+                        documents.append({
+                            "title": record.get("title", ""),
+                            "url": record.get("url") or record.get("link") or path,
+                            "content": record.get("content") or record.get("snippet") or record.get("body") or "",
+                        })
+        return documents
+
+    def _score(self, query_terms: list, index: int) -> float:
+        tf = self._term_freqs[index]
+        norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / self._avg_length)
+        return sum(
+            self._idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+            for term in query_terms if term in tf
+        )
+
+    def _snippet(self, content: str, query_terms: list) -> str:
+        """截取第一个命中词附近的一段文字。"""
+        lowered = content.casefold()
+        positions = [lowered.find(term) for term in query_terms if term in lowered]
+        start = max(min(positions) - self.snippet_chars // 4, 0) if positions else 0
+        snippet = " ".join(content[start:start + self.snippet_chars].split())
+        return ("…" if start > 0 else "") + snippet
+
+    def search(self, query: str) -> str:
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        scored = [(self._score(query_terms, i), i) for i in range(len(self.documents))]
+        ranked = sorted((item for item in scored if item[0] > 0), reverse=True)[:self.top_k]
+        if not ranked:
+            return "没有找到相关结果。"
+        results = []
+        for rank, (_, index) in enumerate(ranked, 1):
+            doc = self.documents[index]
+            results.append(f"[{rank}] {doc['title']}\n{self._snippet(doc['content'], query_terms)}\n来源: {doc['url']}")
+        return "\n\n".join(results)
+
+
+# --- 缓存 ---
+
+class CachedSearch:
+    """
+    线程安全的搜索缓存（并行执行时多个 Agent 会同时调用）。
+
+    Args:
+        backend: 搜索后端，需提供 `name` 和 `search(query)`。
+        cache_path (str, optional): SQLite 缓存文件；为 None 时只在内存中去重，不做持久缓存。
+        ttl_seconds (float, optional): 缓存有效期（秒）。默认 6 小时。
+    """
+
+    def __init__(self, backend, cache_path: str = "search_cache.db", ttl_seconds: float = 6 * 3600):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._conn = None
+        if cache_path is not None:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._inflight = {}  # 规范化查询 -> Future
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "backend_seconds": 0.0}
+
+    def _cached(self, key: str):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT result, created_at FROM search_results WHERE backend = ? AND query = ?",
+            (self.backend.name, key),
+        ).fetchone()
+        if row is None or row[1] + self.ttl_seconds < time.time():
+            return None
+        return row[0]
+
+    def _store(self, key: str, result: str):
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?)",
+            (self.backend.name, key, result, time.time()),
+        )
+
+    def search(self, query: str) -> str:
+        """返回查询结果：命中缓存直接返回，已有相同查询在途则等待它的结果。"""
+        key = normalize_query(query)
+        with self._lock:
+            result = self._cached(key)
+            if result is not None:
+                self._stats["hits"] += 1
+                return result
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self._stats["misses"] += 1
+                future = self._inflight[key] = Future()
+            else:
+                self._stats["coalesced"] += 1
+        if not owner:
+            return future.result()
+
+        start = time.perf_counter()
+        try:
+            result = self.backend.search(query)
+        except Exception as e:
+            # 失败的查询不写缓存，下次重新搜索
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._stats["backend_seconds"] += time.perf_counter() - start
+            self._store(key, result)
+            self._inflight.pop(key, None)
+        future.set_result(result)
+        return result
+
+    def clear(self, expired_only: bool = True) -> int:
+        """删除（过期的）缓存条目，返回删除的条数。"""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            if expired_only:
+                cursor = self._conn.execute(
+                    "DELETE FROM search_results WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                )
+            else:
+                cursor = self._conn.execute("DELETE FROM search_results")
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+    def as_tool(self) -> Tool:
+        """包装成 LangChain 工具，供 CrewAI Agent 的 `tools=[...]` 使用。"""
+        return Tool(
+            name="search",
+            description="网络搜索工具。输入一个搜索查询，返回相关网页的标题、摘要和链接。",
+            func=self.search,
+        )
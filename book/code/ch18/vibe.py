@@ -1,30 +1,56 @@
+import argparse
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 from crewai import Agent, Task, Crew, Process
-from langchain_community.tools import DuckDuckGoSearchRun
 from langchain_deepseek import ChatDeepSeek
 
+from agent_telemetry import CrewTelemetry, format_summary, load_records, summarize
+from context_compaction import ContextCompactor
+from dag_executor import DagExecutor
+from search_tool import CachedSearch, DuckDuckGoBackend, LocalDocumentIndex
+
 # 加载环境变量
 load_dotenv()
 
 # 1. 定义工具
-search_tool = DuckDuckGoSearchRun()
+# 搜索结果按规范化后的查询缓存在 SQLite 中，并行的相同查询只搜一次。
+# 设置 SEARCH_INDEX_DIR 时改为在本地保存的文档上检索，用于离线、可复现的运行。
+# 缓存默认放在脚本旁边（已被 .gitignore 忽略），不随运行目录散落。
+if os.getenv("SEARCH_INDEX_DIR"):
+  search_backend = LocalDocumentIndex(os.environ["SEARCH_INDEX_DIR"])
+else:
+  search_backend = DuckDuckGoBackend()
+search = CachedSearch(
+  search_backend,
+  cache_path=os.getenv("SEARCH_CACHE_PATH", str(Path(__file__).with_name("search_cache.db"))),
+  ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", 6 * 3600))
+)
+search_tool = search.as_tool()
 
 # 2. 定义团队角色 (Agents)
 # 使用 DeepSeek 模型初始化 LLM
 llm = ChatDeepSeek(model="deepseek-chat")
 
-# 新闻搜集员
-researcher = Agent(
-  role='精通网络搜索的专家',
-  goal='从网络上找到关于AI领域的最新、最重大的新闻',
-  backstory="""你是一名资深的新闻研究员，擅长使用高级搜索指令，
-  快速地从海量信息中筛选出最相关、最权威的新闻来源。""",
-  verbose=True,
-  allow_delegation=False,
-  tools=[search_tool],
-  llm=llm
-)
+# 新闻搜集员：按方向拆成几个互不依赖的子问题，每个子问题由一名独立的研究员负责，
+# 并行模式下它们可以同时搜索（同一个 Agent 不能同时执行两个任务）
+RESEARCH_TOPICS = ['大模型与基础模型', 'AI 芯片与算力', 'AI 应用落地与投融资']
+
+
+def make_researcher(topic):
+  return Agent(
+    role=f'精通网络搜索的专家（{topic}）',
+    goal=f'从网络上找到关于AI领域中“{topic}”方向的最新、最重大的新闻',
+    backstory="""你是一名资深的新闻研究员，擅长使用高级搜索指令，
+    快速地从海量信息中筛选出最相关、最权威的新闻来源。""",
+    verbose=True,
+    allow_delegation=False,
+    tools=[search_tool],
+    llm=llm
+  )
+
+
+researchers = [make_researcher(topic) for topic in RESEARCH_TOPICS]
 
 # 资深分析师
 analyst = Agent(
@@ -49,17 +75,20 @@ writer = Agent(
 )
 
 # 3. 定义任务 (Tasks)
-research_task = Task(
-  description='查找并整理过去24小时内关于AI领域的5条最重要的新闻。',
-  expected_output='一个包含5条新闻标题和链接的列表。',
-  agent=researcher
-)
+research_tasks = [
+  Task(
+    description=f'查找并整理过去24小时内关于AI领域中“{topic}”方向的2条最重要的新闻。',
+    expected_output='一个包含2条新闻标题和链接的列表。',
+    agent=researcher
+  )
+  for topic, researcher in zip(RESEARCH_TOPICS, researchers)
+]
 
 analysis_task = Task(
   description='全面分析提供的新闻内容，总结出至少3个主要的技术趋势，并阐述它们各自的商业价值。',
   expected_output='一份详细的分析报告，包含清晰的趋势判断和商业价值分析。',
   agent=analyst,
-  context=[research_task]
+  context=research_tasks
 )
 
 writing_task = Task(
@@ -71,15 +100,45 @@ writing_task = Task(
 
 # 4. 组建团队与流程
 market_analysis_crew = Crew(
-  agents=[researcher, analyst, writer],
-  tasks=[research_task, analysis_task, writing_task],
+  agents=[*researchers, analyst, writer],
+  tasks=[*research_tasks, analysis_task, writing_task],
   process=Process.sequential,
   verbose=2
 )
 
 # 5. 启动任务
-inputs = {}
-result = market_analysis_crew.kickoff(inputs=inputs)
-print("######################")
-print("市场分析报告最终版:")
-print(result)
\ No newline at end of file
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="AI 市场分析团队")
+  parser.add_argument("--parallel", action="store_true",
+                      help="按任务的 context 依赖并行执行（各方向的研究同时进行），并打印关键路径报告")
+  parser.add_argument("--context-budget", type=int, default=0,
+                      help="把传给下游任务的上下文去重、压缩到这么多 token 以内（0 表示不压缩）")
+  parser.add_argument("--telemetry", default=None,
+                      help="把每个 Agent 每一步的 LLM 调用、token 与工具耗时写入这个 JSONL 文件")
+  args = parser.parse_args()
+
+  if args.telemetry:
+    telemetry = CrewTelemetry(args.telemetry)
+    for agent in market_analysis_crew.agents:
+      telemetry.attach(agent)
+
+  inputs = {}
+  use_executor = args.parallel or args.context_budget > 0
+  if use_executor:
+    compactor = ContextCompactor(args.context_budget) if args.context_budget > 0 else None
+    # 只压缩上下文、不并行时，按依赖顺序逐个执行
+    executor = DagExecutor(market_analysis_crew, max_workers=None if args.parallel else 1, compactor=compactor)
+    result = executor.kickoff(inputs=inputs)
+  else:
+    result = market_analysis_crew.kickoff(inputs=inputs)
+  print("######################")
+  print("市场分析报告最终版:")
+  print(result)
+  print(f"搜索缓存: {search.stats()}")
+  if use_executor:
+    print("######################")
+    print(executor.report())
+  if args.telemetry:
+    telemetry.close()
+    print("######################")
+    print(format_summary(summarize(load_records(args.telemetry, telemetry.run_id))))
@@ -0,0 +1,293 @@
+"""
+Shared, CPU-friendly model loading for the Qwen3 scripts (ch14, ch16).
+
+Options on top of a plain `AutoModelForCausalLM.from_pretrained`:
+
+1.  **dtype="best"**: bfloat16 on CUDA and on CPUs with native bf16 support
+    (AVX512-BF16 / AMX / Arm BF16), float32 everywhere else.
+2.  **quantize="int8"**: dynamic int8 quantization of every `nn.Linear` layer
+    (weights stored as int8, activations quantized on the fly). CPU only.
+3.  **mmap=True**: the safetensors checkpoint is memory-mapped and its tensors
+    are used in place instead of being copied into freshly allocated memory.
+    Pages are only read in when touched, and several worker processes that map
+    the same file share one copy of the weights in the OS page cache.
+
+Benchmark the options on this machine (each configuration runs in a fresh
+process so RSS numbers do not leak between runs):
+
+    python model_loading.py --benchmark --model Qwen/Qwen3-0.6B
+"""
+
+import argparse
+import json
+import mmap
+import multiprocessing
+import os
+import platform
+import struct
+import time
+
+import torch
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+try:
+    from transformers.initialization import no_init_weights
+except ImportError:  # transformers < 5
+    from transformers.modeling_utils import no_init_weights
+
+DEFAULT_MODEL_NAME = "Qwen/Qwen3-0.6B"
+
+_DTYPES = {
+    "float32": torch.float32,
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+}
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def cpu_supports_bf16() -> bool:
+    """Returns True if the host CPU has native bfloat16 arithmetic."""
+    if platform.system() == "Darwin":
+        # Apple M2 and later report FEAT_BF16
+        return os.popen("sysctl -n hw.optional.arm.FEAT_BF16 2>/dev/null").read().strip() == "1"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return False
+    return bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+
+
+def resolve_dtype(dtype, device: str):
+    """Maps a dtype option ("auto", "best", "float32", ...) to what from_pretrained expects."""
+    if isinstance(dtype, torch.dtype) or dtype == "auto":
+        return dtype
+    if dtype == "best":
+        if device == "cuda" or (device == "cpu" and cpu_supports_bf16()):
+            return torch.bfloat16
+        return torch.float32
+    return _DTYPES[dtype]
+
+
+def default_device() -> str:
+    """Picks the best available device: MPS (Apple Silicon), then CUDA, then CPU."""
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _checkpoint_files(model_name: str) -> list:
+    """Returns the local paths of a model's safetensors shards, downloading them if needed."""
+    from transformers.utils import cached_file
+
+    index_file = cached_file(model_name, "model.safetensors.index.json", _raise_exceptions_for_missing_entries=False)
+    if index_file is None:
+        return [cached_file(model_name, "model.safetensors")]
+    with open(index_file) as f:
+        shards = sorted(set(json.load(f)["weight_map"].values()))
+    return [cached_file(model_name, shard) for shard in shards]
+
+
+def mmap_safetensors(path: str) -> dict:
+    """
+    Memory-maps a safetensors file and returns its tensors without copying them.
+
+    The mapping is copy-on-write (private), so the tensors are writable, but
+    pages are shared with every other process mapping the same file until one
+    of them actually writes to a page.
+    """
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_len
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        begin, end = info["data_offsets"]
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        count = (end - begin) // torch.empty((), dtype=dtype).element_size()
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + begin).view(info["shape"])
+    return tensors
+
+
+def _load_mmap(model_name: str, dtype, trust_remote_code: bool):
+    """Builds the model skeleton without initialising weights, then points it at the mapped tensors."""
+    config = AutoConfig.from_pretrained(model_name, trust_remote_code=trust_remote_code)
+    state_dict = {}
+    for path in _checkpoint_files(model_name):
+        state_dict.update(mmap_safetensors(path))
+
+    checkpoint_dtype = next(t.dtype for t in state_dict.values() if t.is_floating_point())
+    if dtype not in ("auto", checkpoint_dtype):
+        # A dtype conversion would copy every tensor anyway, so mapping buys nothing
+        raise ValueError(
+            f"mmap loading needs the checkpoint dtype ({checkpoint_dtype}), got {dtype}; "
+            f"use dtype='auto' or drop mmap."
+        )
+
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(
+            config, dtype=checkpoint_dtype, trust_remote_code=trust_remote_code
+        )
+    missing, unexpected = model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    # Tied weights (lm_head -> embed_tokens) are absent from the checkpoint but now share a loaded tensor
+    loaded = {t.data_ptr() for t in state_dict.values()}
+    still_missing = [k for k in missing if model.get_parameter(k).data_ptr() not in loaded]
+    if still_missing or unexpected:
+        raise ValueError(f"Checkpoint does not match the model: missing={still_missing}, unexpected={unexpected}")
+    return model
+
+
+def load_causal_lm(model_name: str = DEFAULT_MODEL_NAME, device: str = None, dtype="auto",
+                   quantize: str = None, mmap: bool = False, trust_remote_code: bool = False):
+    """
+    Loads a causal language model with optional CPU memory savings.
+
+    Args:
+        model_name (str, optional): Hugging Face model id or local path. Defaults to DEFAULT_MODEL_NAME.
+        device (str, optional): "cpu", "cuda" or "mps". Defaults to `default_device()`.
+        dtype (str | torch.dtype, optional): "auto" (checkpoint dtype), "best", "float32",
+            "bfloat16", "float16" or a torch.dtype; with mmap, "best" means "auto". Defaults to "auto".
+        quantize (str, optional): "int8" for dynamic int8 Linear-layer quantization (CPU only). Defaults to None.
+        mmap (bool, optional): Memory-map the safetensors checkpoint instead of copying it (CPU only).
+            Defaults to False.
+        trust_remote_code (bool, optional): Forwarded to transformers. Defaults to False.
+
+    Returns:
+        The model in eval mode.
+    """
+    device = device or default_device()
+    if mmap and dtype == "best":
+        # Mapping only pays off in the checkpoint dtype, so "best" defers to it
+        dtype = "auto"
+    dtype = resolve_dtype(dtype, device)
+    if (quantize or mmap) and device != "cpu":
+        raise ValueError("quantize and mmap are CPU-only options")
+
+    if quantize == "int8":
+        # Dynamic quantization works from float32 weights
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, dtype=torch.float32, trust_remote_code=trust_remote_code, low_cpu_mem_usage=True
+        )
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif quantize is not None:
+        raise ValueError(f"Unsupported quantization '{quantize}', expected 'int8'")
+    elif mmap:
+        model = _load_mmap(model_name, dtype, trust_remote_code)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, dtype=dtype, trust_remote_code=trust_remote_code, low_cpu_mem_usage=True
+        ).to(device)
+    return model.eval()
+
+
+def load_tokenizer(model_name: str = DEFAULT_MODEL_NAME, trust_remote_code: bool = False):
+    """Loads the tokenizer, falling back to EOS as the padding token."""
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=trust_remote_code)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+# --- Benchmark ---
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MiB."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def _benchmark_one(model_name: str, options: dict, new_tokens: int, result_queue):
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    model = load_causal_lm(model_name, device="cpu", **options)
+    load_time = time.perf_counter() - start
+    rss_loaded = current_rss_mb()
+
+    tokenizer = load_tokenizer(model_name)
+    input_ids = tokenizer("机器学习系统架构师需要掌握哪些基础知识？", return_tensors="pt").input_ids
+    with torch.no_grad():
+        model.generate(input_ids, max_new_tokens=4, do_sample=False)  # warm-up
+        start = time.perf_counter()
+        output = model.generate(input_ids, max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False)
+        elapsed = time.perf_counter() - start
+    produced = output.shape[-1] - input_ids.shape[-1]
+    result_queue.put({
+        "load_sec": load_time,
+        "rss_mb": rss_loaded - rss_before,
+        "peak_rss_mb": current_rss_mb() - rss_before,
+        "tokens_per_sec": produced / elapsed,
+    })
+
+
+def benchmark(model_name: str, new_tokens: int = 32) -> list:
+    """Loads the model under every option set in a fresh process and measures load time, RSS and tokens/sec."""
+    configs = [
+        ("float32", {"dtype": "float32"}),
+        ("auto (checkpoint dtype)", {"dtype": "auto"}),
+        ("best", {"dtype": "best"}),
+        ("mmap", {"dtype": "auto", "mmap": True}),
+        ("int8 dynamic", {"quantize": "int8"}),
+    ]
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for label, options in configs:
+        result_queue = ctx.Queue()
+        proc = ctx.Process(target=_benchmark_one, args=(model_name, options, new_tokens, result_queue))
+        proc.start()
+        proc.join()
+        row = result_queue.get() if proc.exitcode == 0 else {"error": f"exit code {proc.exitcode}"}
+        row["config"] = label
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU loading options for a causal LM.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--benchmark", action="store_true", help="Run the load-time / RSS / tokens-per-sec comparison.")
+    parser.add_argument("--new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        return
+
+    print(f"CPU native bf16: {cpu_supports_bf16()}")
+    print(f"{'config':<26}{'load (s)':>10}{'RSS (MiB)':>12}{'peak (MiB)':>12}{'tok/s':>10}")
+    for row in benchmark(args.model, args.new_tokens):
+        if "error" in row:
+            print(f"{row['config']:<26}  failed: {row['error']}")
+            continue
+        print(f"{row['config']:<26}{row['load_sec']:>10.2f}{row['rss_mb']:>12.0f}"
+              f"{row['peak_rss_mb']:>12.0f}{row['tokens_per_sec']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
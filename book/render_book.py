@@ -0,0 +1,344 @@
+"""
+Incremental render of the Quarto book configured in book/_quarto.yml.
+
+`quarto render` re-renders every chapter and re-executes every `{python}` cell,
+although most renders change a few pages of prose and no code at all. This
+script renders only the documents that changed and executes code only when a
+cell changed:
+
+- Each document gets two fingerprints: one of its whole source, and an
+  execution fingerprint built from a hash per executable cell (its code and
+  `#|` options), the files the cells read (string literals that name an
+  existing file relative to the document, and modules imported from the
+  document's directory) and the versions of the packages they import. Cells
+  with `#| eval: false` are ignored.
+- A document whose source is unchanged and whose HTML exists is skipped.
+- A document whose prose changed but whose execution fingerprint did not is
+  rendered with `--use-freezer`: Quarto takes the cell outputs from `_freeze/`
+  (written because `_quarto.yml` sets `execute: freeze: auto`) and starts no
+  kernel. Otherwise it is rendered with `--execute`, which refreshes `_freeze/`.
+- Stale documents render one `quarto render <document>` at a time, in reading
+  order. Documents of one project share `.quarto/`, `_freeze/`, `site_libs/`
+  and `_output/search.json`, which Quarto does not lock, so concurrent renders
+  can corrupt each other; the time saved comes from skipping work instead.
+  Each render is timed on its own and the totals are reported per chapter
+  directory.
+
+Incremental renders do not rebuild the navigation of untouched pages, so a
+change to `_quarto.yml`, a missing `_output/index.html` or `--full` falls back
+to one full project render, which still reuses `_freeze/` for unchanged files.
+Quarto's freezer only notices changes to the `.qmd` itself, so the documents
+whose execution fingerprint changed for another reason (a data file, a sibling
+module, a package version), and every selected document under `--force`, are
+then re-executed one by one as above.
+
+Usage:
+    python book/render_book.py              # render what changed
+    python book/render_book.py --list       # show what would be rendered and why
+    python book/render_book.py ch05 --force # re-execute every document matching "ch05"
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import yaml
+
+from build_assets import file_digest, imported_names, package_versions
+
+BOOK_DIR = Path(__file__).resolve().parent
+CONFIG_PATH = BOOK_DIR / "_quarto.yml"
+OUTPUT_DIR = BOOK_DIR / "_output"
+FREEZE_DIR = BOOK_DIR / "_freeze"
+MANIFEST_PATH = BOOK_DIR / ".render_manifest.json"
+
+# Files besides _quarto.yml that change every page
+CONFIG_GLOBS = ["assets/*.scss"]
+
+_CELL_RE = re.compile(r"^```+\s*\{python[^}]*\}[ \t]*\n(.*?)^```+[ \t]*$", re.MULTILINE | re.DOTALL)
+_OPTION_RE = re.compile(r"^#\|\s*([\w-]+)\s*:\s*(.*?)\s*$")
+
+
+@dataclass
+class Cell:
+    label: str
+    source: str
+    options: dict
+
+
+@dataclass
+class Document:
+    path: Path
+    cells: list[Cell] = field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        return self.path.relative_to(BOOK_DIR).as_posix()
+
+    @property
+    def chapter(self) -> str:
+        parts = self.path.relative_to(BOOK_DIR).parts
+        return parts[0] if len(parts) > 1 else "."
+
+    @property
+    def output(self) -> Path:
+        return OUTPUT_DIR / self.path.relative_to(BOOK_DIR).with_suffix(".html")
+
+    @property
+    def freeze_results(self) -> Path:
+        return FREEZE_DIR / self.path.relative_to(BOOK_DIR).with_suffix("") / "execute-results" / "html.json"
+
+
+def book_documents(config_path: Path = CONFIG_PATH) -> list[Document]:
+    """The documents listed under book.chapters, in reading order."""
+    config = yaml.safe_load(config_path.read_text(encoding="utf-8"))
+    paths = []
+
+    def walk(entries):
+        for entry in entries:
+            if isinstance(entry, str):
+                paths.append(entry)
+            elif isinstance(entry, dict):
+                if isinstance(entry.get("part"), str) and entry["part"].endswith(".qmd"):
+                    paths.append(entry["part"])
+                walk(entry.get("chapters", []))
+
+    walk(config["book"]["chapters"])
+    return [Document(BOOK_DIR / p, cells=parse_cells(BOOK_DIR / p)) for p in paths]
+
+
+def parse_cells(path: Path) -> list[Cell]:
+    """Executable `{python}` cells of a document; cells with `eval: false` are left out."""
+    cells = []
+    for index, match in enumerate(_CELL_RE.finditer(path.read_text(encoding="utf-8")), start=1):
+        options, code = {}, []
+        for line in match.group(1).splitlines():
+            option = _OPTION_RE.match(line)
+            if option and not code:
+                options[option.group(1)] = option.group(2)
+            else:
+                code.append(line)
+        if options.get("eval", "true").lower() == "false":
+            continue
+        cells.append(Cell(options.get("label", f"cell-{index}"), "\n".join(code), options))
+    return cells
+
+
+# --- Fingerprints ---
+
+def _parse_cell(source: str) -> ast.AST | None:
+    # IPython magics and shell escapes are not Python syntax
+    lines = ["" if line.lstrip().startswith(("%", "!")) else line for line in source.splitlines()]
+    try:
+        return ast.parse("\n".join(lines))
+    except SyntaxError:
+        return None
+
+
+def cell_inputs(document: Document, tree: ast.AST) -> list[Path]:
+    """Files a cell depends on: existing paths named by string literals and sibling modules it imports."""
+    directory = document.path.parent
+    found = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and 0 < len(node.value) < 256 \
+                and "\n" not in node.value:
+            candidate = directory / node.value
+            try:
+                if candidate.is_file():
+                    found.add(candidate.resolve())
+            except OSError:
+                pass
+    for name in imported_names(tree):
+        module = directory / f"{name}.py"
+        if module.is_file():
+            found.add(module.resolve())
+    return sorted(found)
+
+
+def execution_fingerprint(document: Document, file_cache: dict) -> tuple[str, dict]:
+    """Digest of everything that affects the document's cell outputs, plus a digest per cell."""
+    cells, imports = {}, set()
+    for cell in document.cells:
+        digest = hashlib.sha256()
+        digest.update(json.dumps(cell.options, sort_keys=True).encode())
+        digest.update(cell.source.encode())
+        tree = _parse_cell(cell.source)
+        if tree is not None:
+            imports |= imported_names(tree)
+            for path in cell_inputs(document, tree):
+                digest.update(os.path.relpath(path, BOOK_DIR).encode())
+                digest.update(file_digest(path, file_cache).encode())
+        cells[cell.label] = digest.hexdigest()
+    total = hashlib.sha256(json.dumps(cells).encode())
+    total.update(json.dumps(package_versions(imports)).encode())
+    return total.hexdigest(), cells
+
+
+def config_fingerprint(file_cache: dict) -> str:
+    digest = hashlib.sha256()
+    for path in [CONFIG_PATH, *sorted(p for pattern in CONFIG_GLOBS for p in BOOK_DIR.glob(pattern))]:
+        digest.update(path.relative_to(BOOK_DIR).as_posix().encode())
+        digest.update(file_digest(path, file_cache).encode())
+    return digest.hexdigest()
+
+
+# --- Render ---
+
+def load_manifest() -> dict:
+    if MANIFEST_PATH.exists():
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    return {"config": None, "documents": {}, "files": {}}
+
+
+def save_manifest(manifest: dict):
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def quarto(args: list[str]) -> tuple[bool, float, str]:
+    """Run one quarto command from the book directory; returns (success, seconds, output)."""
+    start = time.time()
+    try:
+        result = subprocess.run(["quarto", *args], cwd=BOOK_DIR, capture_output=True, text=True)
+    except FileNotFoundError:
+        return False, 0.0, "quarto not found on PATH (https://quarto.org/docs/get-started/)"
+    return result.returncode == 0, time.time() - start, result.stdout + result.stderr
+
+
+def document_fingerprints(document: Document, file_cache: dict) -> dict:
+    execution, cells = execution_fingerprint(document, file_cache)
+    return {"source": file_digest(document.path, file_cache), "execution": execution, "cells": cells}
+
+
+def plan_documents(documents, manifest, config_changed, force) -> tuple[list, list]:
+    """Split documents into (jobs, skipped); jobs are (document, action, reason, fingerprints)."""
+    jobs, skipped = [], []
+    for document in documents:
+        fingerprints = document_fingerprints(document, manifest["files"])
+        previous = manifest["documents"].get(document.name)
+
+        if document.cells:
+            if force:
+                reason = "forced"
+            elif not document.freeze_results.exists():
+                reason = "no frozen results"
+            elif previous is None:
+                reason = "never rendered"
+            elif fingerprints["execution"] != previous["execution"]:
+                changed = [label for label, digest in fingerprints["cells"].items()
+                           if previous["cells"].get(label) != digest]
+                reason = f"cells changed: {', '.join(changed)}" if changed else "inputs or packages changed"
+            else:
+                reason = None
+            if reason:
+                jobs.append((document, "execute", reason, fingerprints))
+                continue
+
+        if config_changed:
+            reason = "config changed"
+        elif not document.output.exists():
+            reason = "output missing"
+        elif previous is None or fingerprints["source"] != previous["source"]:
+            reason = "source changed"
+        else:
+            skipped.append(document)
+            continue
+        jobs.append((document, "freezer" if document.cells else "render", reason, fingerprints))
+    return jobs, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the chapters of the book that changed")
+    parser.add_argument("patterns", nargs="*", help="Only consider documents whose path contains one of these")
+    parser.add_argument("--force", action="store_true", help="Re-execute (and render) every selected document")
+    parser.add_argument("--full", action="store_true", help="Run one full project render instead")
+    parser.add_argument("--list", action="store_true", help="Show what would be rendered and why, then exit")
+    args = parser.parse_args()
+
+    manifest = load_manifest()
+    documents = book_documents()
+    config = config_fingerprint(manifest["files"])
+    full = args.full or config != manifest["config"] or not (OUTPUT_DIR / "index.html").exists()
+    selected = [d for d in documents if not args.patterns or any(p in d.name for p in args.patterns)]
+    if full:
+        # The project render executes documents without frozen results or whose source changed since the
+        # last render; the others with stale execution fingerprints are executed afterwards
+        def executed_by_quarto(document, fingerprints):
+            previous = manifest["documents"].get(document.name)
+            return not document.freeze_results.exists() or (
+                previous is not None and fingerprints["source"] != previous["source"])
+
+        stale = {job[0].name: job for job in plan_documents(documents, manifest, False, False)[0]
+                 if job[1] == "execute" and not executed_by_quarto(job[0], job[3])}
+        if args.force:
+            stale.update({job[0].name: job for job in plan_documents(selected, manifest, False, True)[0]
+                          if job[1] == "execute"})
+        jobs, skipped = [stale[d.name] for d in documents if d.name in stale], []
+    else:
+        jobs, skipped = plan_documents(selected, manifest, config != manifest["config"], args.force)
+
+    if args.list:
+        if full:
+            print("full render (config changed, no previous render, or --full), then:")
+        for document, action, reason, _ in jobs:
+            print(f"{action:<12}{document.name} ({reason})")
+        print(f"{len(skipped)} document(s) up to date")
+        return
+
+    build_start = time.time()
+    if full:
+        ok, seconds, log = quarto(["render"])
+        if not ok:
+            print(f"FAILED      full render ({seconds:.1f}s)\n{log.rstrip()}")
+            sys.exit(1)
+        # Documents still to be executed are recorded only once that succeeds
+        for document in documents:
+            if document.name not in stale:
+                manifest["documents"][document.name] = document_fingerprints(document, manifest["files"])
+        manifest["config"] = config
+        save_manifest(manifest)
+        print(f"full render of {len(documents)} documents in {seconds:.1f}s")
+
+    failures = 0
+    timings = defaultdict(lambda: [0.0, 0, 0])
+    for document, action, reason, fingerprints in jobs:
+        flags = {"execute": ["--execute"], "freezer": ["--use-freezer"], "render": []}[action]
+        ok, seconds, log = quarto(["render", document.name, *flags])
+        timing = timings[document.chapter]
+        timing[0] += seconds
+        timing[1] += 1
+        timing[2] += action == "execute"
+        if ok:
+            manifest["documents"][document.name] = fingerprints
+            save_manifest(manifest)
+            print(f"{action:<12}{document.name} ({seconds:.1f}s)")
+        else:
+            failures += 1
+            print(f"FAILED      {document.name} ({seconds:.1f}s)\n{log.rstrip()}")
+
+    if timings:
+        print(f"\n{'chapter':<10}{'docs':>6}{'executed':>10}{'time (s)':>10}")
+        for chapter, (seconds, count, executed) in sorted(timings.items(), key=lambda item: -item[1][0]):
+            print(f"{chapter:<10}{count:>6}{executed:>10}{seconds:>10.1f}")
+    save_manifest(manifest)
+    rendered = sum(count for _, count, _ in timings.values()) - failures
+    print(f"{rendered} rendered, {failures} failed, {len(skipped)} up to date "
+          f"in {time.time() - build_start:.1f}s")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()